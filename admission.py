@@ -0,0 +1,136 @@
+"""Admission control of the participant's write requests"""
+import threading
+import time
+from flask import current_app, g, jsonify, make_response, request, session
+# Custom libraries
+from view.request import Request
+
+
+class Admission:
+    """Limit the number of write requests (POST) served at once by the process. The
+    requests exceeding ADMISSION_MAX_WRITES wait up to ADMISSION_WAIT_SECONDS for a free
+    slot, and at most ADMISSION_QUEUE_SIZE requests wait at once. The requests not admitted
+    are answered "503 Service Unavailable" with a light page asking to retry after
+    ADMISSION_RETRY_SECONDS, instead of piling up on the database lock.
+
+    Registered participants (users in the middle of the study) are admitted first. New
+    registrations can't take the last ADMISSION_RESERVED_WRITES slots and don't get a slot
+    while a registered participant is waiting. Enabled through the flask setting
+    ADMISSION_CONTROL.
+    """
+
+    def __init__(self) -> None:
+        self.__lock = threading.Condition()
+        self.__in_flight = 0
+        # Number of requests waiting for a slot, indexed by priority (participant or not)
+        self.__waiting = {True: 0, False: 0}
+
+    def init_app(self, app):
+        """Register the admission hooks when enabled in the application
+
+        Args:
+            app (Flask): Flask application
+        """
+        app.config.setdefault('ADMISSION_CONTROL', False)
+        app.config.setdefault('ADMISSION_MAX_WRITES', 4)
+        app.config.setdefault('ADMISSION_RESERVED_WRITES', 1)
+        app.config.setdefault('ADMISSION_QUEUE_SIZE', 64)
+        app.config.setdefault('ADMISSION_WAIT_SECONDS', 5)
+        app.config.setdefault('ADMISSION_RETRY_SECONDS', 10)
+        if not app.config['ADMISSION_CONTROL']:
+            return
+
+        app.before_request(self.__before_request)
+        app.teardown_request(self.__teardown_request)
+
+    def acquire(self, participant: bool):
+        """Wait for a free write slot
+
+        Args:
+            participant (bool): True for the registered participants (admitted first)
+
+        Returns:
+            bool: True when the slot was acquired. False when the queue is full or the
+            waiting time is exceeded.
+        """
+        config = current_app.config
+        limit = config['ADMISSION_MAX_WRITES']
+        if not participant:
+            limit = max(limit - config['ADMISSION_RESERVED_WRITES'], 1)
+        deadline = time.monotonic() + config['ADMISSION_WAIT_SECONDS']
+
+        with self.__lock:
+            if self.__admissible(participant, limit):
+                self.__in_flight += 1
+                return True
+            if sum(self.__waiting.values()) >= config['ADMISSION_QUEUE_SIZE']:
+                return False
+
+            self.__waiting[participant] += 1
+            try:
+                while not self.__admissible(participant, limit):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self.__lock.wait(remaining)
+                self.__in_flight += 1
+                return True
+            finally:
+                self.__waiting[participant] -= 1
+
+    def release(self):
+        """Free a write slot"""
+        with self.__lock:
+            self.__in_flight -= 1
+            self.__lock.notify_all()
+
+    def __admissible(self, participant: bool, limit: int):
+        """Verify if a request can take a write slot
+
+        Args:
+            participant (bool): True for the registered participants
+            limit (int): Slots available to the request priority
+
+        Returns:
+            bool: True when the request can be admitted
+        """
+        if self.__in_flight >= limit:
+            return False
+        return participant or self.__waiting[True] == 0
+
+    def __before_request(self):
+        """Admit the write request or answer "503 Service Unavailable" """
+        if request.method != 'POST':
+            return None
+
+        if not self.acquire('user_id' in session):
+            current_app.logger.warning('Write request rejected by the admission control: %s',
+                                       request.path)
+            return self.__busy_response()
+        g.admission = True
+        return None
+
+    def __teardown_request(self, exception=None):
+        """Free the write slot of the request"""
+        if g.pop('admission', False):
+            self.release()
+
+    def __busy_response(self):
+        """Light "please wait" page (or JSON message for the API calls) asking the browser
+        to retry later. A plain message is returned if the page can't be rendered."""
+        retry_after = current_app.config['ADMISSION_RETRY_SECONDS']
+        if request.accept_mimetypes.best == 'application/json':
+            response = jsonify({'retry_after': retry_after})
+            response.status_code = 503
+        else:
+            try:
+                response = Request(current_app, session).render_cacheable_template(
+                    '503.html', status=503)
+            except Exception as render_error:
+                current_app.logger.critical(str(render_error))
+                response = make_response("Service Unavailable", 503)
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+
+admission = Admission()
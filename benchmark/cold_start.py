@@ -0,0 +1,83 @@
+"""Measure the boot time and resident memory of a web worker importing the website
+application, compared with a process also loading the command line libraries
+(setup, validation and export).
+
+Each measure runs in a new python process using `python -X importtime`, so the
+modules already imported by this script don't affect the results.
+
+Usage:
+    python -m benchmark.cold_start --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Modules loaded only by the command line libraries
+HEAVY_MODULES = ['pandas', 'cv2', 'marshmallow', 'migrate']
+
+SCRIPT = """
+import resource, sys
+{imports}
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print('{{}}|{{}}'.format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, ','.join(heavy)))
+"""
+
+
+def measure(imports: str):
+    """Import a group of modules in a new python process
+
+    Args:
+        imports (str): Python import statements
+
+    Returns:
+        float: Import time of the modules (ms)
+        float: Maximum resident memory of the process (MB)
+        str: Heavy modules loaded by the process
+    """
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    script = SCRIPT.format(imports=imports, heavy=HEAVY_MODULES)
+    # The application creates its temporal folder when imported.
+    with tempfile.TemporaryDirectory() as folder:
+        env = {**os.environ, 'PYTHONPATH': root}
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script],
+            cwd=folder, env=env, capture_output=True, text=True, check=True)
+
+    # Sum the cumulative time of the top level imports
+    import_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):
+            import_us += int(cumulative)
+
+    rss_kb, heavy = result.stdout.strip().splitlines()[-1].split('|')
+    return import_us / 1000, int(rss_kb) / 1024, heavy or '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=5, help='Measures per scenario')
+    args = parser.parse_args()
+
+    scenarios = [
+        ('Web worker', 'import website'),
+        ('Web worker + CLI', 'import website\nimport model.setup, model.export, '
+                             'configuration.validation'),
+    ]
+    print("%-20s %15s %10s  %s" % ('Scenario', 'Import (ms)', 'RSS (MB)', 'Heavy modules'))
+    for name, imports in scenarios:
+        measures = [measure(imports) for _ in range(args.runs)]
+        print("%-20s %15.1f %10.1f  %s" % (
+            name,
+            statistics.median(m[0] for m in measures),
+            statistics.median(m[1] for m in measures),
+            measures[-1][2]))
+
+
+if __name__ == '__main__':
+    main()
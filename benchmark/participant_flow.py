@@ -0,0 +1,364 @@
+"""Load test of the participant flow. Many simulated participants register, state their
+item preferences, make a series of rank judgements and rejudge their last comparison
+against a website instance started locally. The latency percentiles and the requests
+per second are reported per endpoint.
+
+The website is set up in its own database under instance/benchmark/, so the regular
+website database isn't modified.
+
+Usage:
+    python -m benchmark.participant_flow --users 50 --judgements 20
+    python -m benchmark.participant_flow --synthetic-items 1000 --synthetic-groups 2
+    python -m benchmark.participant_flow --synthetic-items 300 --synthetic-weights
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import numpy as np
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import build_opener, HTTPCookieProcessor, HTTPRedirectHandler
+from werkzeug.serving import make_server
+# Custom libraries
+from configuration.website import Settings as WS
+from model.schema import WebsiteControl
+from model.setup import Setup
+from website import create_app
+
+# Project root folder. The website configuration locations are relative to it.
+ROOT = os.path.abspath(os.path.dirname(__file__) + '/..')
+BENCHMARK_LOCATION = 'instance/benchmark'
+EXAMPLE_CONFIGURATIONS = [
+    'example/config-equal-item-weights.json',
+    'example/config-custom-item-weights.json'
+]
+
+
+class NoRedirect(HTTPRedirectHandler):
+    """Report redirects as responses, so every request is measured on its own."""
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Participant:
+    """Simulated participant. It keeps its own session cookie and records the latency
+    of every request made to the website."""
+
+    def __init__(self, url: str, stats: dict, lock: threading.Lock) -> None:
+        self.__url = url
+        self.__stats = stats
+        self.__lock = lock
+        self.__opener = build_opener(HTTPCookieProcessor(CookieJar()), NoRedirect())
+
+    def get(self, path: str, label: str = None):
+        return self.__request('GET', path, None, label)
+
+    def post(self, path: str, data: dict, label: str = None):
+        return self.__request('POST', path, urlencode(data, doseq=True).encode(), label)
+
+    def __request(self, method: str, path: str, data, label: str):
+        """Make a request and record its latency
+
+        Returns:
+            int: Response status code
+            str: Response body
+            str: Redirect location | None
+        """
+        label = '{} {}'.format(method, label if label is not None else path)
+        start = time.perf_counter()
+        try:
+            with self.__opener.open(self.__url + path, data=data) as response:
+                status, body, location = response.status, response.read().decode(), None
+        except HTTPError as e:
+            status, body, location = e.code, e.read().decode(), e.headers.get('Location')
+        elapsed = time.perf_counter() - start
+
+        with self.__lock:
+            latencies, errors = self.__stats.setdefault(label, ([], [0]))
+            latencies.append(elapsed)
+            if status >= 400:
+                errors[0] += 1
+
+        return status, body, location
+
+
+def user_fields(conf: dict, group_id: int, render_ethics: bool):
+    """Build the registration form of a participant using the website configuration
+
+    Args:
+        conf (dict): Website configuration
+        group_id (int): Group selected by the participant
+        render_ethics (bool): The ethics agreement is part of the form
+
+    Returns:
+        dict: Registration form fields
+    """
+    fields = {'group_ids': group_id}
+    for f in conf[WS.CONFIGURATION_USER_FIELDS]:
+        type = f[WS.USER_FIELD_TYPE]
+        if type == WS.USER_FIELD_TYPE_INT:
+            value = f[WS.USER_FIELD_MIN_LIMIT]
+        elif type in [WS.USER_FIELD_TYPE_DROPDOWN, WS.USER_FIELD_TYPE_RADIO]:
+            value = f[WS.USER_FIELD_SELECT_OPTION][0]
+        elif type == WS.USER_FIELD_TYPE_EMAIL:
+            value = 'participant@benchmark.test'
+        else:
+            value = 'benchmark'
+        fields[f[WS.USER_FIELD_NAME]] = value
+
+    if render_ethics:
+        fields['accepted_ethics_agreement'] = 1
+    return fields
+
+
+def participate(p: Participant, form: dict, judgements: int, api: bool):
+    """Go through the whole participant flow
+
+    Args:
+        p (Participant): Simulated participant
+        form (dict): Registration form fields
+        judgements (int): Number of rank judgements made
+        api (bool): Use the JSON rank API instead of the rank page form
+    """
+    p.get('/register')
+    p.post('/register', form)
+
+    # State the preference of every item presented.
+    while True:
+        status, body, _ = p.get('/selection/items')
+        match = re.search(r'name="item_id" value="(\d+)"', body)
+        if status != 200 or match is None:
+            break
+        p.post('/selection/items', {'action': 'agree', 'item_id': match.group(1)})
+
+    if api:
+        participate_api(p, judgements)
+        return
+
+    for _ in range(judgements):
+        status, body, _ = p.get('/rank')
+        ids = re.findall(r'name="item_[12]_id" value=(\d+)', body)
+        if status != 200 or len(ids) != 2:
+            return
+        p.post('/rank', {'state': 'confirmed', 'item_1_id': ids[0], 'item_2_id': ids[1],
+                         'selected_item_id': ids[0], 'comparison_id': ''})
+
+    # Rejudge the last comparison
+    _, _, location = p.post('/rank', {'state': 'rejudged'}, label='/rank (rejudge)')
+    if location is None or 'comparison_id=' not in location:
+        return
+    comparison_id = location.split('comparison_id=')[1]
+    _, body, _ = p.get('/rank?comparison_id=' + comparison_id, label='/rank?comparison_id')
+    ids = re.findall(r'name="item_[12]_id" value=(\d+)', body)
+    if len(ids) == 2:
+        p.post('/rank', {'state': 'skipped', 'item_1_id': ids[0], 'item_2_id': ids[1],
+                         'comparison_id': comparison_id}, label='/rank (rejudged)')
+
+
+def participate_api(p: Participant, judgements: int):
+    """Make the rank judgements through the JSON rank API
+
+    Args:
+        p (Participant): Simulated participant
+        judgements (int): Number of rank judgements made
+    """
+    status, body, _ = p.get('/api/rank')
+    for _ in range(judgements):
+        if status != 200:
+            return
+        pair = json.loads(body)
+        status, body, _ = p.post('/api/rank', {
+            'state': 'confirmed',
+            'item_1_id': pair['item_1']['item_id'],
+            'item_2_id': pair['item_2']['item_id'],
+            'selected_item_id': pair['item_1']['item_id']})
+
+    status, body, _ = p.post('/api/rank', {'state': 'rejudged'}, label='/api/rank (rejudge)')
+    if status == 200:
+        pair = json.loads(body)
+        p.post('/api/rank', {
+            'state': 'skipped',
+            'item_1_id': pair['item_1']['item_id'],
+            'item_2_id': pair['item_2']['item_id'],
+            'comparison_id': pair['comparison_id']}, label='/api/rank (rejudged)')
+
+
+def synthetic_configuration(base: dict, groups: int, items: int, weights: bool):
+    """Generate a large website configuration. The item images of the static folder
+    are reused by the synthetic items.
+
+    Args:
+        base (dict): Configuration used as template of the website texts and user fields
+        groups (int): Number of groups
+        items (int): Number of items per group
+        weights (bool): Define custom weights for all items pairs
+
+    Returns:
+        dict: Website configuration
+    """
+    images = sorted(os.listdir(ROOT + '/static/image'))
+    conf = json.loads(json.dumps(base))
+    conf[WS.CONFIGURATION_BEHAVIOR][WS.BEHAVIOR_RENDER_USER_ITEM_PREFERENCE_PAGE] = 'false'
+    conf[WS.CONFIGURATION_COMPARISON] = {
+        WS.GROUP_WEIGHT_CONFIGURATION:
+            WebsiteControl.CUSTOM_WEIGHT if weights else WebsiteControl.EQUAL_WEIGHT,
+        WS.GROUPS: []
+    }
+    for g in range(groups):
+        names = ['item_{}_{}'.format(g, i) for i in range(items)]
+        group = {
+            WS.GROUP_NAME: 'group_{}'.format(g),
+            WS.GROUP_DISPLAY_NAME: 'Group {}'.format(g),
+            WS.GROUP_ITEMS: [{
+                WS.ITEM_NAME: name,
+                WS.ITEM_DISPLAY_NAME: name,
+                WS.ITEM_IMAGE_NAME: images[i % len(images)]
+            } for i, name in enumerate(names)]
+        }
+        if weights:
+            pairs = list(itertools.combinations(names, 2))
+            group[WS.GROUP_ITEMS_WEIGHT] = [
+                {'item_1': i1, 'item_2': i2, 'weight': 1 / len(pairs)} for i1, i2 in pairs]
+        conf[WS.CONFIGURATION_COMPARISON][WS.GROUPS].append(group)
+    return conf
+
+
+def setup(name: str, conf: dict):
+    """Set up a website instance using its own database and configuration file
+
+    Args:
+        name (str): Instance name
+        conf (dict): Website configuration
+
+    Returns:
+        Flask: Website application
+    """
+    location = '{}/{}'.format(BENCHMARK_LOCATION, name)
+    shutil.rmtree(ROOT + '/' + location, ignore_errors=True)
+    os.makedirs(ROOT + '/' + location)
+
+    # Keep the exported files and the database inside the benchmark folder
+    conf[WS.CONFIGURATION_BEHAVIOR][WS.BEHAVIOR_EXPORT_PATH_LOCATION] = location + '/export.xlsx'
+    conf_location = location + '/config.json'
+    with open(ROOT + '/' + conf_location, 'w') as f:
+        json.dump(conf, f)
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///{}/{}/database.db'.format(ROOT, location)
+    })
+    app.logger.setLevel(logging.ERROR)
+    WS.set_configuration_location(app, conf_location)
+    Setup(app).exec()
+    return app
+
+
+def run(app, conf: dict, users: int, judgements: int, api: bool):
+    """Run the simulated participants against a local website server
+
+    Returns:
+        dict: Latencies and errors indexed by endpoint
+        float: Elapsed time in seconds
+    """
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = 'http://127.0.0.1:{}'.format(server.server_port)
+
+    groups = len(conf[WS.CONFIGURATION_COMPARISON][WS.GROUPS])
+    render_ethics = str(conf[WS.CONFIGURATION_BEHAVIOR][
+        WS.BEHAVIOR_RENDER_ETHICS_AGREEMENT_PAGE]).lower() in ['true', '1']
+    stats = {}
+    lock = threading.Lock()
+    participants = [threading.Thread(target=participate, args=(
+        Participant(url, stats, lock),
+        user_fields(conf, u % groups + 1, render_ethics),
+        judgements, api)) for u in range(users)]
+
+    start = time.perf_counter()
+    for p in participants:
+        p.start()
+    for p in participants:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    server.shutdown()
+    return stats, elapsed
+
+
+def report(name: str, stats: dict, elapsed: float):
+    """Print the latency percentiles and throughput per endpoint
+
+    Returns:
+        dict: 95th latency percentile (ms) indexed by endpoint
+    """
+    print('\n{} ({:.1f}s)'.format(name, elapsed))
+    print('%-34s %8s %8s %9s %9s %9s %7s' %
+          ('Endpoint', 'Requests', 'Req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'Errors'))
+    p95 = {}
+    total = 0
+    for label in sorted(stats):
+        latencies, errors = stats[label]
+        ms = np.array(latencies) * 1000
+        p50, p95[label], p99 = np.percentile(ms, [50, 95, 99])
+        total += len(ms)
+        print('%-34s %8d %8.1f %9.1f %9.1f %9.1f %7d' %
+              (label, len(ms), len(ms) / elapsed, p50, p95[label], p99, errors[0]))
+    print('%-34s %8d %8.1f' % ('Total', total, total / elapsed))
+    return p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--config', action='append',
+                        help='Website configuration file. Defaults to the examples.')
+    parser.add_argument('--users', type=int, default=20, help='Concurrent participants')
+    parser.add_argument('--judgements', type=int, default=10,
+                        help='Rank judgements per participant')
+    parser.add_argument('--api', action='store_true', help='Judge through the JSON rank API')
+    parser.add_argument('--synthetic-items', type=int, default=0,
+                        help='Benchmark a synthetic configuration with this number of items '
+                        'per group instead of the configuration files')
+    parser.add_argument('--synthetic-groups', type=int, default=1,
+                        help='Number of groups of the synthetic configuration')
+    parser.add_argument('--synthetic-weights', action='store_true',
+                        help='Define custom weights for all the synthetic items pairs')
+    parser.add_argument('--max-p95', type=float, default=None,
+                        help='Fail when the 95th latency percentile of an endpoint '
+                        'exceeds this value (ms)')
+    args = parser.parse_args()
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    scenarios = []
+    for location in args.config or EXAMPLE_CONFIGURATIONS:
+        with open(ROOT + '/' + location) as f:
+            scenarios.append((os.path.splitext(os.path.basename(location))[0], json.load(f)))
+    if args.synthetic_items > 0:
+        base = scenarios[0][1]
+        scenarios = [('synthetic-{}x{}{}'.format(
+            args.synthetic_groups, args.synthetic_items,
+            '-weights' if args.synthetic_weights else ''), synthetic_configuration(
+            base, args.synthetic_groups, args.synthetic_items, args.synthetic_weights))]
+
+    slow = []
+    for name, conf in scenarios:
+        app = setup(name, conf)
+        stats, elapsed = run(app, conf, args.users, args.judgements, args.api)
+        for label, p95 in report(name, stats, elapsed).items():
+            if args.max_p95 is not None and p95 > args.max_p95:
+                slow.append('{}: {} p95 {:.1f}ms'.format(name, label, p95))
+
+    if len(slow) > 0:
+        print('\nLatency regression detected:\n' + '\n'.join(slow))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
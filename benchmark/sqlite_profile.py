@@ -0,0 +1,93 @@
+"""Measure the judgement throughput of concurrent raters with and without the SQLite
+performance profile (flask setting SQLITE_PRAGMAS).
+
+Each simulated rater reproduces the database work of the rank page: it reads its
+comparison stats and inserts a new comparison committing the transaction.
+
+Usage:
+    python -m benchmark.sqlite_profile --raters 20 --judgements 50
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine, func, select
+# Custom libraries
+from configuration.flask import Settings as FlaskSettings
+from model.connection import db, listen_sqlite_pragmas
+from model.schema import Comparison, Item, User
+
+
+def run(pragmas, raters: int, judgements: int, location: str):
+    """Run the simulated raters against a new database
+
+    Args:
+        pragmas (dict): SQLite pragmas applied to the connections | None
+        raters (int): Number of concurrent raters
+        judgements (int): Number of judgements made by each rater
+        location (str): Database file location
+
+    Returns:
+        float: Judgements saved per second
+        int: Number of judgements that failed due to lock contention
+    """
+    engine = create_engine('sqlite:///' + location)
+    if pragmas:
+        listen_sqlite_pragmas(engine, pragmas)
+
+    tables = [User.__table__, Item.__table__, Comparison.__table__]
+    db.Model.metadata.create_all(engine, tables=tables)
+    with engine.begin() as conn:
+        conn.execute(Item.__table__.insert(), [
+            {'name': 'item_%d' % i, 'display_name': 'Item %d' % i, 'image_path': '%d.png' % i}
+            for i in range(1, 3)])
+        conn.execute(User.__table__.insert(), [{} for _ in range(raters)])
+
+    errors = []
+
+    def rate(user_id):
+        for _ in range(judgements):
+            try:
+                with engine.begin() as conn:
+                    conn.execute(
+                        select(Comparison.state, func.count(Comparison.comparison_id)).
+                        where(Comparison.user_id == user_id).
+                        group_by(Comparison.state)).all()
+                with engine.begin() as conn:
+                    conn.execute(Comparison.__table__.insert().values(
+                        user_id=user_id, item_1_id=1, item_2_id=2,
+                        state=Comparison.SELECTED, selected_item_id=1))
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=rate, args=(u,)) for u in range(1, raters + 1)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    engine.dispose()
+
+    saved = raters * judgements - len(errors)
+    return saved / elapsed, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--raters', type=int, default=20, help='Concurrent raters')
+    parser.add_argument('--judgements', type=int, default=50, help='Judgements per rater')
+    args = parser.parse_args()
+
+    profiles = [('SQLite defaults', None), ('SQLITE_PRAGMAS', FlaskSettings.SQLITE_PRAGMAS)]
+    with tempfile.TemporaryDirectory() as folder:
+        print("%-20s %15s %10s" % ('Profile', 'Judgements/s', 'Errors'))
+        for i, (name, pragmas) in enumerate(profiles):
+            location = os.path.join(folder, 'benchmark_%d.db' % i)
+            throughput, errors = run(pragmas, args.raters, args.judgements, location)
+            print("%-20s %15.1f %10d" % (name, throughput, errors))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,11 +4,14 @@ from flask.cli import with_appcontext
 from flask import current_app
 from sqlalchemy.exc import OperationalError
 # Custom libraries
-from model.setup import Setup as DBSetup
-from model.export import Export
 from configuration.website import Settings as WS
-from configuration.validation import Validation as ConfigValidation
 from model.schema import WebsiteControl
+from view.template import compile_templates
+from view.asset import assets
+
+# The setup, validation and export libraries depend on heavy packages (pandas, OpenCV,
+# marshmallow, sqlalchemy-migrate) not used by the website requests. They are imported
+# by the commands when executed, so the web workers don't load them.
 
 blueprint = Blueprint('commands', __name__, cli_group=None)
 
@@ -24,6 +27,9 @@ def setup(conf):
     Args:
         conf (string): Website configuration location
     """
+    from model.setup import Setup as DBSetup
+    from configuration.validation import Validation as ConfigValidation
+
     # 1. Validate the website configuration
     app = current_app
     app.logger.info("Setting website configuration")
@@ -42,6 +48,9 @@ def setup(conf):
             app.logger.info("Configuring website database")
             s = DBSetup(app)
             s.exec()
+            # Precompile the website templates and build the static assets
+            compile_templates(app)
+            assets.build(app)
         except Exception as e:
             # 2.3 Report the error in any other case.
             app.logger.critical(e)
@@ -58,6 +67,9 @@ def reset(conf):
     Args:
         conf (string): Website configuration location
     """
+    from model.setup import Setup as DBSetup
+    from configuration.validation import Validation as ConfigValidation
+
     app = current_app
     # 1. Validate the website configuration
     app.logger.info("Setting website configuration")
@@ -69,6 +81,45 @@ def reset(conf):
     s = DBSetup(app)
     s.exec()
 
+    # 3. Precompile the website templates and build the static assets
+    compile_templates(app)
+    assets.build(app)
+
+
+@blueprint.cli.command('upgrade')
+@with_appcontext
+def upgrade():
+    """Upgrade the database of a website set up by a previous version of the application,
+    keeping the participant's judgements. The missing tables and columns are created and
+    the judgement statistics are rebuilt. Execute it after installing a new version.
+    """
+    from model.setup import Upgrade
+
+    app = current_app
+    with app.app_context():
+        try:
+            WebsiteControl().get_conf()
+        except OperationalError:
+            app.logger.critical('Application not initialized yet.')
+            exit()
+
+        app.logger.info("Upgrading website database")
+        Upgrade(app).exec()
+
+    # The templates and static assets of the new version
+    compile_templates(app)
+    assets.build(app)
+
+
+@blueprint.cli.command('assets')
+@with_appcontext
+def build_assets():
+    """Build the static assets. The static files are copied with hashed names and
+    precompressed into the assets folder (flask setting ASSETS_LOCATION). Execute it
+    after modifying any static file. The website needs to be restarted afterwards.
+    """
+    assets.build(current_app)
+
 
 @blueprint.cli.command('export')
 @with_appcontext
@@ -77,7 +128,50 @@ def export():
     database table. The file will be saved into the location specified by the flask
     env variable EXPORT_PATH_LOCATION.
     """
+    __export(current_app)
+
+
+@blueprint.cli.command('bootstrap')
+@click.option('--replicates', default=1000, show_default=True,
+              help='Number of bootstrap replicates.')
+@click.option('--by', type=click.Choice(['rater', 'judgement']), default='rater',
+              show_default=True, help='Resample the raters or the individual judgements.')
+@click.option('--confidence', default=0.95, show_default=True, help='Confidence level.')
+@click.option('--processes', default=1, show_default=True,
+              help='Worker processes fitting the replicates.')
+@click.option('--seed', default=0, show_default=True, help='Random seed.')
+@with_appcontext
+def bootstrap(replicates, by, confidence, processes, seed):
+    """Estimate the items Bradley-Terry scores with bootstrap confidence intervals and
+    export them, together with the database, into the sheet item_score_interval of the
+    export file.
+    """
+    import pandas as pd
+    from model.bootstrap import Bootstrap
+
     app = current_app
+    with app.app_context():
+        try:
+            intervals = pd.DataFrame(Bootstrap.intervals(
+                replicates, by, confidence, processes=processes, seed=seed))
+        except OperationalError:
+            app.logger.critical('Application not initialized yet.')
+            exit()
+
+    click.echo(intervals.to_string(index=False))
+    __export(app, {'item_score_interval': intervals})
+
+
+def __export(app, sheets=None):
+    """Export the database and additional sheets into the export file
+
+    Args:
+        app (Flask): Flask application
+        sheets (dict, optional): Additional sheets (DataFrame) indexed by sheet name
+    """
+    from model.export import Export
+    from configuration.validation import Validation as ConfigValidation
+
     location = None
     with app.app_context():
         try:
@@ -98,4 +192,72 @@ def export():
             exit()
 
     app.logger.info("Exporting database tables into {}".format(location))
-    Export(app).save(location)
+    Export(app).save(location, sheets)
+
+
+@blueprint.cli.command('statistics')
+@click.option('--rebuild', is_flag=True, help='Recompute the statistics from every comparison.')
+@with_appcontext
+def statistics(rebuild):
+    """Print the judgement statistics of the items and the consistency statistics of the
+    users (intransitive triads, agreement with the consensus ranking and misfit). The
+    statistics are updated online every time a comparison is saved.
+    """
+    import pandas as pd
+    from model.statistics import Statistics
+
+    app = current_app
+    with app.app_context():
+        try:
+            if rebuild:
+                app.logger.info("Rebuilding the judgement statistics")
+                Statistics.rebuild()
+            users = pd.DataFrame(Statistics.users())
+            items = pd.DataFrame(Statistics.items())
+        except OperationalError:
+            app.logger.critical('Application not initialized yet.')
+            exit()
+
+    click.echo("Users\n{}\n\nItems\n{}".format(
+        users.to_string(index=False), items.to_string(index=False)))
+
+
+@blueprint.cli.command('simulate')
+@click.option('--conf', default=None,
+              help='Website configuration whose groups sizes and custom weights are simulated.')
+@click.option('--items', default=50, show_default=True,
+              help='Number of items of the synthetic group simulated without --conf.')
+@click.option('--strategy', 'strategies', multiple=True,
+              type=click.Choice(['random', 'coverage', 'preferred', 'custom']),
+              help='Selection strategy. Repeat it to compare several. Defaults to random, '
+              'coverage and custom (when the groups have custom weights).')
+@click.option('--raters', default=1000, show_default=True, help='Number of virtual raters.')
+@click.option('--judgements', default=20, show_default=True,
+              help='Number of judgements of every rater.')
+@click.option('--repeats', default=3, show_default=True,
+              help='Simulations averaged for every group and strategy.')
+@click.option('--processes', default=1, show_default=True,
+              help='Worker processes running the simulations.')
+@click.option('--seed', default=0, show_default=True, help='Random seed.')
+@click.option('--known-fraction', default=0.5, show_default=True,
+              help='Probability of a rater knowing an item (preferred strategy).')
+@click.option('--spread', default=1.0, show_default=True,
+              help='Standard deviation of the items latent log strengths.')
+@click.option('--rater-noise', default=0.0, show_default=True,
+              help='Standard deviation of every rater perception of the log strengths.')
+def simulate(conf, items, strategies, raters, judgements, repeats, processes, seed,
+             known_fraction, spread, rater_noise):
+    """Simulate virtual raters judging the items with the rank page selection strategies
+    and report how fast the ranking recovered from their judgements (Bradley-Terry)
+    converges to the latent ranking. It doesn't use the website database.
+    """
+    import pandas as pd
+    from model.simulation import Simulation
+
+    groups = Simulation.groups(conf, items)
+    if len(strategies) == 0:
+        strategies = ['random', 'coverage', 'custom']
+    results = Simulation.compare(
+        groups, list(strategies), raters, judgements, repeats=repeats, processes=processes,
+        seed=seed, known_fraction=known_fraction, spread=spread, rater_noise=rater_noise)
+    click.echo(pd.DataFrame(results).to_string(index=False))
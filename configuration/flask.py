@@ -7,3 +7,84 @@ class Settings(object):
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SESSION_MINUTES_VALIDITY = 240  # Session expire after 4 hours of inactivity
     TEMPORAL_DATA_LOCATION = 'instance/'
+    # SQLite pragmas applied to every new database connection. Set to None to use
+    # the SQLite defaults (rollback journal and synchronous=FULL).
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',  # Readers don't block the writer
+        'synchronous': 'NORMAL',  # WAL mode stays consistent without syncing every commit
+        'busy_timeout': 5000,  # Milliseconds a writer waits for the database lock
+        'cache_size': -20000,  # Page cache size in KiB
+        'mmap_size': 268435456,  # Bytes of the database file read through memory mapping
+    }
+    # Record per endpoint query counts, SQL time, template render time and latency.
+    # The measures are exposed in the Prometheus text format on /metrics.
+    INSTRUMENTATION = False
+    INSTRUMENTATION_PROFILE_RATE = 0  # Fraction of the requests profiled with cProfile
+    INSTRUMENTATION_PROFILE_LOCATION = 'instance/profile/'  # cProfile dumps per endpoint
+    INSTRUMENTATION_PROFILE_MAX_FILES = 100  # cProfile dumps kept per endpoint
+    # Maximum write requests (POST) served at once by every process. The requests above it
+    # wait up to ADMISSION_WAIT_SECONDS in a queue of ADMISSION_QUEUE_SIZE requests, and are
+    # answered "503 Service Unavailable" (Retry-After: ADMISSION_RETRY_SECONDS) afterwards.
+    # The last ADMISSION_RESERVED_WRITES slots are kept for the registered participants.
+    # Size the limit to the threads of every process (see the README).
+    ADMISSION_CONTROL = False
+    ADMISSION_MAX_WRITES = 4
+    ADMISSION_RESERVED_WRITES = 1
+    ADMISSION_QUEUE_SIZE = 64
+    ADMISSION_WAIT_SECONDS = 5
+    ADMISSION_RETRY_SECONDS = 10
+    # Equal weight studies draw the least judged pairs of the least judged group first,
+    # instead of drawing every pair independently at random. The judgements counts are
+    # loaded again from the database every COVERAGE_REFRESH_SECONDS (0 never).
+    COVERAGE_AWARE_SELECTION = False
+    COVERAGE_REFRESH_SECONDS = 60
+    # Custom weight studies draw first the pairs not seen by the user, without replacement.
+    # It changes the configured weights until the user has seen every pair.
+    CUSTOM_WEIGHTS_UNSEEN_FIRST = False
+    # Number of users whose seen pairs are kept in memory
+    SEEN_PAIRS_CACHE_SIZE = 1000
+    # Number of users whose known items (item preference page) are kept in memory
+    KNOWN_ITEMS_CACHE_SIZE = 1000
+    # Number of pairs drawn at once for a user and number of users whose drawn pairs are
+    # kept in memory. Pairs drawn by the coverage aware selection aren't queued.
+    PAIR_QUEUE_SIZE = 50
+    PAIR_QUEUE_CACHE_SIZE = 1000
+    # Save the comparisons, item preferences and their statistics in a database per group
+    # (folder SHARDS_LOCATION), so the groups take writes in parallel. The user's database
+    # is kept in memory for USER_SHARDS_CACHE_SIZE users. Execute the setup after changing it.
+    SHARDS = False
+    SHARDS_LOCATION = 'instance/shards/'
+    USER_SHARDS_CACHE_SIZE = 10000
+    # Number of users whose submitted pair tokens are kept in memory
+    SUBMITTED_PAIRS_CACHE_SIZE = 1000
+    # Number of users whose decisive judgements (triads statistics) are kept in memory
+    DECISIVE_JUDGEMENTS_CACHE_SIZE = 1000
+    # Study seed of the users random pair draws. Defaults to the website setup date.
+    RANDOM_SEED = None
+    # Folder of the custom weights configured as a matrix, stored per group by the setup
+    WEIGHT_MATRIX_LOCATION = 'instance/weights/'
+    # Token of the administration pages (/admin/progress and /metrics). The pages are
+    # disabled when not defined. The progress counters are kept by every process.
+    ADMIN_TOKEN = None
+    PROGRESS_ACTIVE_SECONDS = 300  # Seconds since the last judgement of an active user
+    PROGRESS_STREAM_SECONDS = 2  # Seconds between the progress events sent to the page
+    PROGRESS_STREAM_MAX_SECONDS = 300  # Seconds before the page opens a new stream
+    # Seconds between the verifications of the website setup and configuration file.
+    # 0 verifies them on every request.
+    INTEGRITY_CHECK_SECONDS = 0
+    # Static assets build folder (hashed and precompressed copies of the static files)
+    ASSETS_LOCATION = 'instance/assets/'
+    STATIC_MAX_AGE = 3600  # Browser cache seconds of the static files not hashed
+    # Compress the HTML and JSON responses (gzip) bigger than COMPRESS_MIN_SIZE bytes
+    COMPRESS_RESPONSES = True
+    COMPRESS_MIN_SIZE = 500
+    # Compiled templates shared by every worker process. Set to None to disable it.
+    JINJA_BYTECODE_CACHE_LOCATION = 'instance/jinja/'
+    # Load the configuration, items, groups and templates when the application is created,
+    # so pre-forked workers share them and serve the first request at steady-state latency.
+    WARMUP = True
+    # Queue the participant's judgements and save them in batches by a background worker.
+    # Requires the website to be served by a single process.
+    WRITE_BEHIND = False
+    WRITE_BEHIND_BATCH_SIZE = 100  # Maximum number of objects saved per transaction
+    WRITE_BEHIND_FLUSH_SECONDS = 1  # Maximum time a judgement waits in the queue
@@ -7,6 +7,7 @@ import itertools
 
 # Custom libraries
 from model.schema import WebsiteControl
+from model.weight_matrix import WeightMatrix
 from configuration.website import Settings as WS
 
 
@@ -63,6 +64,9 @@ class Group(Schema):
                         validate=[validate.Length(min=1, max=1000)])
     weight = fields.List(fields.Nested(Weight()), required=False,
                          validate=[validate.Length(min=1, max=499500)])
+    # Alternative to the weight list: dense matrix file (.npy or .csv) whose upper triangle
+    # holds the weight of every pair of items, in the items order.
+    weightMatrix = fields.Str(required=False, validate=[validate.Length(min=1, max=500)])
 
     @validates('items')
     def _validate_unique_names(self, items):
@@ -86,6 +90,20 @@ class Group(Schema):
 
     @post_load
     def _post_load_validation(self, data, **kwargs):
+        if 'weight' in data and 'weightMatrix' in data:
+            raise ValidationError("Define the custom weights either as a weight list or as "
+                                  "a weight matrix, but not both.")
+
+        if 'weightMatrix' in data:
+            try:
+                matrix = WeightMatrix.read(data['weightMatrix'])
+            except Exception as e:
+                raise ValidationError(f"Weight matrix {data['weightMatrix']} can't be read. {e}")
+            error = WeightMatrix.validate_matrix(matrix, len(data['items']))
+            if error is not None:
+                raise ValidationError(error)
+            return data
+
         if 'weight' not in data:
             return data
 
@@ -129,7 +147,8 @@ class ComparisonConfiguration(Schema):
     def _post_load_validation(self, data, **kwargs):
         weight_conf = data['weightConfiguration']
         groups = data['groups']
-        item_weight_conf = sum([1 if "weight" in g else 0 for g in groups])
+        item_weight_conf = sum([1 if "weight" in g or "weightMatrix" in g else 0
+                                for g in groups])
 
         if item_weight_conf != 0 and weight_conf == WebsiteControl.EQUAL_WEIGHT:
             raise ValidationError("Custom weight configuration is not allowed when "
@@ -27,6 +27,7 @@ class Settings:
     GROUP_DISPLAY_NAME = 'displayName'
     GROUP_ITEMS = 'items'
     GROUP_ITEMS_WEIGHT = 'weight'
+    GROUP_ITEMS_WEIGHT_MATRIX = 'weightMatrix'
     # Items related configuration keys
     ITEM_NAME = 'name'
     ITEM_GROUP_ID = 'group_id'
@@ -80,6 +81,9 @@ class Settings:
             app (Flask ap): Website main application
             loc (string): Path location of the configuration file
         """
+        # Drop the loaded configuration when the website is pointed to a different file.
+        if app.config.get(cls.CONFIGURATION_LOCATION) != loc:
+            cls.configuration = None
         app.config[cls.CONFIGURATION_LOCATION] = loc
 
     @classmethod
@@ -0,0 +1,25 @@
+"""Gunicorn settings of the website (gunicorn website:app). Gunicorn is an optional
+dependency, listed in requirements.txt."""
+import gc
+
+# Create the application (and warm it up, flask setting WARMUP) before forking the
+# workers, so they share its memory.
+preload_app = True
+
+
+def on_starting(server):
+    """Start a single worker when the write-behind queue is enabled (flask setting
+    WRITE_BEHIND). The queue lives in the process memory, so the judgements queued by a
+    worker aren't visible to the other ones."""
+    app = server.app.wsgi()
+    if app.config.get('WRITE_BEHIND') and server.num_workers > 1:
+        server.log.error("WRITE_BEHIND requires a single worker process. Starting 1 worker "
+                         "instead of %s." % server.num_workers)
+        server.num_workers = 1
+
+
+def when_ready(server):
+    """Move the objects loaded by the warmup to the permanent generation before forking
+    the workers, so the garbage collector of the workers doesn't touch (and copy) their
+    memory pages."""
+    gc.freeze()
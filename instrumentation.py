@@ -0,0 +1,190 @@
+"""Opt-in per request instrumentation of the website"""
+import cProfile
+import os
+import random
+import threading
+import time
+from flask import Response, abort, current_app, g, has_request_context, request, session
+from jinja2 import Template
+from sqlalchemy import event
+# Custom libraries
+from model.connection import db
+from view.request import Request
+
+
+class TimedTemplate(Template):
+    """Jinja template recording the time spent rendering it in the current request"""
+
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            if has_request_context() and 'instrumentation' in g:
+                g.instrumentation['template_seconds'] += time.perf_counter() - start
+
+
+class Instrumentation:
+    """Record the number of queries, the SQL time, the template rendering time and the total
+    latency of every request, aggregated by endpoint. The results are exposed in the
+    Prometheus text format on /metrics, to the requests carrying the administration token
+    (flask setting ADMIN_TOKEN) as a bearer authorization header. A sample of the requests
+    can be profiled with cProfile and dumped per endpoint, keeping the latest
+    INSTRUMENTATION_PROFILE_MAX_FILES. Enabled through the flask setting INSTRUMENTATION.
+    """
+    # Latency histogram buckets (seconds)
+    BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__metrics = {}
+        self.__profile_location = None
+
+    def init_app(self, app):
+        """Register the instrumentation hooks when enabled in the application
+
+        Args:
+            app (Flask): Flask application
+        """
+        app.config.setdefault('INSTRUMENTATION', False)
+        app.config.setdefault('INSTRUMENTATION_PROFILE_RATE', 0)
+        app.config.setdefault('INSTRUMENTATION_PROFILE_LOCATION', 'instance/profile/')
+        app.config.setdefault('INSTRUMENTATION_PROFILE_MAX_FILES', 100)
+        if not app.config['INSTRUMENTATION']:
+            return
+
+        self.__profile_location = os.path.join(
+            os.path.abspath(os.path.dirname(__file__)),
+            app.config['INSTRUMENTATION_PROFILE_LOCATION'])
+
+        app.jinja_env.template_class = TimedTemplate
+        engine = db.get_engine(app)
+        event.listen(engine, 'before_cursor_execute', self.__before_query)
+        event.listen(engine, 'after_cursor_execute', self.__after_query)
+        app.before_request(self.__before_request)
+        app.teardown_request(self.__teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self.__expose)
+
+    def __before_request(self):
+        """Start measuring the request"""
+        g.instrumentation = {
+            'start': time.perf_counter(),
+            'queries': 0,
+            'sql_seconds': 0.0,
+            'template_seconds': 0.0,
+            'profile': None
+        }
+
+        # Profile just a sample of the requests
+        rate = current_app.config['INSTRUMENTATION_PROFILE_RATE']
+        if rate > 0 and random.random() < rate:
+            g.instrumentation['profile'] = cProfile.Profile()
+            g.instrumentation['profile'].enable()
+
+    def __teardown_request(self, exception=None):
+        """Aggregate the request measures by endpoint"""
+        if 'instrumentation' not in g:
+            return
+
+        measures = g.instrumentation
+        latency = time.perf_counter() - measures['start']
+        endpoint = request.endpoint or 'unmatched'
+        if measures['profile'] is not None:
+            measures['profile'].disable()
+            self.__dump_profile(measures['profile'], endpoint)
+
+        with self.__lock:
+            m = self.__metrics.setdefault((endpoint, request.method), {
+                'count': 0,
+                'errors': 0,
+                'seconds': 0.0,
+                'queries': 0,
+                'sql_seconds': 0.0,
+                'template_seconds': 0.0,
+                'buckets': [0] * len(self.BUCKETS)
+            })
+            m['count'] += 1
+            m['errors'] += 1 if exception is not None else 0
+            m['seconds'] += latency
+            m['queries'] += measures['queries']
+            m['sql_seconds'] += measures['sql_seconds']
+            m['template_seconds'] += measures['template_seconds']
+            for i, bucket in enumerate(self.BUCKETS):
+                if latency <= bucket:
+                    m['buckets'][i] += 1
+
+    def __before_query(self, conn, cursor, statement, parameters, context, executemany):
+        # The start time is kept by the statement execution, so nothing is left behind
+        # when the query fails.
+        if context is not None:
+            context.instrumentation_start = time.perf_counter()
+
+    def __after_query(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, 'instrumentation_start', None)
+        if start is not None and has_request_context() and 'instrumentation' in g:
+            g.instrumentation['queries'] += 1
+            g.instrumentation['sql_seconds'] += time.perf_counter() - start
+
+    def __dump_profile(self, profile, endpoint: str):
+        """Save the profile of a request in the endpoint folder, removing the oldest ones
+        above INSTRUMENTATION_PROFILE_MAX_FILES.
+
+        Args:
+            profile (cProfile.Profile): Request profile
+            endpoint (str): Request endpoint
+        """
+        location = os.path.join(self.__profile_location, endpoint)
+        os.makedirs(location, exist_ok=True)
+        # Named after the dump time, so the names sort from the oldest to the newest
+        profile.dump_stats(os.path.join(location, '{}-{}.prof'.format(
+            time.time_ns(), request.method)))
+
+        files = sorted(f for f in os.listdir(location) if f.endswith('.prof'))
+        excess = len(files) - current_app.config['INSTRUMENTATION_PROFILE_MAX_FILES']
+        for name in files[:max(excess, 0)]:
+            try:
+                os.remove(os.path.join(location, name))
+            except FileNotFoundError:
+                # Removed by another request in the meantime
+                pass
+
+    def __expose(self):
+        """Expose the aggregated measures in the Prometheus text format. Responds
+        "404 Not Found" without a valid administration token."""
+        if not Request(current_app, session).is_admin(request):
+            abort(404)
+
+        with self.__lock:
+            metrics = {k: {**m, 'buckets': list(m['buckets'])} for k, m in self.__metrics.items()}
+
+        lines = []
+        series = [
+            ('requests_total', 'counter', 'Requests served', 'count'),
+            ('request_errors_total', 'counter', 'Requests failed by an exception', 'errors'),
+            ('sql_queries_total', 'counter', 'SQL queries executed', 'queries'),
+            ('sql_seconds_total', 'counter', 'Time spent executing SQL queries', 'sql_seconds'),
+            ('template_seconds_total', 'counter', 'Time spent rendering templates',
+             'template_seconds'),
+        ]
+        for name, type, help, key in series:
+            lines.append('# HELP comparison_{} {}'.format(name, help))
+            lines.append('# TYPE comparison_{} {}'.format(name, type))
+            for (endpoint, method), m in sorted(metrics.items()):
+                lines.append('comparison_{}{{endpoint="{}",method="{}"}} {}'.format(
+                    name, endpoint, method, m[key]))
+
+        name = 'comparison_request_duration_seconds'
+        lines.append('# HELP {} Request latency'.format(name))
+        lines.append('# TYPE {} histogram'.format(name))
+        for (endpoint, method), m in sorted(metrics.items()):
+            labels = 'endpoint="{}",method="{}"'.format(endpoint, method)
+            for bucket, count in zip(self.BUCKETS, m['buckets']):
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, bucket, count))
+            lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(name, labels, m['count']))
+            lines.append('{}_sum{{{}}} {}'.format(name, labels, m['seconds']))
+            lines.append('{}_count{{{}}} {}'.format(name, labels, m['count']))
+
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+instrumentation = Instrumentation()
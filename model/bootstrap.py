@@ -0,0 +1,149 @@
+"""Bootstrap confidence intervals of the item scores"""
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+# Custom libraries
+from model.connection import db, shards
+from model.ranking import BradleyTerry
+from model.schema import Comparison, Item
+
+
+class Bootstrap:
+    """Confidence intervals of the items Bradley-Terry log scores estimated from the saved
+    judgements. The judgements are resampled with replacement either one by one
+    (judgement) or grouping the judgements of every rater (rater), which keeps the
+    correlation between the judgements of the same person. The replicates are fitted in
+    batches by the vectorized Bradley-Terry solver and spread across worker processes.
+
+    Decisive judgements count as a win of the selected item and ties as half a win of each
+    item. Skipped comparisons are left out.
+    """
+    BY = ['rater', 'judgement']
+    # Maximum number of matrix cells of a batch of replicates fitted together
+    BATCH_CELLS = 2000000
+
+    @classmethod
+    def intervals(cls, replicates: int = 1000, by: str = 'rater', confidence: float = 0.95,
+                  processes: int = 1, seed: int = 0):
+        """Estimate the items scores and their percentile confidence intervals
+
+        Args:
+            replicates (int, optional): Number of bootstrap replicates. Defaults to 1000.
+            by (str, optional): Resampling unit (rater or judgement). Defaults to rater.
+            confidence (float, optional): Confidence level. Defaults to 0.95.
+            processes (int, optional): Worker processes fitting the replicates.
+            Defaults to 1 (no worker process).
+            seed (int, optional): Random seed. Defaults to 0.
+
+        Raises:
+            RuntimeError: Unknown resampling unit
+
+        Returns:
+            list: Score, standard error and interval of every item
+        """
+        if by not in cls.BY:
+            raise RuntimeError(f"Unknown bootstrap resampling unit {by}")
+
+        items = db.session.query(Item.item_id, Item.name).order_by(Item.item_id).all()
+        positions = {id: p for p, (id, _) in enumerate(items)}
+        judgements = []
+        for session in shards.sessions():
+            judgements += session.query(
+                    Comparison.user_id, Comparison.item_1_id, Comparison.item_2_id,
+                    Comparison.state, Comparison.selected_item_id).\
+                where(Comparison.state.in_([Comparison.SELECTED, Comparison.TIED])).\
+                order_by(Comparison.comparison_id).all()
+
+        # Every judgement is stored as two half wins: a decisive one as two halves of the
+        # same win and a tie as a half win of every item.
+        n = len(items)
+        winner = np.empty(2 * len(judgements), dtype=np.int64)
+        loser = np.empty(2 * len(judgements), dtype=np.int64)
+        raters = np.empty(len(judgements), dtype=np.int64)
+        user_positions = {}
+        for k, (user_id, item_1_id, item_2_id, state, selected_item_id) in enumerate(judgements):
+            i, j = positions[item_1_id], positions[item_2_id]
+            if state == Comparison.SELECTED and int(selected_item_id) == item_2_id:
+                i, j = j, i
+            winner[2 * k], loser[2 * k] = i, j
+            winner[2 * k + 1], loser[2 * k + 1] = (i, j) if state == Comparison.SELECTED \
+                else (j, i)
+            raters[k] = user_positions.setdefault(user_id, len(user_positions))
+        cells = winner * n + loser
+
+        score = BradleyTerry.fit(cls.__wins(cells, np.ones(len(judgements)), n))
+
+        # Spread the replicates in chunks between the worker processes
+        chunks = max(processes, 1)
+        sizes = [replicates // chunks + int(c < replicates % chunks) for c in range(chunks)]
+        tasks = [(cells, raters, n, size, by, [seed, c]) for c, size in enumerate(sizes)
+                 if size > 0]
+        if processes > 1:
+            with ProcessPoolExecutor(processes) as executor:
+                samples = list(executor.map(cls.replicate, *zip(*tasks)))
+        else:
+            samples = [cls.replicate(*t) for t in tasks]
+        samples = np.concatenate(samples) if len(samples) > 0 else np.empty((0, n))
+
+        alpha = (1 - confidence) / 2
+        lower, upper = np.quantile(samples, [alpha, 1 - alpha], axis=0) \
+            if len(samples) > 0 else (np.full(n, np.nan), np.full(n, np.nan))
+        comparisons = np.bincount(np.concatenate([winner, loser]), minlength=n) // 2
+        return [{
+            'item_id': item_id,
+            'name': name,
+            'comparisons': int(comparisons[p]),
+            'score': float(score[p]),
+            'standard_error': float(samples[:, p].std()) if len(samples) > 0 else np.nan,
+            'lower': float(lower[p]),
+            'upper': float(upper[p]),
+        } for p, (item_id, name) in enumerate(items)]
+
+    @classmethod
+    def replicate(cls, cells, raters, n: int, replicates: int, by: str, seed):
+        """Fit bootstrap replicates of the judgements (worker processes entry point)
+
+        Args:
+            cells (ndarray): Win matrix cell (winner * n + loser) of every half judgement
+            raters (ndarray): Rater position of every judgement
+            n (int): Number of items
+            replicates (int): Number of replicates
+            by (str): Resampling unit (rater or judgement)
+            seed (list): Random seed
+
+        Returns:
+            ndarray: Log scores of every replicate (replicates x n)
+        """
+        rng = np.random.default_rng(seed)
+        judgements = len(raters)
+        users = int(raters.max()) + 1 if judgements > 0 else 0
+        batch = max(1, min(replicates, cls.BATCH_CELLS // max(n * n, 1)))
+        wins = np.empty((batch, n, n))
+        scores = np.empty((replicates, n))
+        for start in range(0, replicates, batch):
+            size = min(batch, replicates - start)
+            for b in range(size):
+                # Times every judgement is drawn in the replicate
+                if by == 'rater':
+                    counts = rng.multinomial(users, np.full(users, 1 / users))[raters] \
+                        if users > 0 else np.empty(0)
+                else:
+                    counts = rng.multinomial(judgements, np.full(judgements, 1 / judgements)) \
+                        if judgements > 0 else np.empty(0)
+                wins[b] = cls.__wins(cells, counts, n)
+            scores[start:start + size] = BradleyTerry.fit(wins[:size])
+        return scores
+
+    @classmethod
+    def __wins(cls, cells, counts, n: int):
+        """Build the win matrix of the judgements drawn
+
+        Args:
+            cells (ndarray): Win matrix cell of every half judgement
+            counts (ndarray): Times every judgement is drawn
+            n (int): Number of items
+
+        Returns:
+            ndarray: Win matrix (n x n)
+        """
+        weights = np.repeat(np.asarray(counts, dtype=np.float64), 2) / 2
+        return np.bincount(cells, weights=weights, minlength=n * n).reshape(n, n)
@@ -0,0 +1,373 @@
+"""In-process caches of the website setup data and of the users data"""
+import threading
+import numpy as np
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+# Custom libraries
+from model.connection import db, shards
+from model.schema import Item, ItemGroup, UserItem, Comparison, UserGroup
+from model.write_behind import write_behind
+
+
+class SetupCache(ABC):
+    """Base class of the read-only caches of the data created by the website setup. The
+    data can't change after the setup, so it's loaded just once per process. The caches
+    are dropped every time a different setup execution is detected.
+
+    Subclasses implement _fetch, the query of the cached data. Every subclass gets its own
+    lock, so loading a cache doesn't block the readers of the other ones.
+    """
+    # Cached data
+    data = None
+    # Setup execution the cached data belongs to
+    version = None
+    lock = threading.RLock()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.lock = threading.RLock()
+
+    @classmethod
+    def validate(cls, version):
+        """Drop the cached data of every cache when it belongs to a different setup
+        execution.
+
+        Args:
+            version (datetime): Setup execution date
+        """
+        for cache in cls.__caches():
+            if cache.version != version:
+                with cache.lock:
+                    cache.data = None
+                    cache.version = version
+
+    @classmethod
+    def clear(cls):
+        """Drop the cached data of every cache"""
+        for cache in cls.__caches():
+            with cache.lock:
+                cache.data = None
+                cache.version = None
+
+    @classmethod
+    def load(cls):
+        """Load the cached data from the database, if it isn't cached yet.
+
+        Returns:
+            Cached data
+        """
+        data = cls.data
+        if data is not None:
+            return data
+
+        with cls.lock:
+            if cls.data is None:
+                # The objects are loaded in their own session, so they are detached from
+                # the request session and aren't expired when the request commits.
+                with Session(db.engine, expire_on_commit=False) as session:
+                    cls.data = cls._fetch(session)
+                    session.expunge_all()
+            return cls.data
+
+    @classmethod
+    @abstractmethod
+    def _fetch(cls, session):
+        """Query the data being cached. Implemented by every cache.
+
+        Args:
+            session (Session): Database session
+
+        Returns:
+            Cached data
+        """
+
+    @classmethod
+    def __caches(cls):
+        # The base class keeps the version of the setup data currently loaded
+        caches = [SetupCache]
+        for cache in caches:
+            caches.extend(cache.__subclasses__())
+        return caches
+
+
+class UserCache(SetupCache):
+    """Base class of the caches of per user data. The data of the users active lately is
+    kept in memory (least recently used). The data of a user missing from the cache is
+    built again from the database.
+
+    Subclasses implement _build, the query of a user's data, and define SIZE_SETTING.
+    """
+    # Flask setting with the number of users kept in memory
+    SIZE_SETTING = None
+
+    @classmethod
+    def get(cls, user_id: int):
+        """Get the cached data of a user, building it if the user isn't cached
+
+        Args:
+            user_id (int): User id
+
+        Returns:
+            User data
+        """
+        users = cls.load()
+        with cls.lock:
+            if user_id in users:
+                users.move_to_end(user_id)
+                return users[user_id]
+
+        return cls.refresh(user_id)
+
+    @classmethod
+    def refresh(cls, user_id: int):
+        """Build the data of a user from the database and cache it
+
+        Args:
+            user_id (int): User id
+
+        Returns:
+            User data
+        """
+        users = cls.load()
+        data = cls._build(user_id)
+        with cls.lock:
+            users[user_id] = data
+            users.move_to_end(user_id)
+            while len(users) > current_app.config[cls.SIZE_SETTING]:
+                users.popitem(last=False)
+        return data
+
+    @classmethod
+    def discard(cls, user_id: int):
+        """Drop the cached data of a user
+
+        Args:
+            user_id (int): User id
+        """
+        with cls.lock:
+            cls.load().pop(user_id, None)
+
+    @classmethod
+    @abstractmethod
+    def _build(cls, user_id: int):
+        """Build the data of a user from the database. Implemented by every user cache.
+
+        Args:
+            user_id (int): User id
+
+        Returns:
+            User data
+        """
+
+    @classmethod
+    def _fetch(cls, session):
+        return OrderedDict()
+
+
+class ItemCache(SetupCache):
+    """Items being compared indexed by item id"""
+
+    @classmethod
+    def get(cls, item_id: int):
+        """Get an item
+
+        Args:
+            item_id (int): Item id
+
+        Returns:
+            Item: Model Item | None
+        """
+        return cls.load().get(int(item_id))
+
+    @classmethod
+    def get_pair(cls, item_1_id: int, item_2_id: int):
+        """Get a pair of items keeping the order of the ids.
+
+        Args:
+            item_1_id (int): Item id of the first item
+            item_2_id (int): Item id of the second item
+
+        Returns:
+            Item: Model Item | None
+            Item: Model Item | None
+        """
+        return cls.get(item_1_id), cls.get(item_2_id)
+
+    @classmethod
+    def _fetch(cls, session):
+        return {i.item_id: i for i in session.query(Item).all()}
+
+
+class GroupCache(SetupCache):
+    """Item ids of every group indexed by group id"""
+
+    @classmethod
+    def get_item_ids(cls, group_ids: list):
+        """Get the unique item ids of a list of groups
+
+        Args:
+            group_ids (list): Group ids
+
+        Returns:
+            list: Item ids sorted ascending
+        """
+        groups = cls.load()
+        item_ids = set()
+        for group_id in group_ids:
+            item_ids.update(groups.get(int(group_id), []))
+        return sorted(item_ids)
+
+    @classmethod
+    def _fetch(cls, session):
+        groups = {}
+        for ig in session.query(ItemGroup).order_by(ItemGroup.item_id).all():
+            groups.setdefault(ig.group_id, []).append(ig.item_id)
+        return groups
+
+
+class FragmentCache(SetupCache):
+    """HTML fragments rendered just from setup data, indexed by fragment name"""
+
+    @classmethod
+    def get(cls, name: str, render):
+        """Get a rendered fragment. The fragment is rendered the first time it's required.
+
+        Args:
+            name (str): Fragment name
+            render (function): Function rendering the fragment
+
+        Returns:
+            Rendered fragment
+        """
+        fragments = cls.load()
+        if name not in fragments:
+            fragments[name] = render()
+        return fragments[name]
+
+    @classmethod
+    def _fetch(cls, session):
+        return {}
+
+
+class KnownItems(UserCache):
+    """Item ids known by every user, stated on the item preference page. The preferences
+    can't change once the user finished the item preference page, so the ids are kept as a
+    sorted integer array (flask setting KNOWN_ITEMS_CACHE_SIZE).
+    """
+    SIZE_SETTING = 'KNOWN_ITEMS_CACHE_SIZE'
+
+    @classmethod
+    def _build(cls, user_id: int):
+        result = db.session.query(UserItem.item_id).\
+            where(UserItem.user_id == user_id, UserItem.known == 1).all()
+        item_ids = [id for id, in result]
+        # Include the item preferences waiting in the write-behind queue.
+        item_ids += [ui.item_id for ui in write_behind.pending(
+            UserItem, user_id=user_id, known=True)]
+        return np.unique(np.array(item_ids, dtype=np.int64))
+
+
+class PairQueue(UserCache):
+    """Pairs of items drawn in advance for every user (flask setting
+    PAIR_QUEUE_CACHE_SIZE). The pairs are drawn in batches, so most of the rank pages just
+    take the next pair of the queue.
+    """
+    SIZE_SETTING = 'PAIR_QUEUE_CACHE_SIZE'
+
+    @classmethod
+    def pop(cls, user_id: int):
+        """Take the next pair of the user's queue
+
+        Args:
+            user_id (int): User id
+
+        Returns:
+            int: Item id of the first item | None
+            int: Item id of the second item | None
+        """
+        queue = cls.get(user_id)
+        with cls.lock:
+            return queue.popleft() if len(queue) > 0 else (None, None)
+
+    @classmethod
+    def push(cls, user_id: int, pairs: list):
+        """Add pairs at the end of the user's queue
+
+        Args:
+            user_id (int): User id
+            pairs (list): Pairs of item ids
+        """
+        queue = cls.get(user_id)
+        with cls.lock:
+            queue.extend(pairs)
+
+    @classmethod
+    def _build(cls, user_id: int):
+        return deque()
+
+
+class SubmittedPairs(UserCache):
+    """Pair tokens of the comparisons saved by every user (flask setting
+    SUBMITTED_PAIRS_CACHE_SIZE). Every rank page draws its pair with a new token, so a
+    repeated submission of the same page is recognized without querying the database.
+    """
+    SIZE_SETTING = 'SUBMITTED_PAIRS_CACHE_SIZE'
+
+    @classmethod
+    def claim(cls, user_id: int, pair_token: str):
+        """Record the submission of a pair, unless the user already submitted it
+
+        Args:
+            user_id (int): User id
+            pair_token (str): Pair token
+
+        Returns:
+            bool: True for the first submission of the pair. False when repeated.
+        """
+        tokens = cls.get(user_id)
+        with cls.lock:
+            if pair_token in tokens:
+                return False
+            tokens.add(pair_token)
+            return True
+
+    @classmethod
+    def _build(cls, user_id: int):
+        result = db.session.query(Comparison.pair_token).\
+            where(Comparison.user_id == user_id, Comparison.pair_token.isnot(None)).all()
+        tokens = {token for token, in result}
+        # Include the comparisons waiting in the write-behind queue.
+        tokens.update(c.pair_token for c in write_behind.pending(Comparison, user_id=user_id)
+                      if c.pair_token is not None)
+        return tokens
+
+
+class UserShard(UserCache):
+    """Group database of every user's judgements (flask setting USER_SHARDS_CACHE_SIZE):
+    the database of the user's first group. Used just when the sharding mode is enabled.
+    """
+    SIZE_SETTING = 'USER_SHARDS_CACHE_SIZE'
+
+    @classmethod
+    def use(cls, user_id: int):
+        """Route the judgement tables of the request session to the user's group database
+
+        Args:
+            user_id (int): User id
+        """
+        if not shards.enabled():
+            return
+        shard_id = cls.get(user_id)
+        if shard_id is None:
+            # Unknown user (e.g. a session of a previous setup). The id can be registered later.
+            cls.discard(user_id)
+            return
+        shards.bind(db.session, shard_id)
+
+    @classmethod
+    def _build(cls, user_id: int):
+        return db.session.query(func.min(UserGroup.group_id)).\
+            where(UserGroup.user_id == user_id).scalar()
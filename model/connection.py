@@ -1,4 +1,9 @@
+import os
+import threading
+from flask import current_app, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, event, select, text
+from sqlalchemy.orm import Session, scoped_session
 
 db = SQLAlchemy()
 
@@ -20,3 +25,198 @@ def persist(conn, obj):
     conn.session.refresh(obj)
 
     return obj
+
+
+def configure_engine(app):
+    """Apply the SQLite performance profile (flask setting SQLITE_PRAGMAS) to every
+    connection opened by the application database engine.
+
+    Args:
+        app (Flask): Flask application
+    """
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if not pragmas or not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        return
+
+    listen_sqlite_pragmas(db.get_engine(app), pragmas)
+
+
+def listen_sqlite_pragmas(engine, pragmas: dict):
+    """Set a group of SQLite pragmas on each new connection of a database engine.
+
+    Args:
+        engine (Engine): SQLAlchemy engine
+        pragmas (dict): Pragmas values indexed by pragma name
+    """
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute("PRAGMA {}={}".format(name, value))
+        cursor.close()
+
+    event.listen(engine, 'connect', set_pragmas)
+
+
+class Shards:
+    """Optional per group databases of the participant's judgements. The comparisons, the
+    item preferences and their statistics of every group are saved in their own SQLite
+    database, so the groups take writes in parallel instead of waiting for the lock of a
+    single database file. The rest of the tables (setup data, users) stay in the main
+    database. Enabled through the flask setting SHARDS.
+
+    A user's judgements are saved in the database of the user's first group, selected
+    binding the session tables (see bind). Every database gets its own range of ids, so
+    the ids are unique across the databases.
+    """
+    # Tables saved in the group databases
+    TABLES = ['comparison', 'user_item', 'user_statistic', 'item_statistic']
+    # Ids reserved for every group database
+    ID_SPAN = 10 ** 9
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__engines = {}
+
+    def init_app(self, app):
+        """Set the sharding default settings
+
+        Args:
+            app (Flask): Flask application
+        """
+        app.config.setdefault('SHARDS', False)
+        app.config.setdefault('SHARDS_LOCATION', 'instance/shards/')
+
+    def enabled(self):
+        """Verify if the sharding mode was enabled for the current application"""
+        return has_app_context() and bool(current_app.config['SHARDS'])
+
+    def ids(self, session=None):
+        """Get the id of every group database (one per group)
+
+        Args:
+            session (Session, optional): Database session. Defaults to the flask session.
+
+        Returns:
+            list: Group ids
+        """
+        group = db.metadata.tables['group']
+        session = db.session if session is None else session
+        return [id for id, in session.execute(
+            select(group.c.group_id).order_by(group.c.group_id))]
+
+    def bind(self, session, shard_id: int):
+        """Route the judgement tables of a session to a group database
+
+        Args:
+            session (Session): Database session
+            shard_id (int): Group id
+        """
+        if isinstance(session, scoped_session):
+            session = session()
+        engine = self.engine(shard_id)
+        for name in self.TABLES:
+            session.bind_table(db.metadata.tables[name], engine)
+        session.info['shard'] = shard_id
+
+    def shard(self, session):
+        """Get the group database a session is bound to
+
+        Args:
+            session (Session): Database session
+
+        Returns:
+            int: Group id | None when the session uses the main database
+        """
+        return session.info.get('shard')
+
+    def sessions(self, session=None):
+        """Iterate the sessions reading the judgement tables of every database. Just the
+        given session is returned when the sharding mode is disabled.
+
+        Args:
+            session (Session, optional): Main database session. Defaults to the flask
+            session.
+
+        Yields:
+            Session: Database session
+        """
+        session = db.session if session is None else session
+        if not self.enabled():
+            yield session
+            return
+
+        for shard_id in self.ids(session):
+            with Session(db.engine, expire_on_commit=False) as shard_session:
+                self.bind(shard_session, shard_id)
+                yield shard_session
+
+    def engine(self, shard_id: int):
+        """Get the engine of a group database. The database is created the first time.
+
+        Args:
+            shard_id (int): Group id
+
+        Returns:
+            Engine: SQLAlchemy engine
+        """
+        location = self.__location(shard_id)
+        engine = self.__engines.get(location)
+        if engine is not None:
+            return engine
+
+        with self.__lock:
+            if location not in self.__engines:
+                os.makedirs(os.path.dirname(location), exist_ok=True)
+                engine = create_engine('sqlite:///' + location)
+                if current_app.config.get('SQLITE_PRAGMAS'):
+                    listen_sqlite_pragmas(engine, current_app.config['SQLITE_PRAGMAS'])
+                self.__create_tables(engine, shard_id)
+                self.__engines[location] = engine
+            return self.__engines[location]
+
+    def create_all(self):
+        """Create the judgement tables of every group database (website setup)"""
+        if not self.enabled():
+            return
+        for shard_id in self.ids():
+            self.__create_tables(self.engine(shard_id), shard_id)
+
+    def drop_all(self):
+        """Drop the judgement tables of every existing group database (website setup)"""
+        folder = self.__folder()
+        if not os.path.exists(folder):
+            return
+        for name in sorted(os.listdir(folder)):
+            if name.startswith('group_') and name.endswith('.db'):
+                shard_id = int(name[len('group_'):-len('.db')])
+                db.metadata.drop_all(self.engine(shard_id), tables=self.__tables())
+
+    def __create_tables(self, engine, shard_id: int):
+        """Create the judgement tables of a group database and reserve its ids range
+
+        Args:
+            engine (Engine): Group database engine
+            shard_id (int): Group id
+        """
+        db.metadata.create_all(engine, tables=self.__tables())
+        with engine.begin() as conn:
+            for table in self.__tables():
+                if not table.dialect_options['sqlite']['autoincrement']:
+                    continue
+                conn.execute(text(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT :name, :seq WHERE NOT "
+                    "EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"),
+                    {'name': table.name, 'seq': shard_id * self.ID_SPAN})
+
+    def __tables(self):
+        return [db.metadata.tables[name] for name in self.TABLES]
+
+    def __folder(self):
+        return os.path.join(os.path.abspath(os.path.dirname(__file__)), '..',
+                            current_app.config['SHARDS_LOCATION'])
+
+    def __location(self, shard_id: int):
+        return os.path.abspath(os.path.join(self.__folder(), 'group_{}.db'.format(int(shard_id))))
+
+
+shards = Shards()
@@ -0,0 +1,337 @@
+"""Judgement coverage of the item pairs of every group and pairs seen by every user"""
+import time
+import numpy as np
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+# Custom libraries
+from model.cache import SetupCache, UserCache, GroupCache
+from model.connection import db, shards
+from model.schema import Comparison
+from model.write_behind import write_behind
+
+
+class GroupCoverage:
+    """Number of judgements of every pair and item of a group. The pair counts are kept
+    in a triangular array: the pair (i, j), i < j, of the group items sorted by item id is
+    stored at the position i * n - i * (i + 1) / 2 + (j - i - 1).
+    """
+
+    def __init__(self, group_id: int, item_ids: list) -> None:
+        self.group_id = group_id
+        self.item_ids = np.array(sorted(item_ids), dtype=np.int64)
+        self.positions = {int(id): p for p, id in enumerate(self.item_ids)}
+        n = len(self.item_ids)
+        self.pair_counts = np.zeros(n * (n - 1) // 2, dtype=np.int32)
+        self.item_counts = np.zeros(n, dtype=np.int32)
+
+    def total(self):
+        """Get the number of judgements of the group"""
+        return int(self.pair_counts.sum())
+
+    def pair_index(self, i, j):
+        """Get the position of a pair in the triangular array
+
+        Args:
+            i (int | ndarray): Position of the first item (i < j)
+            j (int | ndarray): Position of the second item
+
+        Returns:
+            int | ndarray: Pair position
+        """
+        n = len(self.item_ids)
+        return i * n - i * (i + 1) // 2 + (j - i - 1)
+
+    def pair_items(self, k):
+        """Get the items positions of a pair (inverse of pair_index)
+
+        Args:
+            k (int | ndarray): Pair position
+
+        Returns:
+            int | ndarray: Position of the first item
+            int | ndarray: Position of the second item
+        """
+        n = len(self.item_ids)
+        i = n - 2 - np.floor(np.sqrt(-8 * k + 4 * n * (n - 1) - 7) / 2.0 - 0.5).astype(np.int64)
+        j = k + i + 1 - n * (n - 1) // 2 + (n - i) * ((n - i) - 1) // 2
+        return i, j
+
+    def pair_indexes(self, item_1_ids, item_2_ids):
+        """Get the positions of several pairs of items in the triangular array
+
+        Args:
+            item_1_ids (ndarray): Item ids of the first items
+            item_2_ids (ndarray): Item ids of the second items
+
+        Returns:
+            ndarray: Pairs positions. -1 for the pairs not belonging to the group.
+        """
+        n = len(self.item_ids)
+        positions = []
+        for ids in [np.asarray(item_1_ids), np.asarray(item_2_ids)]:
+            p = np.minimum(np.searchsorted(self.item_ids, ids), max(n - 1, 0))
+            positions.append(np.where((n > 0) & (self.item_ids[p] == ids), p, -1))
+        i, j = np.minimum(*positions), np.maximum(*positions)
+        return np.where((i >= 0) & (i != j), self.pair_index(i, j), -1)
+
+    def record(self, item_1_id: int, item_2_id: int, delta: int = 1):
+        """Count the judgement of a pair of items of the group
+
+        Args:
+            item_1_id (int): Item id
+            item_2_id (int): Item id
+            delta (int, optional): Number of judgements. Defaults to 1.
+        """
+        i, j = sorted([self.positions[int(item_1_id)], self.positions[int(item_2_id)]])
+        self.pair_counts[self.pair_index(i, j)] += delta
+        self.item_counts[[i, j]] += delta
+
+    def least_judged_pair(self, rng, item_ids=None, seen=None):
+        """Draw one of the least judged pairs. The ties are broken by the number of
+        judgements of the pair items, and then randomly.
+
+        Args:
+            rng (Generator): Random generator
+            item_ids (list, optional): Restrict the pairs to these items. Defaults to all
+            the group items.
+            seen (ndarray, optional): Bitset of the pairs seen by the user. They are drawn
+            only after every other pair was seen.
+
+        Returns:
+            int: Item id of the first item | None
+            int: Item id of the second item | None
+        """
+        pairs = None
+        if item_ids is not None:
+            positions = np.array(sorted(self.positions[int(id)] for id in set(item_ids)
+                                        if int(id) in self.positions), dtype=np.int64)
+            if len(positions) < 2:
+                return None, None
+            a, b = np.triu_indices(len(positions), 1)
+            pairs = self.pair_index(positions[a], positions[b])
+
+        if seen is not None:
+            unseen = np.unpackbits(seen, count=len(self.pair_counts), bitorder='little') == 0
+            available = np.flatnonzero(unseen) if pairs is None else pairs[unseen[pairs]]
+            if len(available) > 0:
+                pairs = available
+
+        if pairs is None:
+            candidates = np.flatnonzero(self.pair_counts == self.pair_counts.min())
+        else:
+            counts = self.pair_counts[pairs]
+            candidates = pairs[counts == counts.min()]
+
+        i, j = self.pair_items(candidates)
+        load = self.item_counts[i] + self.item_counts[j]
+        best = np.flatnonzero(load == load.min())
+        k = best[rng.integers(len(best))]
+        return int(self.item_ids[i[k]]), int(self.item_ids[j[k]])
+
+
+class Coverage(SetupCache):
+    """Judgement coverage of every group indexed by group id. The coverage is loaded from
+    the judgements saved in the database and then counted in memory by the process. It's
+    loaded again every COVERAGE_REFRESH_SECONDS, so the judgements saved by the other
+    processes are counted too."""
+
+    # Comparison states counted as judgements
+    JUDGED = [Comparison.SELECTED, Comparison.TIED]
+    # Time (monotonic) the coverage was last loaded from the database
+    loaded = None
+
+    @classmethod
+    def refresh(cls):
+        """Load the coverage again from the database if it was loaded more than
+        COVERAGE_REFRESH_SECONDS ago. The coverage in use is kept while it's loaded.
+        """
+        seconds = current_app.config.get('COVERAGE_REFRESH_SECONDS', 0)
+        with cls.lock:
+            if not seconds or cls.data is None or time.monotonic() - cls.loaded < seconds:
+                return
+            # Other threads keep drawing with the current coverage meanwhile
+            cls.loaded = time.monotonic()
+            version = cls.version
+
+        with Session(db.engine, expire_on_commit=False) as session:
+            coverage = cls._fetch(session)
+            session.expunge_all()
+        with cls.lock:
+            # Dropped by a new setup while loading
+            if cls.data is not None and cls.version == version:
+                cls.data = coverage
+
+    @classmethod
+    def record(cls, item_1_id: int, item_2_id: int, delta: int = 1):
+        """Count the judgement of a pair of items in every group containing both items
+
+        Args:
+            item_1_id (int): Item id
+            item_2_id (int): Item id
+            delta (int, optional): Number of judgements. Defaults to 1.
+        """
+        with cls.lock:
+            for group in cls.load().values():
+                if int(item_1_id) in group.positions and int(item_2_id) in group.positions:
+                    group.record(item_1_id, item_2_id, delta)
+
+    @classmethod
+    def record_state_change(cls, item_1_id: int, item_2_id: int, old_state, new_state):
+        """Update the coverage after a comparison state changed (e.g. a rejudge).
+
+        Args:
+            item_1_id (int): Item id
+            item_2_id (int): Item id
+            old_state (str): Previous comparison state | None for new comparisons
+            new_state (str): Current comparison state
+        """
+        delta = int(new_state in cls.JUDGED) - int(old_state in cls.JUDGED)
+        if delta != 0:
+            cls.record(item_1_id, item_2_id, delta)
+
+    @classmethod
+    def draw_pair(cls, group_ids: list, rng, item_ids=None, seen=None):
+        """Draw one of the least judged pairs of the least judged group.
+
+        Args:
+            group_ids (list): Candidate group ids
+            rng (Generator): Random generator
+            item_ids (list, optional): Restrict the pairs to these items. Defaults to all
+            the groups items.
+            seen (dict, optional): Bitsets of the pairs seen by the user indexed by group id
+
+        Returns:
+            int: Item id of the first item | None
+            int: Item id of the second item | None
+        """
+        cls.refresh()
+        coverage = cls.load()
+        with cls.lock:
+            groups = [coverage[int(id)] for id in group_ids if int(id) in coverage]
+            if item_ids is not None:
+                known = set(int(id) for id in item_ids)
+                groups = [g for g in groups if len(known.intersection(g.positions)) >= 2]
+            if len(groups) == 0:
+                return None, None
+
+            # Balance the judgements between groups
+            totals = np.array([g.total() for g in groups])
+            candidates = np.flatnonzero(totals == totals.min())
+            group = groups[candidates[rng.integers(len(candidates))]]
+            item_1_id, item_2_id = group.least_judged_pair(
+                rng, item_ids, None if seen is None else seen.get(group.group_id))
+
+        # Show the items on a random side
+        if item_1_id is not None and rng.random() < 0.5:
+            item_1_id, item_2_id = item_2_id, item_1_id
+        return item_1_id, item_2_id
+
+    @classmethod
+    def _fetch(cls, session):
+        cls.loaded = time.monotonic()
+        coverage = {id: GroupCoverage(id, item_ids) for id, item_ids in
+                    GroupCache.load().items() if len(item_ids) >= 2}
+        judged = []
+        for s in shards.sessions(session):
+            judged += s.query(Comparison.item_1_id, Comparison.item_2_id,
+                              func.count(Comparison.comparison_id)).\
+                where(Comparison.state.in_(cls.JUDGED)).\
+                group_by(Comparison.item_1_id, Comparison.item_2_id).all()
+        for item_1_id, item_2_id, count in judged:
+            for group in coverage.values():
+                if item_1_id in group.positions and item_2_id in group.positions \
+                        and item_1_id != item_2_id:
+                    group.record(item_1_id, item_2_id, count)
+        return coverage
+
+
+class SeenPairs(UserCache):
+    """Pairs of items already shown to every user. The pairs of each group are kept in a
+    bitset over the group triangular pair index (see GroupCoverage), one bit per pair,
+    indexed by group id (flask setting SEEN_PAIRS_CACHE_SIZE). They are rebuilt from the
+    user's comparisons when the user isn't cached.
+    """
+    SIZE_SETTING = 'SEEN_PAIRS_CACHE_SIZE'
+
+    @classmethod
+    def add(cls, user_id: int, item_1_id: int, item_2_id: int):
+        """Mark a pair as seen by the user
+
+        Args:
+            user_id (int): User id
+            item_1_id (int): Item id
+            item_2_id (int): Item id
+        """
+        cls.__set(cls.get(user_id), item_1_id, item_2_id)
+
+    @classmethod
+    def is_seen(cls, user_id: int, item_1_id: int, item_2_id: int):
+        """Verify if the user already saw a pair
+
+        Args:
+            user_id (int): User id
+            item_1_id (int): Item id
+            item_2_id (int): Item id
+
+        Returns:
+            bool: True when the pair was seen in any group
+        """
+        return bool(cls.seen_mask(user_id, [item_1_id], [item_2_id])[0])
+
+    @classmethod
+    def seen_mask(cls, user_id: int, item_1_ids, item_2_ids):
+        """Verify which pairs the user already saw
+
+        Args:
+            user_id (int): User id
+            item_1_ids (list | ndarray): Item ids of the first items
+            item_2_ids (list | ndarray): Item ids of the second items
+
+        Returns:
+            ndarray: True for the pairs seen in any group
+        """
+        seen = cls.get(user_id)
+        mask = np.zeros(len(item_1_ids), dtype=bool)
+        for group in Coverage.load().values():
+            if group.group_id not in seen:
+                continue
+            k = group.pair_indexes(item_1_ids, item_2_ids)
+            valid = k >= 0
+            bits = seen[group.group_id][k[valid] >> 3] >> (k[valid] & 7) & 1
+            mask[valid] |= bits.astype(bool)
+        return mask
+
+    @classmethod
+    def _build(cls, user_id: int):
+        seen = {}
+        comparisons = db.session.query(Comparison.item_1_id, Comparison.item_2_id).\
+            where(Comparison.user_id == user_id).distinct().all()
+        comparisons += [(c.item_1_id, c.item_2_id) for c in
+                        write_behind.pending(Comparison, user_id=user_id)]
+        for item_1_id, item_2_id in comparisons:
+            cls.__set(seen, item_1_id, item_2_id)
+        return seen
+
+    @classmethod
+    def __set(cls, seen: dict, item_1_id: int, item_2_id: int):
+        """Set the bit of a pair in the bitsets of every group containing it"""
+        for group in Coverage.load().values():
+            k = cls.__pair_index(group, item_1_id, item_2_id)
+            if k is None:
+                continue
+            with cls.lock:
+                if group.group_id not in seen:
+                    seen[group.group_id] = np.zeros((len(group.pair_counts) + 7) // 8,
+                                                    dtype=np.uint8)
+                seen[group.group_id][k >> 3] |= np.uint8(1 << (k & 7))
+
+    @classmethod
+    def __pair_index(cls, group: GroupCoverage, item_1_id: int, item_2_id: int):
+        """Get the position of a pair in the group triangular index | None"""
+        i = group.positions.get(int(item_1_id))
+        j = group.positions.get(int(item_2_id))
+        if i is None or j is None or i == j:
+            return None
+        i, j = min(i, j), max(i, j)
+        return int(group.pair_index(i, j))
@@ -1,8 +1,9 @@
 """Initialize Flask website database"""
 # Custom libraries
-from model.connection import db
+from model.connection import db, shards
+from model.statistics import Statistics
 from model.schema import (Group, Item, CustomItemPair, ItemGroup,
-                          UserGroup, Comparison, UserItem)
+                          UserGroup, Comparison, UserItem, ItemStatistic, UserStatistic)
 import pandas as pd
 from sqlalchemy import MetaData
 from migrate.versioning.schema import Table
@@ -19,22 +20,25 @@ class Export:
             UserGroup,
             Comparison,
             CustomItemPair,
-            UserItem
+            UserItem,
+            ItemStatistic,
+            UserStatistic
         ]
 
-    def save(self, location):
+    def save(self, location, sheets=None):
         """Export the database content into a particular location. The file will be
         save as excel file.
 
         Args:
             location (string): File location where to save the exported information
+            sheets (dict, optional): Additional sheets (DataFrame) indexed by sheet name
         """
         with pd.ExcelWriter(location, mode="w", engine='xlsxwriter') as writer:
             for m in self.models:
-                data = m.query.all()
+                data = self.__rows(m)
                 data_list = [item.as_dict() for item in data]
                 df = pd.DataFrame(data_list)
-                df.to_excel(writer, m.__tablename__, index=False)
+                df.to_excel(writer, sheet_name=m.__tablename__, index=False)
 
             # The user model needs to be accessed manually due the dynamics fields
             db_engine = db.get_engine()
@@ -52,4 +56,28 @@ class Export:
                 df = pd.concat([df, row], ignore_index=True)
 
             # Write the user results
-            df.to_excel(writer, 'user', index=False)
+            df.to_excel(writer, sheet_name='user', index=False)
+
+            for name, df in (sheets or {}).items():
+                df.to_excel(writer, sheet_name=name, index=False)
+
+    def __rows(self, model):
+        """Get every row of a table. The judgement tables are read from every group
+        database in the sharding mode.
+
+        Args:
+            model (db.Model): Table model
+
+        Returns:
+            list: Table rows
+        """
+        if model is ItemStatistic:
+            return Statistics.item_rows()
+        if model.__tablename__ not in shards.TABLES:
+            return model.query.all()
+
+        rows = []
+        key = model.__mapper__.primary_key[0]
+        for session in shards.sessions():
+            rows += session.query(model).order_by(key).all()
+        return rows
@@ -0,0 +1,151 @@
+"""Live counters of the study progress"""
+import time
+from collections import Counter, OrderedDict
+from flask import current_app
+from sqlalchemy import func
+# Custom libraries
+from model.connection import shards
+from model.cache import SetupCache, ItemCache
+from model.coverage import Coverage
+from model.schema import Comparison, UserItem, UserStatistic
+
+
+class Progress(SetupCache):
+    """Study progress counters kept in memory by the process. The totals are loaded once
+    from the statistics tables and then updated by the judgements and item preferences
+    saved by the process, so the progress can be watched without querying the database.
+
+    * Judgements by state (selected, tied, skipped) and judgements made per minute.
+    * Item preferences stated (known and unknown items).
+    * Active users: users who made a judgement in the last PROGRESS_ACTIVE_SECONDS.
+    * Group and item coverage (see Coverage).
+    """
+    # Minutes of judgements rate history
+    MINUTES = 30
+
+    @classmethod
+    def record_judgement(cls, user_id: int, state, previous_state=None):
+        """Count a judgement saved by the user
+
+        Args:
+            user_id (int): User id
+            state (str): Comparison state
+            previous_state (str, optional): State before the rejudge. None for new
+            comparisons.
+        """
+        progress = cls.load()
+        now = time.time()
+        with cls.lock:
+            if previous_state is not None:
+                progress['states'][previous_state] -= 1
+            else:
+                minute = int(now // 60)
+                progress['minutes'][minute] = progress['minutes'].get(minute, 0) + 1
+                while len(progress['minutes']) > cls.MINUTES:
+                    progress['minutes'].popitem(last=False)
+            progress['states'][state] += 1
+            progress['users'][user_id] = now
+            progress['users'].move_to_end(user_id)
+
+    @classmethod
+    def record_preference(cls, user_id: int, known: bool):
+        """Count an item preference stated by the user
+
+        Args:
+            user_id (int): User id
+            known (bool): True when the user knows the item
+        """
+        progress = cls.load()
+        with cls.lock:
+            progress['preferences'][bool(known)] += 1
+            progress['users'][user_id] = time.time()
+            progress['users'].move_to_end(user_id)
+
+    @classmethod
+    def snapshot(cls):
+        """Get the current study progress
+
+        Returns:
+            dict: Study progress
+        """
+        progress = cls.load()
+        now = time.time()
+        active_since = now - current_app.config['PROGRESS_ACTIVE_SECONDS']
+        with cls.lock:
+            # The users are sorted by activity. The inactive ones are forgotten.
+            users = progress['users']
+            while len(users) > 0 and next(iter(users.values())) < active_since:
+                users.popitem(last=False)
+            states = dict(progress['states'])
+            minute = int(now // 60)
+            minutes = range(minute - cls.MINUTES + 1, minute + 1)
+            rate = [progress['minutes'].get(m, 0) for m in minutes]
+            preferences = dict(progress['preferences'])
+            active_users = len(users)
+
+        judged = states.get(Comparison.SELECTED, 0) + states.get(Comparison.TIED, 0)
+        total = judged + states.get(Comparison.SKIPPED, 0)
+        return {
+            'time': now,
+            'judgements': total,
+            'selected': states.get(Comparison.SELECTED, 0),
+            'tied': states.get(Comparison.TIED, 0),
+            'skipped': states.get(Comparison.SKIPPED, 0),
+            'tie_ratio': states.get(Comparison.TIED, 0) / judged if judged > 0 else None,
+            'skip_ratio': states.get(Comparison.SKIPPED, 0) / total if total > 0 else None,
+            # Judgements of the last minutes, the current minute last
+            'judgements_per_minute': rate,
+            'known_items': preferences.get(True, 0),
+            'unknown_items': preferences.get(False, 0),
+            'active_users': active_users,
+            'groups': cls.__coverage()
+        }
+
+    @classmethod
+    def __coverage(cls):
+        """Get the judgement coverage of every group and its items
+
+        Returns:
+            list: Groups coverage
+        """
+        groups = []
+        coverage = Coverage.load()
+        with Coverage.lock:
+            for group_id, group in sorted(coverage.items()):
+                pairs = group.pair_counts
+                groups.append({
+                    'group_id': group_id,
+                    'judgements': group.total(),
+                    'pairs': len(pairs),
+                    'pairs_judged': float((pairs > 0).mean()) if len(pairs) > 0 else None,
+                    'min_per_pair': int(pairs.min()) if len(pairs) > 0 else None,
+                    'mean_per_pair': float(pairs.mean()) if len(pairs) > 0 else None,
+                    'items': [{
+                        'item_id': int(item_id),
+                        'name': getattr(ItemCache.get(item_id), 'display_name', None),
+                        'judgements': int(count)
+                    } for item_id, count in zip(group.item_ids, group.item_counts)]
+                })
+        return groups
+
+    @classmethod
+    def _fetch(cls, session):
+        states = Counter()
+        preferences = Counter()
+        for s in shards.sessions(session):
+            totals = s.query(func.sum(UserStatistic.decisive), func.sum(UserStatistic.ties),
+                             func.sum(UserStatistic.skipped)).one()
+            states.update({
+                Comparison.SELECTED: int(totals[0] or 0),
+                Comparison.TIED: int(totals[1] or 0),
+                Comparison.SKIPPED: int(totals[2] or 0)
+            })
+            preferences.update({bool(known): count for known, count in s.query(
+                UserItem.known, func.count(UserItem.user_item_id)).group_by(UserItem.known)})
+        return {
+            'states': states,
+            'preferences': preferences,
+            'minutes': OrderedDict(),
+            # Time of the last activity indexed by user id, least recent first
+            'users': OrderedDict()
+        }
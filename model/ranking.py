@@ -0,0 +1,60 @@
+"""Ranking of the items from the judgements"""
+import numpy as np
+
+
+class BradleyTerry:
+    """Bradley-Terry model fitted with the minorization-maximization algorithm (Hunter,
+    2004). The probability of the item i winning against the item j is
+    p_i / (p_i + p_j). Every item gets a virtual win and a virtual loss against an item of
+    average strength, so the scores are finite even for the items that never won or lost.
+    """
+    # Virtual wins and losses of every item against an average item
+    PRIOR = 1.0
+
+    @classmethod
+    def fit(cls, wins, iterations: int = 1000, tolerance: float = 1e-6):
+        """Estimate the strength of every item. Several samples can be fitted at once
+        stacking their matrices on the first dimensions.
+
+        Args:
+            wins (ndarray): Square matrix (or stack of matrices). wins[i, j] is the number
+            of times the item i won against the item j.
+            iterations (int, optional): Maximum number of iterations. Defaults to 1000.
+            tolerance (float, optional): Maximum change of the log scores between two
+            iterations to stop. Defaults to 1e-6.
+
+        Returns:
+            ndarray: Log strength of every item, centered on 0
+        """
+        wins = np.asarray(wins, dtype=np.float64)
+        comparisons = wins + np.swapaxes(wins, -1, -2)
+        total_wins = wins.sum(axis=-1) + cls.PRIOR
+        p = np.ones(wins.shape[:-1])
+        for _ in range(iterations):
+            denominator = (comparisons / (p[..., :, None] + p[..., None, :])).sum(axis=-1) + \
+                2 * cls.PRIOR / (p + 1)
+            updated = total_wins / denominator
+            # Keep the geometric mean of the scores at 1 (the average item)
+            updated /= np.exp(np.log(updated).mean(axis=-1, keepdims=True))
+            converged = np.abs(np.log(updated) - np.log(p)).max() < tolerance
+            p = updated
+            if converged:
+                break
+        return np.log(p)
+
+    @classmethod
+    def spearman(cls, x, y):
+        """Spearman rank correlation of two score vectors
+
+        Args:
+            x (ndarray): Scores
+            y (ndarray): Scores
+
+        Returns:
+            float: Rank correlation | nan when any vector is constant
+        """
+        rx = np.argsort(np.argsort(x)).astype(np.float64)
+        ry = np.argsort(np.argsort(y)).astype(np.float64)
+        if rx.std() == 0 or ry.std() == 0:
+            return float('nan')
+        return float(np.corrcoef(rx, ry)[0, 1])
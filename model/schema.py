@@ -143,9 +143,20 @@ class Comparison(db.Model, BaseModel):
     selected_item_id = db.Column(db.Integer, db.ForeignKey('item.item_id'), nullable=True)
     # TODO define state as an enum
     state = db.Column(db.String(20), nullable=False)
+    # Token of the rank page where the pair was drawn. Repeated submissions of the same
+    # page (retries, double posts) are ignored.
+    pair_token = db.Column(db.String(32), nullable=True, unique=True)
+    # Contribution of the decisive judgement to the consensus statistics, kept to remove
+    # it exactly when the comparison is rejudged: agreement with the consensus (None
+    # when the consensus scores were equal) and misfit.
+    consensus_agreement = db.Column(db.Boolean, nullable=True)
+    misfit = db.Column(db.Float, nullable=True)
     created = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     updated = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
+    # The ids are never reused. The group databases get their own range of ids.
+    __table_args__ = {'sqlite_autoincrement': True}
+
 
 class CustomItemPair(db.Model, BaseModel):
     """Holds pair of items with custom weight configuration. If this
@@ -198,9 +209,60 @@ class UserItem(db.Model, BaseModel):
             'item_id',
             name='_user_item_uidx'
         ),
+        # The ids are never reused. The group databases get their own range of ids.
+        {'sqlite_autoincrement': True}
     )
 
 
+class ItemStatistic(db.Model, BaseModel):
+    """Judgement aggregates of every item. Updated incrementally every time a comparison
+    is saved or rejudged.
+
+    Args:
+        db (SQLAlchemy): SQLAlchemy connection object
+
+    Returns: none
+    """
+    __tablename__ = 'item_statistic'
+
+    item_id = db.Column(db.Integer, db.ForeignKey('item.item_id'), primary_key=True)
+    wins = db.Column(db.Integer, nullable=False, default=0)
+    losses = db.Column(db.Integer, nullable=False, default=0)
+    ties = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    # Sum of the squared standardized residuals of the decisive judgements
+    misfit = db.Column(db.Float, nullable=False, default=0)
+
+
+class UserStatistic(db.Model, BaseModel):
+    """Consistency aggregates of every user. Updated incrementally every time a comparison
+    is saved or rejudged.
+
+    Args:
+        db (SQLAlchemy): SQLAlchemy connection object
+
+    Returns: none
+    """
+    __tablename__ = 'user_statistic'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'), primary_key=True)
+    decisive = db.Column(db.Integer, nullable=False, default=0)  # An item was selected
+    ties = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    # Triads of items judged decisively by the user, and the intransitive ones
+    triads = db.Column(db.Integer, nullable=False, default=0)
+    intransitive_triads = db.Column(db.Integer, nullable=False, default=0)
+    # Decisive judgements between items with a different consensus score,
+    # and the ones agreeing with the consensus
+    consensus_judgements = db.Column(db.Integer, nullable=False, default=0)
+    consensus_agreements = db.Column(db.Integer, nullable=False, default=0)
+    # Sum of the squared standardized residuals of the decisive judgements
+    misfit = db.Column(db.Float, nullable=False, default=0)
+    # Number of comparisons saved or rejudged by the user. Identifies the version of the
+    # user's judgements kept in memory.
+    recorded = db.Column(db.Integer, nullable=False, default=0)
+
+
 class WebsiteControl(db.Model, BaseModel):
     """Control table to know if the application is in a healthy state.
 
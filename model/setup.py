@@ -1,9 +1,12 @@
 """Setup the website database"""
-from sqlalchemy import Integer, String, MetaData
+from sqlalchemy import Index, Integer, String, MetaData, inspect
 from migrate.versioning.schema import Table, Column
 # Custom libraries
-from model.connection import db, persist
+from model.connection import db, shards, persist
 from model.schema import Group, Item, WebsiteControl, CustomItemPair, ItemGroup
+from model.cache import SetupCache
+from model.statistics import Statistics
+from model.weight_matrix import WeightMatrix
 from configuration.website import Settings as WS
 import os
 
@@ -21,6 +24,9 @@ class Setup:
         with self.app.app_context():
             db.drop_all()
             db.create_all()
+            shards.drop_all()
+            SetupCache.clear()
+            WeightMatrix.remove_all(self.app)
 
             # Remove previous exported database content
             export_location = WS.get_export_location(self.app)
@@ -31,6 +37,7 @@ class Setup:
             self.__setup_group(db)
             self.__setup_website_control_history(db)
             db.session.commit()
+            shards.create_all()
 
             # The setup of the user configuration doesn't use SQLAlquemy ORM. The transaction
             # needs to be committed before inserting the user fields values. The user
@@ -69,6 +76,12 @@ class Setup:
         if weight_conf == WebsiteControl.EQUAL_WEIGHT:
             return
 
+        # Store the custom weights matrix. The pairs aren't saved one by one.
+        if weight_conf == WebsiteControl.CUSTOM_WEIGHT and WS.GROUP_ITEMS_WEIGHT_MATRIX in g:
+            matrix = WeightMatrix.read(g[WS.GROUP_ITEMS_WEIGHT_MATRIX])
+            WeightMatrix.save(self.app, group.group_id, matrix, [i.item_id for i in items])
+            return
+
         # Save the custom weights configuration
         if weight_conf == WebsiteControl.CUSTOM_WEIGHT:
             weights = g[WS.GROUP_ITEMS_WEIGHT]
@@ -195,3 +208,59 @@ class Setup:
         hist.weight_configuration = WS.get_comparison_conf(WS.GROUP_WEIGHT_CONFIGURATION, self.app)
         hist.configuration_file = self.app.config[WS.CONFIGURATION_LOCATION]
         db.session.add(hist)
+
+
+class Upgrade:
+    """Upgrade the database of a website set up by a previous version of the application,
+    keeping its data. The missing tables and columns are created, and the judgement
+    statistics are rebuilt from the saved comparisons.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    def exec(self):
+        """Upgrade the website database (and the group databases in the sharding mode)"""
+        with self.app.app_context():
+            db.create_all()
+            self.__add_columns(db.get_engine(), db.metadata.sorted_tables)
+            if shards.enabled():
+                # The missing tables are created with the group database engines
+                for shard_id in shards.ids():
+                    self.__add_columns(shards.engine(shard_id),
+                                       [db.metadata.tables[n] for n in shards.TABLES])
+
+            SetupCache.clear()
+            self.app.logger.info("Rebuilding the judgement statistics")
+            Statistics.rebuild()
+
+    def __add_columns(self, engine, tables: list):
+        """Add the columns missing from the existing tables of a database
+
+        Args:
+            engine (Engine): Database engine
+            tables (list): Tables of the current schema
+
+        Raises:
+            RuntimeError: A missing column can't be added keeping the table rows
+        """
+        inspector = inspect(engine)
+        db_meta = MetaData(bind=engine)
+        for schema_table in tables:
+            existing = set(c['name'] for c in inspector.get_columns(schema_table.name))
+            missing = [c for c in schema_table.columns if c.name not in existing]
+            if len(missing) == 0:
+                continue
+
+            table = Table(schema_table.name, db_meta)
+            for c in missing:
+                if not c.nullable:
+                    raise RuntimeError("Column {}.{} can't be added to the existing rows. "
+                                       "Please execute >Flask reset<."
+                                       .format(schema_table.name, c.name))
+                self.app.logger.info("Adding column {}.{}".format(schema_table.name, c.name))
+                col = Column(c.name, c.type, nullable=True)
+                col.create(table)
+                if c.unique:
+                    Index('{}_{}_uidx'.format(schema_table.name, c.name), table.c[c.name],
+                          unique=True).create(engine)
@@ -0,0 +1,235 @@
+"""Offline simulation of the pair selection strategies of the rank page"""
+import json
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+# Custom libraries
+from configuration.website import Settings as WS
+from model.ranking import BradleyTerry
+from model.weight_matrix import WeightMatrix
+
+
+class Simulation:
+    """Virtual raters judging the items of a group. The items have latent Bradley-Terry
+    strengths drawn from a normal distribution (standard deviation: spread), and every
+    rater perceives them with its own normal noise (rater_noise). The raters judge in
+    parallel rounds, one judgement per rater and round, and the ranking recovered from the
+    judgements made so far is compared with the latent one at several checkpoints.
+
+    Selection strategies, as made by the rank page:
+    * random: Uniform random pairs of the group items (equal weights).
+    * coverage: Least judged pairs first (equal weights, COVERAGE_AWARE_SELECTION). The
+      pairs of every round are drawn together, ties broken randomly.
+    * preferred: Uniform random pairs of the items known by every rater (item preference
+      page). Every rater knows every item with probability known_fraction.
+    * custom: Pairs drawn respecting the group custom weights.
+    """
+    STRATEGIES = ['random', 'coverage', 'preferred', 'custom']
+    # Fractions of the rounds where the recovered ranking is evaluated
+    CHECKPOINTS = [0.1, 0.25, 0.5, 1.0]
+
+    @classmethod
+    def groups(cls, conf: str = None, items: int = 50):
+        """Get the groups being simulated
+
+        Args:
+            conf (str, optional): Website configuration location, relative to the project
+            root folder. Its groups sizes and custom weights are simulated.
+            items (int, optional): Number of items of the synthetic group simulated when
+            no configuration is given. Defaults to 50.
+
+        Returns:
+            list: Groups (name, number of items and custom weights following the
+            triangular pair index of the configured items order | None)
+        """
+        if conf is None:
+            return [{'name': 'synthetic', 'items': items, 'weights': None}]
+
+        root = os.path.join(os.path.abspath(os.path.dirname(__file__)), '..')
+        with open(os.path.join(root, conf), 'r') as f:
+            configuration = json.load(f)
+
+        groups = []
+        for g in configuration[WS.CONFIGURATION_COMPARISON][WS.GROUPS]:
+            names = [i[WS.ITEM_NAME] for i in g[WS.GROUP_ITEMS]]
+            n = len(names)
+            matrix = None
+            if WS.GROUP_ITEMS_WEIGHT_MATRIX in g:
+                matrix = WeightMatrix.read(g[WS.GROUP_ITEMS_WEIGHT_MATRIX])
+            elif WS.GROUP_ITEMS_WEIGHT in g:
+                matrix = np.zeros((n, n))
+                for w in g[WS.GROUP_ITEMS_WEIGHT]:
+                    i, j = sorted([names.index(w['item_1']), names.index(w['item_2'])])
+                    matrix[i, j] = w['weight']
+            weights = None if matrix is None else matrix[np.triu_indices(n, 1)]
+            groups.append({'name': g[WS.GROUP_NAME], 'items': n, 'weights': weights})
+        return groups
+
+    @classmethod
+    def compare(cls, groups: list, strategies: list, raters: int, judgements: int,
+                repeats: int = 1, processes: int = 1, seed: int = 0, **options):
+        """Simulate every strategy on every group
+
+        Args:
+            groups (list): Groups being simulated (see groups)
+            strategies (list): Selection strategies
+            raters (int): Number of raters
+            judgements (int): Number of judgements of every rater
+            repeats (int, optional): Simulations of every group and strategy, averaged in
+            the results. Defaults to 1.
+            processes (int, optional): Worker processes running the simulations.
+            Defaults to 1 (no worker process).
+            seed (int, optional): Seed of the simulations. Defaults to 0.
+            options: Other run arguments (known_fraction, spread, rater_noise)
+
+        Returns:
+            list: Results of every group, strategy and checkpoint
+        """
+        tasks = []
+        for g in groups:
+            for strategy in strategies:
+                if strategy == 'custom' and g['weights'] is None:
+                    continue
+                for repeat in range(repeats):
+                    tasks.append({
+                        **options,
+                        'items': g['items'], 'strategy': strategy, 'raters': raters,
+                        'judgements': judgements, 'weights': g['weights'],
+                        'seed': [seed, len(tasks)], 'label': g['name']})
+
+        if processes > 1:
+            with ProcessPoolExecutor(processes) as executor:
+                runs = list(executor.map(cls.run_task, tasks))
+        else:
+            runs = [cls.run_task(t) for t in tasks]
+
+        # Average the repeats of every group, strategy and checkpoint
+        results = {}
+        for task, run in zip(tasks, runs):
+            for r in run:
+                key = (task['label'], task['strategy'], r['judgements'])
+                results.setdefault(key, []).append(r)
+        return [{
+            'group': group,
+            'strategy': strategy,
+            **{k: float(np.mean([r[k] for r in rows])) for k in rows[0]}
+        } for (group, strategy, _), rows in results.items()]
+
+    @classmethod
+    def run_task(cls, task: dict):
+        """Run a simulation described by a dictionary (worker processes entry point)"""
+        task = dict(task)
+        task.pop('label')
+        return cls.run(**task)
+
+    @classmethod
+    def run(cls, items: int, strategy: str, raters: int, judgements: int, seed=0,
+            weights=None, known_fraction: float = 0.5, spread: float = 1.0,
+            rater_noise: float = 0.0):
+        """Simulate the judgements of a group of items
+
+        Args:
+            items (int): Number of items
+            strategy (str): Selection strategy
+            raters (int): Number of raters
+            judgements (int): Number of judgements of every rater
+            seed (int | list, optional): Random seed. Defaults to 0.
+            weights (ndarray, optional): Custom weights of the pairs (custom strategy)
+            known_fraction (float, optional): Probability of a rater knowing an item
+            (preferred strategy). Defaults to 0.5.
+            spread (float, optional): Standard deviation of the item log strengths.
+            Defaults to 1.0.
+            rater_noise (float, optional): Standard deviation of every rater perception
+            of the log strengths. Defaults to 0.0.
+
+        Raises:
+            RuntimeError: Unknown strategy or missing custom weights
+
+        Returns:
+            list: Results per checkpoint (judgements made, judgements per pair, pairs
+            judged at least once and Spearman correlation of the recovered ranking)
+        """
+        rng = np.random.default_rng(seed)
+        strength = rng.normal(0, spread, items)
+        item_1, item_2 = cls.__draw(rng, strategy, items, raters, judgements, weights,
+                                    known_fraction)
+
+        # Outcomes: Bradley-Terry probability of the perceived strengths
+        rater = np.broadcast_to(np.arange(raters), item_1.shape)
+        difference = strength[item_1] - strength[item_2]
+        if rater_noise > 0:
+            noise = rng.normal(0, rater_noise, (raters, items))
+            difference = difference + noise[rater, item_1] - noise[rater, item_2]
+        first_wins = rng.random(item_1.shape) < 1 / (1 + np.exp(-difference))
+        winner = np.where(first_wins, item_1, item_2)
+        loser = np.where(first_wins, item_2, item_1)
+        # Raters not able to judge (e.g. knowing less than 2 items) are left out
+        valid = item_1 >= 0
+
+        results = []
+        wins = np.zeros((items, items))
+        done = 0
+        for fraction in cls.CHECKPOINTS:
+            rounds = max(int(round(fraction * judgements)), 1)
+            if rounds <= done:
+                continue
+            mask = valid[done:rounds]
+            np.add.at(wins, (winner[done:rounds][mask], loser[done:rounds][mask]), 1)
+            done = rounds
+
+            judged = wins + wins.T
+            pairs = judged[np.triu_indices(items, 1)]
+            results.append({
+                'judgements': int(pairs.sum()),
+                'per_pair': float(pairs.mean()),
+                'pairs_judged': float((pairs > 0).mean()),
+                'spearman': BradleyTerry.spearman(BradleyTerry.fit(wins), strength)
+            })
+        return results
+
+    @classmethod
+    def __draw(cls, rng, strategy, items, raters, judgements, weights, known_fraction):
+        """Draw the pairs of every rater and round
+
+        Returns:
+            ndarray: First items positions (rounds x raters). -1 when not drawn.
+            ndarray: Second items positions (rounds x raters)
+        """
+        shape = (judgements, raters)
+        pair_1, pair_2 = np.triu_indices(items, 1)
+
+        if strategy == 'random':
+            item_1 = rng.integers(items, size=shape)
+            item_2 = rng.integers(items - 1, size=shape)
+            return item_1, item_2 + (item_2 >= item_1)
+
+        if strategy == 'custom':
+            if weights is None:
+                raise RuntimeError("The custom strategy requires custom weights")
+            weights = np.asarray(weights, dtype=np.float64)
+            k = rng.choice(len(weights), size=shape, p=weights / weights.sum())
+            return pair_1[k], pair_2[k]
+
+        if strategy == 'preferred':
+            # Every rater's known items are placed first in a random order
+            known = rng.random((raters, items)) < known_fraction
+            order = np.argsort(np.where(known, rng.random((raters, items)), 2), axis=1)
+            count = known.sum(axis=1)
+            a = (rng.random(shape) * count).astype(np.int64)
+            b = (rng.random(shape) * (count - 1)).astype(np.int64)
+            b = b + (b >= a)
+            rater = np.broadcast_to(np.arange(raters), shape)
+            item_1 = np.where(count >= 2, order[rater, np.minimum(a, items - 1)], -1)
+            item_2 = np.where(count >= 2, order[rater, np.minimum(b, items - 1)], -1)
+            return item_1, item_2
+
+        if strategy == 'coverage':
+            counts = np.zeros(len(pair_1))
+            k = np.empty(shape, dtype=np.int64)
+            for r in range(judgements):
+                order = np.argsort(counts + rng.random(len(counts)))
+                k[r] = order[np.arange(raters) % len(order)]
+                np.add.at(counts, k[r], 1)
+            return pair_1[k], pair_2[k]
+
+        raise RuntimeError(f"Unknown selection strategy {strategy}")
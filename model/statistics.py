@@ -0,0 +1,402 @@
+"""Online judgement statistics of the items and users"""
+from collections import Counter, defaultdict
+from sqlalchemy.dialects.sqlite import insert
+# Custom libraries
+from model.cache import UserCache
+from model.connection import db, shards
+from model.schema import Comparison, ItemStatistic, UserStatistic
+
+
+class Statistics:
+    """Item and user judgement aggregates updated incrementally every time a comparison is
+    saved or rejudged, so they can be read without scanning the comparison table.
+
+    * Items: wins, losses, ties, skipped comparisons and misfit.
+    * Users: decisive judgements, ties, skipped comparisons, triads of items judged
+      decisively and intransitive ones (a > b > c > a), judgements agreeing with the
+      consensus ranking and misfit.
+
+    The consensus score of an item is its smoothed win/loss ratio (wins + 0.5) /
+    (losses + 0.5) at the moment of the judgement. The misfit of a judgement is its
+    squared standardized residual (1 - p) / p, being p the Bradley-Terry probability of
+    the selected item winning given the consensus scores. The contribution of every
+    decisive judgement to the consensus statistics is stored with the comparison, so a
+    rejudge removes exactly what the previous outcome added.
+
+    In the sharding mode, the aggregates are kept by every group database, so the
+    consensus scores are the ones of the user's group database.
+    """
+    # Smoothing of the consensus scores
+    SMOOTHING = 0.5
+
+    @classmethod
+    def record(cls, comparison: Comparison, previous_state=None, previous_selected_item_id=None):
+        """Update the aggregates after a comparison was saved or rejudged. The updates are
+        executed in the current transaction, so they are committed with the comparison.
+
+        Args:
+            comparison (Comparison): Comparison saved (flushed) in the database
+            previous_state (str, optional): State before the rejudge. None for new comparisons.
+            previous_selected_item_id (int, optional): Selected item before the rejudge.
+        """
+        user = Counter({'recorded': 1})
+        items = defaultdict(Counter)
+        # A new comparison closes only the triads of the comparisons made before it, so
+        # the batches saved by the write-behind worker and the rebuild count every triad
+        # once.
+        new = previous_state is None
+        # The database is queried without holding the cache lock: the transaction may
+        # wait for the database write lock meanwhile.
+        judgements = DecisiveJudgements.get_current(comparison.user_id)
+        DecisiveJudgements.remove(judgements, comparison)
+        if not new:
+            cls.__remove(comparison, previous_state, previous_selected_item_id,
+                         judgements, user, items)
+        cls.__add(comparison, judgements, user, items, new)
+        with DecisiveJudgements.lock:
+            judgements['recorded'] += 1
+
+        cls.__upsert(UserStatistic, 'user_id', comparison.user_id, user)
+        for item_id, deltas in items.items():
+            cls.__upsert(ItemStatistic, 'item_id', item_id, deltas)
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute the aggregates replaying every saved comparison (of every group
+        database in the sharding mode)"""
+        for shard_id in shards.ids() if shards.enabled() else [None]:
+            if shard_id is not None:
+                shards.bind(db.session, shard_id)
+            db.session.query(ItemStatistic).delete()
+            db.session.query(UserStatistic).delete()
+            for comparison in db.session.query(Comparison).order_by(Comparison.comparison_id):
+                cls.record(comparison)
+            db.session.commit()
+            # The group databases reuse the items statistics primary keys
+            db.session.expunge_all()
+
+    @classmethod
+    def user(cls, user_id: int):
+        """Get the consistency statistics of a user
+
+        Args:
+            user_id (int): User id
+
+        Returns:
+            dict: User statistics | None
+        """
+        row = db.session.get(UserStatistic, user_id)
+        return None if row is None else cls.__user_summary(row)
+
+    @classmethod
+    def users(cls):
+        """Get the consistency statistics of every user
+
+        Returns:
+            list: Users statistics
+        """
+        rows = []
+        for session in shards.sessions():
+            rows += session.query(UserStatistic).all()
+        return [cls.__user_summary(row) for row in sorted(rows, key=lambda r: r.user_id)]
+
+    @classmethod
+    def items(cls):
+        """Get the judgement statistics of every item
+
+        Returns:
+            list: Items statistics
+        """
+        return [cls.__item_summary(row) for row in cls.item_rows()]
+
+    @classmethod
+    def item_rows(cls):
+        """Get the judgement aggregates of every item. The aggregates of every group
+        database are added up in the sharding mode.
+
+        Returns:
+            list: Items aggregates (ItemStatistic), sorted by item id
+        """
+        items = {}
+        for session in shards.sessions():
+            for row in session.query(ItemStatistic).all():
+                if row.item_id not in items:
+                    items[row.item_id] = ItemStatistic(
+                        **{c.name: getattr(row, c.name) for c in row.__table__.columns})
+                    continue
+                total = items[row.item_id]
+                for c in row.__table__.columns:
+                    if c.name != 'item_id':
+                        setattr(total, c.name, getattr(total, c.name) + getattr(row, c.name))
+        return [items[id] for id in sorted(items)]
+
+    @classmethod
+    def __user_summary(cls, row: UserStatistic):
+        return {
+            **{c.name: getattr(row, c.name) for c in row.__table__.columns},
+            'intransitivity': cls.__ratio(row.intransitive_triads, row.triads),
+            'consensus_agreement': cls.__ratio(row.consensus_agreements,
+                                               row.consensus_judgements),
+            'outfit': cls.__ratio(row.misfit, row.decisive)
+        }
+
+    @classmethod
+    def __item_summary(cls, row: ItemStatistic):
+        return {
+            **{c.name: getattr(row, c.name) for c in row.__table__.columns},
+            'win_rate': cls.__ratio(row.wins, row.wins + row.losses),
+            'outfit': cls.__ratio(row.misfit, row.wins + row.losses)
+        }
+
+    @classmethod
+    def __ratio(cls, numerator, denominator):
+        return numerator / denominator if denominator > 0 else None
+
+    @classmethod
+    def __remove(cls, comparison, state, selected_item_id, judgements, user, items):
+        """Accumulate the aggregates changes removing the previous outcome of a rejudged
+        comparison. The consensus statistics subtracted are the ones stored with the
+        comparison when it was judged.
+
+        Args:
+            comparison (Comparison): Comparison
+            state (str): Comparison state before the rejudge
+            selected_item_id (int): Selected item before the rejudge | None
+            judgements (dict): User's decisive judgements (DecisiveJudgements)
+            user (Counter): User aggregates changes
+            items (dict): Items aggregates changes indexed by item id
+        """
+        if state != Comparison.SELECTED:
+            cls.__count(comparison, state, -1, user, items)
+            return
+
+        winner, loser = cls.__outcome(comparison, selected_item_id)
+        user['decisive'] -= 1
+        items[winner]['wins'] -= 1
+        items[loser]['losses'] -= 1
+
+        triads, intransitive = cls.__triads(comparison, judgements, winner, loser, False)
+        user['triads'] -= triads
+        user['intransitive_triads'] -= intransitive
+
+        if comparison.consensus_agreement is not None:
+            user['consensus_judgements'] -= 1
+            user['consensus_agreements'] -= int(comparison.consensus_agreement)
+        misfit = comparison.misfit or 0
+        user['misfit'] -= misfit
+        items[winner]['misfit'] -= misfit
+        items[loser]['misfit'] -= misfit
+
+    @classmethod
+    def __add(cls, comparison, judgements, user, items, new):
+        """Accumulate the aggregates changes adding the current outcome of a comparison, and
+        store its contribution to the consensus statistics in the comparison.
+
+        Args:
+            comparison (Comparison): Comparison
+            judgements (dict): User's decisive judgements (DecisiveJudgements)
+            user (Counter): User aggregates changes
+            items (dict): Items aggregates changes indexed by item id
+            new (bool): True for new comparisons
+        """
+        comparison.consensus_agreement = None
+        comparison.misfit = None
+        if comparison.state != Comparison.SELECTED:
+            cls.__count(comparison, comparison.state, 1, user, items)
+            return
+
+        winner, loser = cls.__outcome(comparison, comparison.selected_item_id)
+        # The consensus scores don't include the outcome removed by a rejudge
+        winner_score, loser_score = cls.__scores(winner, loser, items)
+        user['decisive'] += 1
+        items[winner]['wins'] += 1
+        items[loser]['losses'] += 1
+
+        triads, intransitive = cls.__triads(comparison, judgements, winner, loser, new)
+        user['triads'] += triads
+        user['intransitive_triads'] += intransitive
+        DecisiveJudgements.add(judgements, comparison.comparison_id, winner, loser)
+
+        if winner_score != loser_score:
+            comparison.consensus_agreement = winner_score > loser_score
+            user['consensus_judgements'] += 1
+            user['consensus_agreements'] += int(comparison.consensus_agreement)
+
+        p = winner_score / (winner_score + loser_score)
+        comparison.misfit = (1 - p) / p
+        user['misfit'] += comparison.misfit
+        items[winner]['misfit'] += comparison.misfit
+        items[loser]['misfit'] += comparison.misfit
+
+    @classmethod
+    def __count(cls, comparison, state, sign, user, items):
+        """Accumulate the aggregates changes of a skipped or tied comparison
+
+        Args:
+            comparison (Comparison): Comparison
+            state (str): Comparison state
+            sign (int): 1 to add the outcome. -1 to remove it.
+            user (Counter): User aggregates changes
+            items (dict): Items aggregates changes indexed by item id
+        """
+        column = {Comparison.SKIPPED: 'skipped', Comparison.TIED: 'ties'}.get(state)
+        if column is None:
+            return
+        user[column] += sign
+        items[int(comparison.item_1_id)][column] += sign
+        items[int(comparison.item_2_id)][column] += sign
+
+    @classmethod
+    def __outcome(cls, comparison: Comparison, selected_item_id: int):
+        """Get the winner and loser of a decisive judgement
+
+        Returns:
+            int: Selected item id
+            int: Not selected item id
+        """
+        winner = int(selected_item_id)
+        item_1_id, item_2_id = int(comparison.item_1_id), int(comparison.item_2_id)
+        return winner, item_2_id if winner == item_1_id else item_1_id
+
+    @classmethod
+    def __triads(cls, comparison: Comparison, judgements: dict, winner: int, loser: int,
+                 new: bool):
+        """Count the triads closed by a decisive judgement with the other decisive
+        judgements of the user.
+
+        Args:
+            comparison (Comparison): Comparison
+            judgements (dict): User's decisive judgements (DecisiveJudgements), without
+                the comparison
+            winner (int): Selected item id
+            loser (int): Not selected item id
+            new (bool): Consider only the comparisons made before this one
+
+        Returns:
+            int: Number of triads
+            int: Number of intransitive triads (winner > loser > c > winner)
+        """
+        # Latest judgement of the winner and loser against every other item (True: won)
+        against = {winner: {}, loser: {}}
+        for item in against:
+            with DecisiveJudgements.lock:
+                judged = dict(judgements['items'].get(item, {}))
+            for comparison_id in sorted(judged):
+                if new and comparison_id > comparison.comparison_id:
+                    break
+                other, won = judged[comparison_id]
+                if other not in (winner, loser):
+                    against[item][other] = won
+
+        common = against[winner].keys() & against[loser].keys()
+        intransitive = sum(1 for c in common if against[loser][c] and not against[winner][c])
+        return len(common), intransitive
+
+    @classmethod
+    def __scores(cls, winner: int, loser: int, items: dict):
+        """Get the consensus score of two items
+
+        Args:
+            winner (int): Selected item id
+            loser (int): Not selected item id
+            items (dict): Items aggregates changes not upserted yet
+
+        Returns:
+            float: Winner score
+            float: Loser score
+        """
+        rows = db.session.query(ItemStatistic).\
+            where(ItemStatistic.item_id.in_([winner, loser])).all()
+        rows = {r.item_id: r for r in rows}
+        scores = []
+        for item_id in [winner, loser]:
+            wins = (rows[item_id].wins if item_id in rows else 0) + items[item_id]['wins']
+            losses = (rows[item_id].losses if item_id in rows else 0) + \
+                items[item_id]['losses']
+            scores.append((wins + cls.SMOOTHING) / (losses + cls.SMOOTHING))
+        return scores[0], scores[1]
+
+    @classmethod
+    def __upsert(cls, model, key: str, id: int, deltas: Counter):
+        """Add the aggregates changes to a statistics row, creating it if needed. The
+        columns are incremented atomically by the database.
+
+        Args:
+            model (db.Model): Statistics model
+            key (str): Primary key column
+            id (int): Primary key value
+            deltas (Counter): Changes indexed by column
+        """
+        deltas = {k: v for k, v in deltas.items() if v != 0}
+        if len(deltas) == 0:
+            return
+
+        statement = insert(model.__table__).values(**{key: int(id)}, **deltas).\
+            on_conflict_do_update(
+                index_elements=[key],
+                set_={k: getattr(model, k) + v for k, v in deltas.items()})
+        db.session.execute(statement)
+
+
+class DecisiveJudgements(UserCache):
+    """Decisive judgements of every user, indexed by item, used to count the triads closed
+    by a judgement without querying the user's comparisons (flask setting
+    DECISIVE_JUDGEMENTS_CACHE_SIZE). Every entry keeps the number of comparisons recorded
+    for the user (UserStatistic.recorded) when it was updated, so the entries outdated by
+    other processes are built again.
+    """
+    SIZE_SETTING = 'DECISIVE_JUDGEMENTS_CACHE_SIZE'
+
+    @classmethod
+    def get_current(cls, user_id: int):
+        """Get the decisive judgements of a user, building them again if outdated. Called
+        in the transaction saving the user's comparison.
+
+        Args:
+            user_id (int): User id
+
+        Returns:
+            dict: Number of comparisons recorded, and the judgements of every item indexed by
+            comparison id: (other item id, True if the item won)
+        """
+        recorded = cls.__recorded(user_id)
+        judgements = cls.get(user_id)
+        if judgements['recorded'] != recorded:
+            judgements = cls.refresh(user_id)
+        return judgements
+
+    @classmethod
+    def add(cls, judgements: dict, comparison_id: int, winner: int, loser: int):
+        """Add a decisive judgement of the user"""
+        with cls.lock:
+            judgements['items'].setdefault(winner, {})[comparison_id] = (loser, True)
+            judgements['items'].setdefault(loser, {})[comparison_id] = (winner, False)
+
+    @classmethod
+    def remove(cls, judgements: dict, comparison: Comparison):
+        """Remove a judgement of the user, if it's a decisive one"""
+        with cls.lock:
+            for item_id in [int(comparison.item_1_id), int(comparison.item_2_id)]:
+                judgements['items'].get(item_id, {}).pop(comparison.comparison_id, None)
+
+    @classmethod
+    def _build(cls, user_id: int):
+        judgements = {'recorded': cls.__recorded(user_id), 'items': {}}
+        if judgements['recorded'] == 0:
+            # None of the user's comparisons was recorded yet (e.g. statistics rebuild)
+            return judgements
+
+        result = db.session.query(
+                Comparison.comparison_id, Comparison.item_1_id, Comparison.item_2_id,
+                Comparison.selected_item_id).\
+            where(Comparison.user_id == user_id, Comparison.state == Comparison.SELECTED).\
+            order_by(Comparison.comparison_id).all()
+        for comparison_id, item_1_id, item_2_id, selected_item_id in result:
+            loser = item_2_id if selected_item_id == item_1_id else item_1_id
+            cls.add(judgements, comparison_id, selected_item_id, loser)
+        return judgements
+
+    @classmethod
+    def __recorded(cls, user_id: int):
+        return db.session.query(UserStatistic.recorded).\
+            where(UserStatistic.user_id == user_id).scalar() or 0
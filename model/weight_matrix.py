@@ -0,0 +1,135 @@
+"""Custom pair weights supplied as a dense matrix per group"""
+import os
+import re
+import numpy as np
+from flask import current_app
+# Custom libraries
+from model.cache import SetupCache
+
+
+class WeightMatrix(SetupCache):
+    """Custom weights of the item pairs of the groups configured with a weight matrix,
+    indexed by group id. The configured matrix (.npy or .csv file) holds the weight of the
+    pair (i, j) on its upper triangle, being i and j the positions of the items in the group
+    configuration. The setup stores the weights of every group as a .npy array following the
+    group triangular pair index (see GroupCoverage), so the rank page memory maps them and
+    draws the pairs without creating any per pair object.
+    """
+    FILE_NAME = 'group_{}.npy'
+    FILE_PATTERN = re.compile(r'^group_(\d+)\.npy$')
+
+    @classmethod
+    def read(cls, path: str):
+        """Read a configured weight matrix
+
+        Args:
+            path (str): Matrix location (.npy or .csv) relative to the project root folder
+
+        Raises:
+            RuntimeError: Unsupported file format
+
+        Returns:
+            ndarray: Weight matrix
+        """
+        path = os.path.join(os.path.abspath(os.path.dirname(__file__)), '..', path)
+        if path.endswith('.npy'):
+            return np.load(path)
+        if path.endswith('.csv'):
+            return np.loadtxt(path, delimiter=',', ndmin=2)
+        raise RuntimeError("The weight matrix must be a .npy or .csv file")
+
+    @classmethod
+    def validate_matrix(cls, matrix, size: int):
+        """Verify a configured weight matrix
+
+        Args:
+            matrix (ndarray): Weight matrix
+            size (int): Number of items of the group
+
+        Returns:
+            str: Error description | None
+        """
+        if matrix.ndim != 2 or matrix.shape != (size, size):
+            return f"The weight matrix must be a {size}x{size} matrix. Actual shape {matrix.shape}."
+
+        weights = matrix[np.triu_indices(size, 1)]
+        if not np.isfinite(weights).all() or (weights < 0).any() or (weights > 1).any():
+            return "The weight matrix values must be between 0 and 1."
+
+        total = weights.sum()
+        if total < 0.98 or total > 1.02:
+            return "Custom weights for item's pairs must sum close to 1. " + \
+                f"Actual weight sum {total}."
+        return None
+
+    @classmethod
+    def save(cls, app, group_id: int, matrix, item_ids: list):
+        """Store the weights of a group following the group triangular pair index
+
+        Args:
+            app (Flask): Flask application
+            group_id (int): Group id
+            matrix (ndarray): Weight matrix in the group configuration items order
+            item_ids (list): Item ids in the group configuration items order
+        """
+        n = len(item_ids)
+        upper = np.triu(np.asarray(matrix, dtype=np.float64), 1)
+        # Reorder the symmetric matrix by item id, as the group triangular pair index does
+        order = np.argsort(np.asarray(item_ids, dtype=np.int64), kind='stable')
+        symmetric = (upper + upper.T)[np.ix_(order, order)]
+        weights = symmetric[np.triu_indices(n, 1)]
+
+        location = cls.location(app)
+        os.makedirs(location, exist_ok=True)
+        np.save(os.path.join(location, cls.FILE_NAME.format(int(group_id))), weights)
+
+    @classmethod
+    def remove_all(cls, app):
+        """Remove the stored weights of every group
+
+        Args:
+            app (Flask): Flask application
+        """
+        location = cls.location(app)
+        if not os.path.exists(location):
+            return
+        for name in os.listdir(location):
+            if cls.FILE_PATTERN.match(name):
+                os.remove(os.path.join(location, name))
+
+    @classmethod
+    def get(cls, group_id: int):
+        """Get the memory mapped weights of a group
+
+        Args:
+            group_id (int): Group id
+
+        Returns:
+            ndarray: Weights following the group triangular pair index | None
+        """
+        return cls.load().get(int(group_id))
+
+    @classmethod
+    def location(cls, app):
+        """Get the folder where the weights are stored
+
+        Args:
+            app (Flask): Flask application
+
+        Returns:
+            str: Folder location
+        """
+        return os.path.join(os.path.abspath(os.path.dirname(__file__)), '..',
+                            app.config['WEIGHT_MATRIX_LOCATION'])
+
+    @classmethod
+    def _fetch(cls, session):
+        location = cls.location(current_app)
+        weights = {}
+        if os.path.exists(location):
+            for name in os.listdir(location):
+                match = cls.FILE_PATTERN.match(name)
+                if match:
+                    weights[int(match.group(1))] = np.load(
+                        os.path.join(location, name), mmap_mode='r')
+        return weights
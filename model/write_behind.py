@@ -0,0 +1,291 @@
+"""Write-behind queue for the participant's judgements"""
+import atexit
+import itertools
+import threading
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from sqlalchemy import inspect
+from sqlalchemy.exc import SQLAlchemyError
+# Custom libraries
+from model.connection import db, shards
+
+
+class WriteBehind:
+    """Queue of database inserts saved in batches by a background worker. The participant's
+    requests return as soon as their writes are queued instead of waiting for their own
+    database commit. Enabled through the flask setting WRITE_BEHIND.
+
+    Queued objects get a negative provisional id until they are saved in the database. The
+    provisional ids are resolved to the database ids once the batch is committed. The queue
+    lives in the process memory, so the website must be served by a single process
+    (multiple threads are fine) while this mode is enabled.
+
+    The objects are saved in the database the request session was bound to (see Shards),
+    in a transaction per database.
+    """
+    # Keep track of the provisional ids resolved lately
+    RESOLVED_IDS_SIZE = 100000
+
+    def __init__(self) -> None:
+        self.__app = None
+        self.__lock = threading.Condition()
+        self.__queue = []
+        self.__pending = {}
+        self.__on_save = {}
+        self.__shards = {}
+        self.__flushing = set()
+        self.__resolved = OrderedDict()
+        self.__provisional_ids = itertools.count(1)
+        self.__worker = None
+        atexit.register(self.flush)
+
+    def init_app(self, app):
+        """Set the write-behind default settings
+
+        Args:
+            app (Flask): Flask application
+        """
+        app.config.setdefault('WRITE_BEHIND', False)
+        app.config.setdefault('WRITE_BEHIND_BATCH_SIZE', 100)
+        app.config.setdefault('WRITE_BEHIND_FLUSH_SECONDS', 1)
+
+    def enabled(self):
+        """Verify if the write-behind mode was enabled for the current application"""
+        return has_app_context() and bool(current_app.config['WRITE_BEHIND'])
+
+    def add(self, obj, on_save=None):
+        """Queue an object to be inserted in the database
+
+        Args:
+            obj (db.Model): Database object to be inserted
+            on_save (function, optional): Function called with the object once it's
+            flushed, in the same transaction saving it. Defaults to None.
+
+        Returns:
+            int: Provisional id of the object
+        """
+        with self.__lock:
+            # The background worker saves the objects using the application queuing them.
+            self.__app = current_app._get_current_object()
+            provisional_id = -next(self.__provisional_ids)
+            self.__queue.append((provisional_id, obj))
+            self.__pending[provisional_id] = obj
+            if on_save is not None:
+                self.__on_save[provisional_id] = on_save
+            self.__shards[provisional_id] = shards.shard(db.session)
+            if len(self.__queue) >= self.__app.config['WRITE_BEHIND_BATCH_SIZE']:
+                self.__lock.notify_all()
+
+        self.__start_worker()
+        return provisional_id
+
+    def get(self, provisional_id: int):
+        """Get an object that hasn't been saved in the database yet
+
+        Args:
+            provisional_id (int): Provisional object id
+
+        Returns:
+            db.Model: Queued object | None
+        """
+        with self.__lock:
+            return self.__pending.get(provisional_id)
+
+    def update(self, provisional_id: int, **values):
+        """Update the values of an object that hasn't been saved in the database yet.
+        Objects being saved at the moment can't be updated. In that case, this method waits
+        until the object is saved.
+
+        Args:
+            provisional_id (int): Provisional object id
+            values: Object's attributes to be updated
+
+        Returns:
+            bool: True when the object was updated. False when it's already in the database.
+        """
+        with self.__lock:
+            self.__lock.wait_for(lambda: provisional_id not in self.__flushing)
+            obj = self.__pending.get(provisional_id)
+            if obj is None:
+                return False
+
+            for key, value in values.items():
+                setattr(obj, key, value)
+            return True
+
+    def pending(self, model, **filters):
+        """Get the queued objects of a particular model
+
+        Args:
+            model (db.Model): Model of the objects
+            filters: Attributes values the objects must match
+
+        Returns:
+            list: Queued objects
+        """
+        with self.__lock:
+            return [o for o in self.__pending.values()
+                    if isinstance(o, model) and
+                    all(getattr(o, k) == v for k, v in filters.items())]
+
+    def resolve(self, id):
+        """Translate a provisional id to the database id, once the object was saved.
+
+        Args:
+            id (int): Object id (provisional or not) | None
+
+        Returns:
+            int: Database id. The provisional id when the object wasn't saved yet.
+        """
+        if id is None or int(id) >= 0:
+            return id
+
+        with self.__lock:
+            return self.__resolved.get(int(id), int(id))
+
+    def lost(self, id):
+        """Verify if a provisional id can't be resolved: the object was discarded because
+        it couldn't be saved, or its database id was forgotten (saved before the last
+        RESOLVED_IDS_SIZE objects, or by a previous process).
+
+        Args:
+            id (int): Object id (provisional or not) | None
+
+        Returns:
+            bool: True when the provisional id can't be resolved
+        """
+        if id is None or int(id) >= 0:
+            return False
+
+        with self.__lock:
+            return int(id) not in self.__pending and int(id) not in self.__resolved
+
+    def flush(self):
+        """Save the queued objects in the database"""
+        while True:
+            with self.__lock:
+                batch = self.__queue[:self.__app.config['WRITE_BEHIND_BATCH_SIZE']] \
+                    if self.__app is not None else []
+                del self.__queue[:len(batch)]
+                self.__flushing.update(id for id, _ in batch)
+
+            if len(batch) == 0:
+                return
+
+            # Save the objects of every database in its own transaction
+            with self.__lock:
+                batches = {}
+                for id, o in batch:
+                    batches.setdefault(self.__shards.get(id), []).append((id, o))
+            ids = {}
+            for shard_id, objects in batches.items():
+                ids.update(self.__save(objects, shard_id))
+
+            # The saved objects already left the queue (see __commit)
+            with self.__lock:
+                while len(self.__resolved) > self.RESOLVED_IDS_SIZE:
+                    self.__resolved.popitem(last=False)
+                for provisional_id, _ in batch:
+                    self.__pending.pop(provisional_id, None)
+                    self.__on_save.pop(provisional_id, None)
+                    self.__shards.pop(provisional_id, None)
+                    self.__flushing.discard(provisional_id)
+                self.__lock.notify_all()
+
+    def __save(self, batch, shard_id):
+        """Save a batch of objects of the same database in a transaction.
+
+        Args:
+            batch (list): Provisional ids and objects to save
+            shard_id (int): Group database of the objects | None for the main database
+
+        Returns:
+            dict: Database ids indexed by provisional id
+        """
+        with self.__app.app_context():
+            if shard_id is not None:
+                shards.bind(db.session, shard_id)
+            try:
+                objs = [o for _, o in batch]
+                db.session.add_all(objs)
+                db.session.flush()
+                for id, o in batch:
+                    self.__call_on_save(id, o)
+                ids = {id: inspect(o).identity[0] for id, o in batch}
+                self.__commit(ids)
+                return ids
+            except SQLAlchemyError as e:
+                # Save the objects one by one. Just the invalid ones are discarded.
+                db.session.rollback()
+                self.__app.logger.error("Write-behind batch failed: %s" % str(e))
+                return self.__save_one_by_one(batch)
+
+    def __save_one_by_one(self, batch):
+        """Save each object of a batch in its own transaction.
+
+        Args:
+            batch (list): Provisional ids and objects to save
+
+        Returns:
+            dict: Database ids indexed by provisional id
+        """
+        ids = {}
+        for provisional_id, obj in batch:
+            # Discard the primary key assigned during the failed batch.
+            setattr(obj, inspect(obj).mapper.primary_key[0].key, None)
+            try:
+                db.session.add(obj)
+                db.session.flush()
+                self.__call_on_save(provisional_id, obj)
+                saved = {provisional_id: inspect(obj).identity[0]}
+                self.__commit(saved)
+                ids.update(saved)
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                self.__app.logger.error("Write-behind object discarded: %s" % str(e))
+        return ids
+
+    def __commit(self, ids: dict):
+        """Commit the saved objects and take them out of the queue at once, so the readers
+        adding the queued objects to the database rows never count them twice. The
+        transaction already holds the database write lock, and the commit doesn't wait for
+        the readers in the WAL journal mode (flask setting SQLITE_PRAGMAS).
+
+        Args:
+            ids (dict): Database ids indexed by provisional id
+        """
+        with self.__lock:
+            db.session.commit()
+            for provisional_id, id in ids.items():
+                self.__resolved[provisional_id] = id
+                self.__pending.pop(provisional_id, None)
+
+    def __call_on_save(self, provisional_id: int, obj):
+        """Call the function registered to be executed once the object is flushed"""
+        with self.__lock:
+            on_save = self.__on_save.get(provisional_id)
+        if on_save is not None:
+            on_save(obj)
+
+    def __start_worker(self):
+        """Start the background worker. The worker is started on the first write of every
+        process, so forked web workers get their own worker thread."""
+        if self.__worker is not None and self.__worker.is_alive():
+            return
+
+        with self.__lock:
+            if self.__worker is None or not self.__worker.is_alive():
+                self.__worker = threading.Thread(target=self.__work, daemon=True)
+                self.__worker.start()
+
+    def __work(self):
+        """Flush the queue every time a batch is full or the flush interval expires"""
+        while True:
+            with self.__lock:
+                self.__lock.wait_for(
+                    lambda: len(self.__queue) >= self.__app.config['WRITE_BEHIND_BATCH_SIZE'],
+                    timeout=self.__app.config['WRITE_BEHIND_FLUSH_SECONDS'])
+            self.flush()
+
+
+write_behind = WriteBehind()
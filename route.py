@@ -5,7 +5,9 @@ from view.ethics import Ethics
 from view.register import Register
 from view.item_preference import ItemsPreference
 from view.rank import Rank
+from view.rank_api import RankApi
 from view.logout import Logout
+from view.progress import ProgressDashboard
 from view.request import Request
 
 
@@ -38,6 +40,21 @@ def rank():
     return Request.process(Rank(current_app, session), request)
 
 
+@blueprint.route('/api/rank', methods=['GET', 'POST'])
+def rank_api():
+    return Request.process(RankApi(current_app, session), request)
+
+
 @blueprint.route('/logout', methods=['GET'])
 def logout():
     return Request.process(Logout(current_app, session), request)
+
+
+@blueprint.route('/admin/progress', methods=['GET', 'POST'])
+def progress():
+    return Request.process(ProgressDashboard(current_app, session), request)
+
+
+@blueprint.route('/admin/progress/stream', methods=['GET'])
+def progress_stream():
+    return ProgressDashboard(current_app, session).stream(request)
@@ -0,0 +1,60 @@
+function formatRatio(value) {
+  if (value === null) {
+    return '-';
+  }
+  return (100 * value).toFixed(1) + '%';
+}
+
+function formatNumber(value, decimals) {
+  if (value === null) {
+    return '-';
+  }
+  return value.toFixed(decimals);
+}
+
+function showProgress(progress) {
+  $('.progress-judgements').text(progress.judgements);
+  $('.progress-rate').text(progress.judgements_per_minute[progress.judgements_per_minute.length - 1]);
+  $('.progress-selected').text(progress.selected);
+  $('.progress-tied').text(progress.tied);
+  $('.progress-skipped').text(progress.skipped);
+  $('.progress-tie-ratio').text(formatRatio(progress.tie_ratio));
+  $('.progress-skip-ratio').text(formatRatio(progress.skip_ratio));
+  $('.progress-known-items').text(progress.known_items);
+  $('.progress-unknown-items').text(progress.unknown_items);
+  $('.progress-active-users').text(progress.active_users);
+  // Most recent minute first
+  $('.progress-minutes').text(progress.judgements_per_minute.slice().reverse().join(' '));
+
+  groups = $('.progress-groups').empty();
+  items = $('.progress-items').empty();
+  progress.groups.forEach(function (group) {
+    groups.append($('<tr>').append(
+      $('<td>').text(group.group_id),
+      $('<td>').text(group.judgements),
+      $('<td>').text(group.pairs),
+      $('<td>').text(formatRatio(group.pairs_judged)),
+      $('<td>').text(group.min_per_pair === null ? '-' : group.min_per_pair),
+      $('<td>').text(formatNumber(group.mean_per_pair, 2))
+    ));
+    group.items.forEach(function (item) {
+      items.append($('<tr>').append(
+        $('<td>').text(group.group_id),
+        $('<td>').text(item.name),
+        $('<td>').text(item.judgements)
+      ));
+    });
+  });
+}
+
+$(document).ready(function () {
+  dashboard = document.getElementById('progress');
+  if (dashboard === null || typeof EventSource === 'undefined') {
+    return;
+  }
+  // The browser reconnects by itself when the stream ends or is interrupted
+  source = new EventSource(dashboard.dataset.stream);
+  source.onmessage = function (event) {
+    showProgress(JSON.parse(event.data));
+  };
+});
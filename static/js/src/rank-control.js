@@ -147,4 +147,108 @@ function setSelectedItem(value) {
 
 $("img").click(function() {
 	hintItem($(this));
-});
\ No newline at end of file
+});
+
+// Submit the rank judgements through the JSON API. The next pair is rendered
+// in place without reloading the whole page. The regular form submission is
+// kept as fallback when the browser doesn't support the API calls.
+var rankSubmitter = null;
+
+$('#operational[data-api] button[name="state"]').click(function() {
+  rankSubmitter = $(this);
+});
+
+$('#operational[data-api]').submit(function(event) {
+  if (!window.fetch || !window.FormData || rankSubmitter === null) {
+    return true;
+  }
+
+  // Take over the form submission, including the double posting prevention.
+  event.preventDefault();
+  event.stopImmediatePropagation();
+  var form = $(this);
+  if (form.data().isSubmitted) {
+    return false;
+  }
+  form.data().isSubmitted = true;
+
+  var data = new FormData(this);
+  data.append('state', rankSubmitter.val());
+  var state = rankSubmitter.val();
+  rankSubmitter = null;
+
+  postJudgement(form, data, state);
+  return false;
+});
+
+function postJudgement(form, data, state) {
+  fetch(form.get(0).dataset.api, {
+    method: 'POST',
+    body: data,
+    credentials: 'same-origin',
+    headers: {'Accept': 'application/json'}
+  }).then(function(response) {
+    if (response.status == 200) {
+      return response.json().then(renderPair);
+    }
+    if (response.status == 401) {
+      return response.json().then(function(content) {
+        window.location.href = content.redirect;
+      });
+    }
+    if (response.status == 503) {
+      // The server is busy. Send the same judgement again once it asks to.
+      var seconds = parseInt(response.headers.get('Retry-After')) || 5;
+      setTimeout(function() { postJudgement(form, data, state); }, seconds * 1000);
+      return;
+    }
+    // No pairs left to compare or unexpected condition. The server renders the right page.
+    window.location.href = window.location.pathname;
+  }).catch(function() {
+    // The API wasn't reachable. Fallback to the regular form submission.
+    submitForm(form, state);
+  });
+}
+
+function submitForm(form, state) {
+  $('<input>').attr({type: 'hidden', name: 'state', value: state}).appendTo(form);
+  form.get(0).submit();
+}
+
+function renderPair(pair) {
+  item1 = document.getElementById("left-item");
+  item2 = document.getElementById("right-item");
+
+  // Clean the previous judgement
+  cleanVisualHint('selected-item', item1, item2);
+  cleanVisualHint('selection-tied', item1, item2);
+  deactivateConfirmButton();
+  setSelectedItem("");
+
+  // Render the new pair of items
+  item1.src = pair.item_1.image_url;
+  item2.src = pair.item_2.image_url;
+  document.getElementById('left-item-name').textContent = pair.item_1.display_name;
+  document.getElementById('right-item-name').textContent = pair.item_2.display_name;
+  document.getElementById('item_1_id').value = pair.item_1.item_id;
+  document.getElementById('item_2_id').value = pair.item_2.item_id;
+  document.getElementById('comparison_id').value = pair.comparison_id === null ? "" : pair.comparison_id;
+  document.getElementById('pair_token').value = pair.pair_token === null ? "" : pair.pair_token;
+
+  // Update the comparison state
+  $(".comparison-number").text(pair.comparison_number);
+  $(".skipped-number").text(pair.skipped_number);
+  $(".rejudge-button").prop('disabled', !pair.can_rejudge);
+  $(".rejudge-button").toggleClass('disabled', !pair.can_rejudge);
+
+  prefetchItems([pair.next_item_1, pair.next_item_2]);
+  $('#operational').data().isSubmitted = false;
+}
+
+function prefetchItems(items) {
+  items.forEach(function(item) {
+    if (item) {
+      (new Image()).src = item.image_url;
+    }
+  });
+}
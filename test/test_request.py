@@ -1,17 +1,43 @@
+import click
 import pytest
+import runpy
 import shutil
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+import json
+import os
+import numpy as np
 from os.path import exists
-from flask import session
+from flask import g, session
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
 # Custom libraries
-from model.schema import WebsiteControl, User, Comparison
-from model.connection import db
+from model.schema import (WebsiteControl, User, Comparison, UserStatistic, Item,
+                          CustomItemPair, UserItem)
+from model.statistics import Statistics
+from model.connection import db, shards
+from model.write_behind import write_behind
+from model.cache import (SetupCache, ItemCache, GroupCache, FragmentCache, KnownItems,
+                         PairQueue, SubmittedPairs)
+from model.coverage import GroupCoverage, Coverage
+from model.weight_matrix import WeightMatrix
+from model.ranking import BradleyTerry
+from model.bootstrap import Bootstrap
+from model.simulation import Simulation
+from model.progress import Progress
+from view.rank import Rank
 from configuration.website import Settings as WS
 from configuration.flask import Settings
 from website import create_app
+from admission import admission
 
 # Configuration location
 conf_equal_weight = "example/config-equal-item-weights.json"
 conf_custom_weight = "example/config-custom-item-weights.json"
+conf_matrix_weight = "example/config-matrix-item-weights.json"
 user_data = {
     'name': 'Dummy test',
     'gender': 'Prefer not to say',
@@ -64,6 +90,180 @@ def test_setup_equal_weights(clear_files, runner, app):
         assert conf.configuration_file == config_file
 
 
+def test_sqlite_pragmas(app):
+    with app.app_context():
+        assert db.session.execute("PRAGMA journal_mode").scalar() == "wal"
+        assert db.session.execute("PRAGMA synchronous").scalar() == 1  # NORMAL
+        assert db.session.execute("PRAGMA busy_timeout").scalar() == \
+            Settings.SQLITE_PRAGMAS['busy_timeout']
+
+
+def test_warmup(app):
+    SetupCache.clear()
+    warm_app = create_app()
+    assert ItemCache.data is not None and len(ItemCache.data) > 0
+    assert GroupCache.data is not None and len(GroupCache.data) > 0
+    assert len(warm_app.jinja_env.cache) > 0
+    with app.app_context():
+        assert ItemCache.version == WebsiteControl().get_conf().setup_exec_date
+
+
+def test_gunicorn_single_worker(app):
+    # The write-behind queue can't be shared by several workers
+    settings = runpy.run_path('gunicorn.conf.py')
+    errors = []
+
+    class Server:
+        num_workers = 4
+        log = type('Log', (), {'error': lambda self, message: errors.append(message)})()
+
+    Server.app = type('Application', (), {'wsgi': lambda self: app})()
+    settings['on_starting'](Server)
+    assert Server.num_workers == 4 and errors == []
+    app.config.update({"WRITE_BEHIND": True})
+    settings['on_starting'](Server)
+    app.config.update({"WRITE_BEHIND": False})
+    assert Server.num_workers == 1 and len(errors) == 1
+
+
+def test_warmup_skipped(app, monkeypatch):
+    # The commands don't warm up the application
+    SetupCache.clear()
+    with click.Context(click.Command('setup')):
+        create_app()
+    assert ItemCache.data is None
+
+    # An invalid configuration doesn't stop the application creation
+    def invalid(app):
+        exit()
+    monkeypatch.setattr(WS, 'get_configuration', invalid)
+    create_app()
+    assert ItemCache.data is None
+
+
+def test_web_import_graph():
+    # The web workers don't load the command line only libraries.
+    heavy = ['pandas', 'cv2', 'marshmallow', 'migrate']
+    result = subprocess.run([sys.executable, '-c', 'import sys, website; print('
+                            '[m for m in {!r} if m in sys.modules])'.format(heavy)],
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
+
+
+def test_static_assets():
+    # The setup command built the hashed and precompressed static assets.
+    built_app = create_app()
+    client = built_app.test_client()
+    response = client.get("/introduction")
+    css = built_app.extensions['assets']['css/custom-style.css']
+    assert '/assets/' + css in response.data.decode()
+
+    response = client.get('/assets/' + css, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in response.headers['Cache-Control']
+    response.close()
+
+
+def test_cacheable_pages(client):
+    response = client.get("/introduction", headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Last-Modified'] is not None
+    etag = response.headers['ETag']
+
+    response = client.get("/introduction", headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_page_cache(app, client):
+    assert client.get("/ethics-agreement").status_code == 200
+
+    # The cached page is served without template rendering nor database access
+    # between the integrity checks.
+    app.config.update({"INTEGRITY_CHECK_SECONDS": 60})
+    queries = []
+
+    def count(*args):
+        queries.append(args)
+
+    engine = db.get_engine(app)
+    event.listen(engine, 'before_cursor_execute', count)
+    html, _ = FragmentCache.data['page/ethics.html']
+    response = client.get("/ethics-agreement")
+    event.remove(engine, 'before_cursor_execute', count)
+    app.config.update({"INTEGRITY_CHECK_SECONDS": 0})
+    assert response.status_code == 200
+    assert response.data.decode() == html
+    assert len(queries) == 0
+
+
+def test_coverage_aware_selection():
+    group = GroupCoverage(1, list(range(1, 11)))
+    rng = np.random.default_rng(0)
+    # Every pair is drawn once before any pair is drawn again.
+    pairs = set()
+    for _ in range(45):
+        item_1_id, item_2_id = group.least_judged_pair(rng)
+        group.record(item_1_id, item_2_id)
+        pairs.add((min(item_1_id, item_2_id), max(item_1_id, item_2_id)))
+    assert len(pairs) == 45
+    assert (group.pair_counts == 1).all() and (group.item_counts == 9).all()
+
+    # The pairs can be restricted to a subset of items
+    group.record(2, 3)
+    assert set(group.least_judged_pair(rng, [2, 3, 5])) in [{2, 5}, {3, 5}]
+
+    # Pairs positions in the triangular array. Pairs out of the group are -1.
+    k = group.pair_indexes([1, 3, 10, 1, 11], [2, 2, 9, 1, 1])
+    assert list(k) == [0, group.pair_index(1, 2), 44, -1, -1]
+
+
+def test_instrumentation(runner, monkeypatch):
+    instrumented_app = create_app({"INSTRUMENTATION": True, "INSTRUMENTATION_PROFILE_RATE": 1,
+                                   "INSTRUMENTATION_PROFILE_MAX_FILES": 1,
+                                   "ADMIN_TOKEN": "secret"})
+    client = instrumented_app.test_client()
+    assert client.get("/introduction").status_code == 200
+    assert client.get("/introduction").status_code == 200
+
+    # The metrics require the administration token
+    assert client.get("/metrics").status_code == 404
+    assert client.get("/metrics", headers={'Authorization': 'Bearer wrong'}).status_code == 404
+    response = client.get("/metrics", headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    metrics = response.data.decode()
+    assert 'comparison_requests_total{endpoint="views.introduction",method="GET"} 2' in metrics
+    assert 'comparison_sql_queries_total{endpoint="views.introduction",method="GET"}' in metrics
+    assert 'comparison_request_duration_seconds_count' in metrics
+    # Just the latest profiles are kept
+    profiles = Settings.INSTRUMENTATION_PROFILE_LOCATION + 'views.introduction'
+    assert len(os.listdir(profiles)) == 1
+
+    # A failed query doesn't disturb the measures of the next ones. Every reading of the
+    # clock advances it half a second.
+    clock = {'now': 0.0}
+
+    def perf_counter():
+        clock['now'] += 0.5
+        return clock['now']
+
+    with instrumented_app.test_request_context(), monkeypatch.context() as m:
+        m.setattr(time, 'perf_counter', perf_counter)
+        g.instrumentation = {'start': 0, 'queries': 0, 'sql_seconds': 0.0,
+                             'template_seconds': 0.0, 'profile': None}
+        with db.get_engine(instrumented_app).connect() as conn:
+            with pytest.raises(OperationalError):
+                conn.execute(text("select * from missing_table"))
+            assert g.instrumentation['queries'] == 0
+            # A start time left behind by the failed query would add these 100 seconds.
+            clock['now'] += 100
+            conn.execute(text("select 1"))
+        assert g.instrumentation['queries'] == 1
+        assert g.instrumentation['sql_seconds'] == 0.5
+
+
 def test_render_404(client):
     response = client.get("/not-exist")
     assert response.status_code == 404
@@ -95,6 +295,19 @@ def test_render_user_register(client):
     assert response.status_code == 200
 
 
+def test_template_caches(client):
+    # The templates were compiled into the bytecode cache by the setup command.
+    assert len(os.listdir(Settings.JINJA_BYTECODE_CACHE_LOCATION)) > 0
+    # The registry components are rendered once and reused.
+    components = FragmentCache.data['register_components']
+    response = client.get("/register")
+    assert response.status_code == 200
+    assert FragmentCache.data['register_components'] is components
+    # Every cache has its own lock
+    assert len({id(c.lock) for c in [SetupCache, ItemCache, GroupCache, FragmentCache,
+                                     KnownItems, Coverage]}) == 6
+
+
 def test_register_user(client, app):
     with client:
         response = client.post("/register", data=user_data)
@@ -127,6 +340,41 @@ def test_register_prefer_item_selection(client, app):
         assert response.request.path == "/selection/items"
 
 
+def test_known_items_cache(client, app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with client:
+        client.post("/register", data=user_data)
+        user_id = session['user_id']
+        # State every item preference until the user is moved to the rank page.
+        response = client.get("/selection/items")
+        while response.status_code == 200:
+            item_id = response.get_data(as_text=True).split('name="item_id" value="')[1]
+            client.post("/selection/items", data={
+                'action': 'agree',
+                'item_id': item_id.split('"')[0],
+            })
+            response = client.get("/selection/items")
+        assert response.location.endswith("/rank")
+
+        with app.app_context():
+            known = KnownItems.get(user_id)
+            engine = db.get_engine(app)
+        assert len(known) >= 2
+        assert list(known) == sorted(set(known))
+
+        # Drawing the preferred pairs doesn't query the user's preferences again.
+        event.listen(engine, 'before_cursor_execute', record)
+        pair = client.get("/api/rank").json
+        event.remove(engine, 'before_cursor_execute', record)
+        assert pair['item_1']['item_id'] in known
+        assert pair['item_2']['item_id'] in known
+        assert not any('user_item' in s for s in statements)
+
+
 def test_reset_custom_weights(runner, app):
     config_file = conf_custom_weight
     result = runner.invoke(args=["reset", config_file])
@@ -203,3 +451,650 @@ def test_register_skipped_rank_comparison(client, app):
             assert comp.state == 'skipped'
             assert comp.item_1_id == 1
             assert comp.item_2_id == 2
+
+
+def test_render_rank_prefetch_next_comparison(client):
+    with client:
+        client.post("/register", data=user_data)
+        response = client.get("/rank")
+        assert response.status_code == 200
+        assert b'rel="prefetch"' in response.data
+
+        # The reserved pair is the one rendered on the next page.
+        next_item_ids = session['next_item_ids']
+        assert len(next_item_ids) == 2
+        response = client.get("/rank")
+        assert 'name="item_1_id" value={}>'.format(next_item_ids[0]).encode() in response.data
+        assert 'name="item_2_id" value={}>'.format(next_item_ids[1]).encode() in response.data
+
+
+def test_rank_api_invalid_session(client):
+    with client:
+        client.get("/logout")
+        response = client.get("/api/rank")
+        assert response.status_code == 401
+        assert response.json['redirect'] == "/register"
+
+
+def test_rank_api_get_pair(client):
+    with client:
+        client.post("/register", data=user_data)
+        response = client.get("/api/rank")
+        assert response.status_code == 200
+        assert response.json['comparison_id'] is None
+        assert response.json['can_rejudge'] is False
+        assert response.json['comparison_number'] == 0
+        assert response.json['item_1']['image_url'].startswith("/assets/image/")
+        assert response.json['item_2']['item_id'] != response.json['item_1']['item_id']
+
+
+def test_rank_api_judgement_and_rejudge(client, app):
+    with client:
+        client.post("/register", data=user_data)
+        pair = client.get("/api/rank").json
+        response = client.post("/api/rank", data={
+            'state': 'confirmed',
+            'item_1_id': pair['item_1']['item_id'],
+            'item_2_id': pair['item_2']['item_id'],
+            'selected_item_id': pair['item_2']['item_id'],
+        })
+        # The next pair is the one prefetched with the previous response.
+        assert response.status_code == 200
+        assert response.json['item_1'] == pair['next_item_1']
+        assert response.json['item_2'] == pair['next_item_2']
+        assert response.json['comparison_number'] == 1
+        assert response.json['can_rejudge'] is True
+
+        with app.app_context():
+            comp = db.session.query(Comparison).\
+                where(Comparison.comparison_id == session['previous_comparison_id']).first()
+            assert comp.state == 'selected'
+            assert comp.selected_item_id == pair['item_2']['item_id']
+
+        # Rejudge the comparison just made.
+        response = client.post("/api/rank", data={'state': 'rejudged'})
+        assert response.status_code == 200
+        assert response.json['comparison_id'] == comp.comparison_id
+        assert response.json['can_rejudge'] is False
+        # The rejudged items keep the same placement they had in the comparison.
+        assert response.json['item_1']['item_id'] == comp.item_1_id
+        assert response.json['item_2']['item_id'] == comp.item_2_id
+
+
+def test_rank_repeated_submission(client, app):
+    with client:
+        client.post("/register", data=user_data)
+        pair = client.get("/api/rank").json
+        assert pair['pair_token']
+        judgement = {
+            'state': 'skipped',
+            'item_1_id': pair['item_1']['item_id'],
+            'item_2_id': pair['item_2']['item_id'],
+            'pair_token': pair['pair_token'],
+        }
+        response = client.post("/api/rank", data=judgement)
+        assert response.json['skipped_number'] == 1
+        assert response.json['pair_token'] != pair['pair_token']
+
+        # Submitting the same page again (e.g. a network retry) saves nothing
+        response = client.post("/api/rank", data=judgement)
+        assert response.json['skipped_number'] == 1
+        assert len(session['comparison_ids']) == 1
+
+        # Also after the user's tokens were dropped from the memory
+        SubmittedPairs.discard(session['user_id'])
+        response = client.post("/rank", data=judgement)
+        assert response.status_code == 302
+        assert len(session['comparison_ids']) == 1
+        with app.app_context():
+            assert db.session.query(Comparison).\
+                where(Comparison.pair_token == pair['pair_token']).count() == 1
+
+
+def test_rank_no_repeated_pairs(client, app):
+    app.config.update({"CUSTOM_WEIGHTS_UNSEEN_FIRST": True})
+    with client:
+        # The first group of the custom weights example has 3 item pairs.
+        client.post("/register", data=user_data)
+        pair = client.get("/api/rank").json
+        shown = [pair['item_1']['item_id'], pair['item_2']['item_id']]
+        shown = [frozenset(shown),
+                 frozenset([pair['next_item_1']['item_id'], pair['next_item_2']['item_id']])]
+        response = client.post("/api/rank", data={
+            'state': 'skipped',
+            'item_1_id': pair['item_1']['item_id'],
+            'item_2_id': pair['item_2']['item_id'],
+        })
+        pair = response.json
+        shown.append(frozenset([pair['next_item_1']['item_id'], pair['next_item_2']['item_id']]))
+        assert len(set(shown)) == 3
+
+
+def test_rank_pair_queue(client, app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with client:
+        client.post("/register", data=user_data)
+        with app.app_context():
+            engine = db.get_engine(app)
+
+        # The 3 pairs of the first group are drawn at once: the current, the next and
+        # the following one are taken from the user's queue.
+        event.listen(engine, 'before_cursor_execute', record)
+        pair = client.get("/api/rank").json
+        client.post("/api/rank", data={
+            'state': 'skipped',
+            'item_1_id': pair['item_1']['item_id'],
+            'item_2_id': pair['item_2']['item_id'],
+        })
+        event.remove(engine, 'before_cursor_execute', record)
+        assert len([s for s in statements if 'custom_item_pair' in s]) == 1
+        assert len(PairQueue.get(session['user_id'])) == 0
+
+
+def test_rank_generator(client, app):
+    with client:
+        client.post("/register", data=user_data)
+        assert session['random_draws'] == 0
+        client.get("/api/rank")
+        user_id = session['user_id']
+        assert session['random_draws'] == 1
+
+    # The draws of every user can be replayed from the study seed.
+    with app.app_context():
+        replay = Rank.generator(app, user_id, 0).random(5)
+        assert (Rank.generator(app, user_id, 0).random(5) == replay).all()
+        assert (Rank.generator(app, user_id, 1).random(5) != replay).all()
+        assert (Rank.generator(app, user_id + 1, 0).random(5) != replay).all()
+
+
+def test_rank_write_behind(client, app):
+    app.config.update({"WRITE_BEHIND": True})
+    with client:
+        client.post("/register", data=user_data)
+        pair = client.get("/api/rank").json
+        response = client.post("/api/rank", data={
+            'state': 'skipped',
+            'item_1_id': pair['item_1']['item_id'],
+            'item_2_id': pair['item_2']['item_id'],
+        })
+        assert response.json['skipped_number'] == 1
+
+        # The comparison is queued under a provisional id and can be rejudged.
+        provisional_id = session['previous_comparison_id']
+        assert provisional_id < 0
+        response = client.post("/api/rank", data={'state': 'rejudged'})
+        assert response.json['comparison_id'] == provisional_id
+        response = client.post("/api/rank", data={
+            'state': 'confirmed',
+            'comparison_id': provisional_id,
+            'item_1_id': pair['item_1']['item_id'],
+            'item_2_id': pair['item_2']['item_id'],
+        })
+        assert response.json['comparison_number'] == 1
+        assert response.json['skipped_number'] == 0
+
+        write_behind.flush()
+        app.config.update({"WRITE_BEHIND": False})
+        comparison_id = write_behind.resolve(provisional_id)
+        assert comparison_id > 0
+
+        with app.app_context():
+            comp = db.session.query(Comparison).\
+                where(Comparison.comparison_id == comparison_id).first()
+            assert comp.user_id == session['user_id']
+            assert comp.state == 'tied'
+            # The statistics were saved together with the queued comparison.
+            assert Statistics.user(comp.user_id)['ties'] == 1
+
+        # The session ids are replaced once the comparison was saved.
+        client.get("/api/rank")
+        assert session['comparison_ids'] == [comparison_id]
+
+
+def test_rank_concurrent_rejudge(app, monkeypatch):
+    rejudging, judging = app.test_client(), app.test_client()
+    pairs = {}
+    for name, user in [('rejudging', rejudging), ('judging', judging)]:
+        user.post("/register", data=user_data)
+        pairs[name] = user.get("/api/rank").json
+    pair = pairs['rejudging']
+    rejudging.post("/api/rank", data={
+        'state': 'skipped',
+        'item_1_id': pair['item_1']['item_id'],
+        'item_2_id': pair['item_2']['item_id'],
+    })
+    comparison_id = rejudging.post("/api/rank", data={'state': 'rejudged'}).json['comparison_id']
+
+    # The new judgement holds the database write lock while the rejudge records its
+    # statistics.
+    inserted, rejudge_started = threading.Event(), threading.Event()
+    record = Statistics.record
+
+    def racing_record(comparison, previous_state=None, previous_selected_item_id=None):
+        if previous_state is None:
+            inserted.set()
+            rejudge_started.wait(1)
+            time.sleep(0.2)
+        else:
+            inserted.wait(1)
+            rejudge_started.set()
+        record(comparison, previous_state, previous_selected_item_id)
+    monkeypatch.setattr(Statistics, 'record', racing_record)
+
+    responses = {}
+
+    def post(name, user, data):
+        start = time.monotonic()
+        responses[name] = (user.post("/api/rank", data=data), time.monotonic() - start)
+
+    threads = [
+        threading.Thread(target=post, args=('judging', judging, {
+            'state': 'skipped',
+            'item_1_id': pairs['judging']['item_1']['item_id'],
+            'item_2_id': pairs['judging']['item_2']['item_id']})),
+        threading.Thread(target=post, args=('rejudging', rejudging, {
+            'state': 'confirmed',
+            'comparison_id': comparison_id,
+            'item_1_id': pair['item_1']['item_id'],
+            'item_2_id': pair['item_2']['item_id']}))
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # Neither request waits for the database lock timeout
+    busy_timeout = Settings.SQLITE_PRAGMAS['busy_timeout'] / 1000
+    for response, seconds in responses.values():
+        assert response.status_code == 200
+        assert seconds < busy_timeout
+    assert responses['rejudging'][0].json['skipped_number'] == 0
+
+
+def test_rank_write_behind_discarded(client, app):
+    app.config.update({"WRITE_BEHIND": True})
+    with client:
+        client.post("/register", data=user_data)
+        pair = client.get("/api/rank").json
+        client.post("/api/rank", data={
+            'state': 'skipped',
+            'item_1_id': pair['item_1']['item_id'],
+            'item_2_id': pair['item_2']['item_id'],
+        })
+        provisional_id = session['previous_comparison_id']
+
+        # The queued comparison can't be saved, so it's discarded by the queue.
+        write_behind.get(provisional_id).item_1_id = None
+        write_behind.flush()
+        app.config.update({"WRITE_BEHIND": False})
+        assert write_behind.lost(provisional_id)
+
+        # The discarded comparison is dropped from the session and can't be rejudged.
+        response = client.get("/api/rank")
+        assert response.status_code == 200
+        assert session['comparison_ids'] == []
+        assert session['previous_comparison_id'] is None
+        assert not response.json['can_rejudge']
+
+        # Pages drawn before can't rejudge it either, nor any id unknown to the queue
+        # (e.g. forgotten or queued by a previous process).
+        for comparison_id in [provisional_id, -10 ** 9]:
+            response = client.post("/api/rank", data={
+                'state': 'skipped',
+                'comparison_id': comparison_id,
+                'item_1_id': pair['item_1']['item_id'],
+                'item_2_id': pair['item_2']['item_id'],
+            })
+            assert response.status_code == 200
+            assert response.json['skipped_number'] == 0
+
+
+def test_write_behind_pending(app):
+    # The saved objects leave the queue when their commit is visible, so the queued
+    # judgements are never counted twice.
+    app.config.update({"WRITE_BEHIND": True})
+    counts = []
+    with app.app_context():
+        user_id = db.session.query(User.user_id).first()[0]
+
+        def on_save(c):
+            counts.append(len(write_behind.pending(Comparison, user_id=user_id)))
+        c = Comparison(user_id=user_id, item_1_id=1, item_2_id=2, state=Comparison.TIED)
+        provisional_id = write_behind.add(c, on_save)
+        write_behind.flush()
+        app.config.update({"WRITE_BEHIND": False})
+        # Still queued while being saved (not committed), out of the queue once committed
+        assert counts == [1]
+        assert write_behind.pending(Comparison, user_id=user_id) == []
+        comparison_id = write_behind.resolve(provisional_id)
+        assert comparison_id > 0 and not write_behind.lost(provisional_id)
+        db.session.query(Comparison).where(Comparison.comparison_id == comparison_id).delete()
+        db.session.commit()
+
+
+def test_progress_dashboard(client, app):
+    # The page is disabled without administration token
+    assert client.get("/admin/progress").status_code == 404
+    app.config.update({"ADMIN_TOKEN": "secret", "PROGRESS_STREAM_MAX_SECONDS": 0})
+    response = client.get("/admin/progress")
+    assert b'name="token"' in response.data
+    assert b'progress-dashboard.js' not in response.data
+    assert client.post("/admin/progress", data={'token': 'wrong'}).status_code == 404
+    assert client.get("/admin/progress/stream").status_code == 404
+    response = client.get("/admin/progress", headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert b'progress-dashboard.js' in response.data
+
+    # The token typed in the form keeps the administrator signed in
+    admin = app.test_client()
+    assert admin.post("/admin/progress", data={'token': 'secret'}).status_code == 302
+    response = admin.get("/admin/progress")
+    assert b'progress-dashboard.js' in response.data
+    assert b'token=' not in response.data
+
+    # The judgements are counted by the write path
+    with app.app_context():
+        before = Progress.snapshot()
+    with client:
+        client.post("/register", data=user_data)
+        pair = client.get("/api/rank").json
+        client.post("/api/rank", data={
+            'state': 'skipped',
+            'item_1_id': pair['item_1']['item_id'],
+            'item_2_id': pair['item_2']['item_id'],
+        })
+
+    # The events are built without querying the database
+    queries = []
+    engine = db.get_engine(app)
+
+    def count(*args):
+        queries.append(args)
+    response = admin.get("/admin/progress/stream")
+    assert response.mimetype == 'text/event-stream'
+    event.listen(engine, "before_cursor_execute", count)
+    # The stream ends after PROGRESS_STREAM_MAX_SECONDS and the browser reconnects
+    events = [e.decode() for e in response.response]
+    response.close()
+    event.remove(engine, "before_cursor_execute", count)
+    app.config.update({"ADMIN_TOKEN": None, "PROGRESS_STREAM_MAX_SECONDS": 300})
+    assert queries == []
+
+    assert len(events) == 1
+    retry, data = events[0].split('\n', 1)
+    assert retry == 'retry: {}'.format(app.config['PROGRESS_STREAM_SECONDS'] * 1000)
+    assert data.startswith('data: ')
+    progress = json.loads(data[len('data: '):])
+    assert progress['skipped'] == before['skipped'] + 1
+    assert progress['judgements_per_minute'][-1] >= 1
+    assert progress['active_users'] >= 1
+    assert len(progress['groups']) > 0
+
+
+def test_admission_control():
+    admitted_app = create_app({"ADMISSION_CONTROL": True, "ADMISSION_MAX_WRITES": 2,
+                               "ADMISSION_WAIT_SECONDS": 0})
+    participant = admitted_app.test_client()
+    assert participant.post("/register", data=user_data).status_code == 302
+    new_user = admitted_app.test_client()
+    with admitted_app.app_context():
+        assert admission.acquire(True)
+    try:
+        # The last write slot is kept for the registered participants
+        response = new_user.post("/register", data=user_data)
+        assert response.status_code == 503
+        assert b'Please wait' in response.data
+        assert response.headers['Retry-After'] == \
+            str(admitted_app.config['ADMISSION_RETRY_SECONDS'])
+        pair = participant.get("/api/rank").json
+        response = participant.post("/api/rank", data={
+            'state': 'skipped',
+            'item_1_id': pair['item_1']['item_id'],
+            'item_2_id': pair['item_2']['item_id'],
+        }, headers={'Accept': 'application/json'})
+        assert response.status_code == 200
+
+        # Every slot is taken
+        with admitted_app.app_context():
+            assert admission.acquire(True)
+        response = participant.post("/api/rank", data={'state': 'rejudged'},
+                                    headers={'Accept': 'application/json'})
+        assert response.status_code == 503
+        assert response.json['retry_after'] == admitted_app.config['ADMISSION_RETRY_SECONDS']
+        admission.release()
+    finally:
+        admission.release()
+
+    assert new_user.post("/register", data=user_data).status_code == 302
+
+
+def test_coverage_refresh(app):
+    with app.app_context():
+        coverage = Coverage.load()
+        group_id = next(iter(coverage))
+        item_1_id, item_2_id = coverage[group_id].item_ids[:2].tolist()
+        total = coverage[group_id].total()
+
+        # A judgement saved by another process is counted once the coverage is refreshed
+        c = Comparison(user_id=999, item_1_id=item_1_id, item_2_id=item_2_id,
+                       state=Comparison.TIED)
+        db.session.add(c)
+        db.session.commit()
+        rng = np.random.default_rng(0)
+        Coverage.draw_pair([group_id], rng)
+        assert Coverage.load()[group_id].total() == total
+        Coverage.loaded -= app.config['COVERAGE_REFRESH_SECONDS']
+        Coverage.draw_pair([group_id], rng)
+        assert Coverage.load()[group_id].total() == total + 1
+
+        db.session.delete(c)
+        db.session.commit()
+        SetupCache.clear()
+
+
+def test_statistics(app, runner):
+    user_id = 999
+    with app.app_context():
+        # Intransitive judgements: 1 > 2 > 3 > 1
+        comparisons = []
+        for winner, loser in [(1, 2), (2, 3), (3, 1)]:
+            c = Comparison(user_id=user_id, item_1_id=winner, item_2_id=loser,
+                           state=Comparison.SELECTED, selected_item_id=winner)
+            db.session.add(c)
+            db.session.flush()
+            Statistics.record(c)
+            comparisons.append(c)
+        db.session.commit()
+
+        stats = Statistics.user(user_id)
+        assert stats['decisive'] == 3
+        assert stats['triads'] == 1
+        assert stats['intransitive_triads'] == 1
+        assert stats['intransitivity'] == 1
+
+        # Rejudging 3 > 1 as 1 > 3 makes the triad transitive.
+        c = comparisons[2]
+        c.selected_item_id = 1
+        Statistics.record(c, Comparison.SELECTED, 3)
+        db.session.commit()
+        stats = Statistics.user(user_id)
+        assert stats['decisive'] == 3
+        assert stats['triads'] == 1
+        assert stats['intransitive_triads'] == 0
+
+        # The online statistics match the ones recomputed from every comparison.
+        online = {r['user_id']: r for r in Statistics.users()}
+        Statistics.rebuild()
+        for r in Statistics.users():
+            for column in ['decisive', 'ties', 'skipped', 'triads', 'intransitive_triads',
+                           'consensus_judgements', 'consensus_agreements']:
+                assert r[column] == online[r["user_id"]][column], (r, online[r["user_id"]])
+            assert r['misfit'] == pytest.approx(online[r["user_id"]]['misfit'])
+        assert db.session.query(UserStatistic).count() == len(online)
+
+    result = runner.invoke(args=["statistics"])
+    assert "intransitivity" in result.output
+
+
+def test_upgrade(app, runner):
+    # Database of a previous version: no statistics and no stored contributions
+    with app.app_context():
+        online = {r['user_id']: r for r in Statistics.users()}
+        db.session.execute(text("DROP TABLE user_statistic"))
+        for column in ['consensus_agreement', 'misfit']:
+            db.session.execute(text("ALTER TABLE comparison DROP COLUMN " + column))
+        db.session.commit()
+
+    result = runner.invoke(args=["upgrade"])
+    assert result.exit_code == 0
+
+    # The judgements are kept and the statistics rebuilt
+    with app.app_context():
+        columns = [c['name'] for c in db.inspect(db.engine).get_columns('comparison')]
+        assert 'consensus_agreement' in columns and 'misfit' in columns
+        assert db.session.query(Comparison).where(Comparison.state == Comparison.SELECTED,
+                                                  Comparison.misfit.is_(None)).count() == 0
+        users = {r['user_id']: r for r in Statistics.users()}
+        assert users.keys() == online.keys()
+        for user_id, r in users.items():
+            assert r['decisive'] == online[user_id]['decisive']
+
+
+def test_bootstrap(app, runner):
+    with app.app_context():
+        for by in ['rater', 'judgement']:
+            rows = Bootstrap.intervals(replicates=40, by=by, processes=2 if by == 'rater' else 1)
+            judged = [r for r in rows if r['comparisons'] > 0]
+            assert len(judged) > 0
+            for r in judged:
+                assert r['lower'] <= r['upper'] and r['standard_error'] >= 0
+        location = WS.get_export_location(app)
+
+    result = runner.invoke(args=["bootstrap", "--replicates", "20"])
+    assert result.exit_code == 0
+    assert "upper" in result.output
+    with zipfile.ZipFile(location) as f:
+        assert 'item_score_interval' in f.read('xl/workbook.xml').decode()
+
+
+def test_simulation(runner):
+    # The Bradley-Terry fit recovers the order of items always beating the next ones.
+    wins = np.triu(np.full((4, 4), 10.0), 1)
+    assert list(np.argsort(-BradleyTerry.fit(wins))) == [0, 1, 2, 3]
+
+    results = Simulation.run(items=20, strategy='coverage', raters=100, judgements=10, seed=1)
+    assert [r['per_pair'] for r in results] == sorted(r['per_pair'] for r in results)
+    # Every pair is judged before any pair is judged again.
+    assert results[-1]['pairs_judged'] == 1
+    assert results[-1]['spearman'] > 0.8
+
+    result = runner.invoke(args=["simulate", "--conf", conf_custom_weight, "--raters", "20",
+                                 "--judgements", "5", "--repeats", "1"])
+    assert result.exit_code == 0
+    assert "spearman" in result.output and "custom" in result.output
+
+
+def test_weight_matrix(runner, app, client):
+    result = runner.invoke(args=["reset", conf_matrix_weight])
+    assert result.exit_code == 0
+
+    with app.app_context():
+        # The weights aren't saved pair by pair.
+        assert db.session.query(CustomItemPair).count() == 0
+        names = {i.name: i.item_id for i in db.session.query(Item).all()}
+        weights = WeightMatrix.get(1)
+        assert isinstance(weights, np.memmap)
+        # The weights follow the group triangular pair index (items sorted by id).
+        group = GroupCoverage(1, [names['wales'], names['scotland'], names['northern_ireland']])
+        expected = {('wales', 'scotland'): 0.2, ('northern_ireland', 'wales'): 0.3,
+                    ('scotland', 'northern_ireland'): 0.5}
+        for (item_1, item_2), weight in expected.items():
+            k = group.pair_indexes([names[item_1]], [names[item_2]])[0]
+            assert weights[k] == weight
+
+    assert WeightMatrix.validate_matrix(np.ones((2, 3)), 3) is not None
+    assert WeightMatrix.validate_matrix(np.triu(np.full((3, 3), 0.5), 1), 3) is not None
+
+    app.config.update({"CUSTOM_WEIGHTS_UNSEEN_FIRST": True})
+    with client:
+        client.post("/register", data=user_data)
+        pair = client.get("/api/rank").json
+        shown = [frozenset([pair['item_1']['item_id'], pair['item_2']['item_id']]),
+                 frozenset([pair['next_item_1']['item_id'], pair['next_item_2']['item_id']])]
+        response = client.post("/api/rank", data={
+            'state': 'skipped',
+            'item_1_id': pair['item_1']['item_id'],
+            'item_2_id': pair['item_2']['item_id'],
+        })
+        pair = response.json
+        shown.append(frozenset([pair['next_item_1']['item_id'], pair['next_item_2']['item_id']]))
+        assert set(shown) == set(frozenset([names[a], names[b]]) for a, b in expected)
+
+
+def test_shards(runner, app, client):
+    app.config.update({"SHARDS": True})
+    try:
+        result = runner.invoke(args=["reset", conf_equal_weight])
+        assert result.exit_code == 0
+
+        with client:
+            client.post("/register", data=user_data)
+            user_id = session['user_id']
+            response = client.get("/selection/items")
+            while response.status_code == 200:
+                item_id = response.get_data(as_text=True).split('name="item_id" value="')[1]
+                client.post("/selection/items", data={
+                    'action': 'agree',
+                    'item_id': item_id.split('"')[0],
+                })
+                response = client.get("/selection/items")
+            assert response.location.endswith("/rank")
+
+            pair = client.get("/api/rank").json
+            response = client.post("/api/rank", data={
+                'state': 'confirmed',
+                'item_1_id': pair['item_1']['item_id'],
+                'item_2_id': pair['item_2']['item_id'],
+                'selected_item_id': pair['item_1']['item_id'],
+                'pair_token': pair['pair_token'],
+            })
+            pair = response.json
+            app.config.update({"WRITE_BEHIND": True})
+            response = client.post("/api/rank", data={
+                'state': 'skipped',
+                'item_1_id': pair['item_1']['item_id'],
+                'item_2_id': pair['item_2']['item_id'],
+                'pair_token': pair['pair_token'],
+            })
+            write_behind.flush()
+            app.config.update({"WRITE_BEHIND": False})
+            assert response.json['comparison_number'] == 1
+            assert response.json['skipped_number'] == 1
+
+        with app.app_context():
+            # The judgements are saved in the database of the user's group
+            assert db.session.query(Comparison).count() == 0
+            assert db.session.query(UserItem).count() == 0
+            with shards.engine(1).connect() as conn:
+                ids = [id for id, in conn.execute(
+                    text("select comparison_id from comparison where user_id = :id"),
+                    {'id': user_id})]
+                assert len(ids) == 2
+                assert all(id > shards.ID_SPAN for id in ids)
+                assert conn.execute(text("select count(*) from user_item")).scalar() > 0
+
+            # The judgements are read from every group database
+            assert [u['user_id'] for u in Statistics.users()] == [user_id]
+            assert sum(i['wins'] for i in Statistics.items()) == 1
+            assert sum(r['comparisons'] for r in Bootstrap.intervals(replicates=5)) == 2
+            SetupCache.clear()
+            assert sum(g.total() for g in Coverage.load().values()) == 1
+
+        result = runner.invoke(args=["export"])
+        assert result.exit_code == 0
+    finally:
+        app.config.update({"SHARDS": False, "WRITE_BEHIND": False})
@@ -0,0 +1,114 @@
+"""Static assets pipeline. The static files are copied with content hashed names and
+precompressed (gzip, and brotli when installed) into the assets build folder, so
+WhiteNoise can serve them with an immutable cache policy."""
+import hashlib
+import json
+import os
+import re
+import shutil
+from flask import current_app, has_app_context, has_request_context, request
+from whitenoise.compress import Compressor
+
+
+class Assets:
+    """Build the static assets and resolve their public URLs"""
+    # URL prefix where WhiteNoise serves the static files
+    PREFIX = 'assets/'
+    MANIFEST = 'manifest.json'
+    # Files never published
+    IGNORED = re.compile(r'(\.map|\.DS_Store)$')
+    # Hashed file names (e.g. bootstrap.min.0123456789ab.css)
+    HASHED = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+    def init_app(self, app):
+        """Load the assets manifest of the application and expose the asset_url function
+        to the templates.
+
+        Args:
+            app (Flask): Flask application
+
+        Returns:
+            str: Assets build folder location
+        """
+        app.config.setdefault('ASSETS_LOCATION', 'instance/assets/')
+        location = self.location(app)
+        manifest = os.path.join(location, self.MANIFEST)
+        app.extensions['assets'] = {}
+        if os.path.exists(manifest):
+            with open(manifest, 'r') as f:
+                app.extensions['assets'] = json.load(f)
+
+        app.jinja_env.globals['asset_url'] = self.url
+        return location
+
+    def url(self, filename: str):
+        """Get the public URL of a static file. The hashed copy is used once built.
+
+        Args:
+            filename (str): File location relative to the static folder
+
+        Returns:
+            str: File URL
+        """
+        manifest = current_app.extensions.get('assets', {}) if has_app_context() else {}
+        root = request.script_root if has_request_context() else ''
+        return '{}/{}{}'.format(root, self.PREFIX, manifest.get(filename, filename))
+
+    def is_immutable(self, path, url):
+        """WhiteNoise test to serve the hashed files with an immutable cache policy"""
+        return self.HASHED.search(url) is not None
+
+    def location(self, app):
+        """Get the assets build folder location
+
+        Args:
+            app (Flask): Flask application
+
+        Returns:
+            str: Folder location
+        """
+        return os.path.join(os.path.abspath(os.path.dirname(__file__)), '..',
+                            app.config['ASSETS_LOCATION'])
+
+    def build(self, app):
+        """Copy the static files into the build folder using hashed names and precompress
+        them. Non minified files with a minified version and source maps are skipped.
+
+        Args:
+            app (Flask): Flask application
+        """
+        location = self.location(app)
+        if os.path.exists(location):
+            shutil.rmtree(location)
+        os.makedirs(location)
+
+        compressor = Compressor(quiet=True)
+        manifest = {}
+        for folder, _, files in os.walk(app.static_folder):
+            for name in files:
+                path = os.path.join(folder, name)
+                filename = os.path.relpath(path, app.static_folder).replace(os.sep, '/')
+                if self.IGNORED.search(name) or self.__has_minified_version(path):
+                    continue
+
+                with open(path, 'rb') as f:
+                    digest = hashlib.md5(f.read()).hexdigest()[:12]
+                stem, extension = os.path.splitext(filename)
+                manifest[filename] = '{}.{}{}'.format(stem, digest, extension)
+
+                target = os.path.join(location, manifest[filename])
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copy2(path, target)
+                if compressor.should_compress(target):
+                    list(compressor.compress(target))
+
+        with open(os.path.join(location, self.MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        app.logger.info("Built %d static assets into %s" % (len(manifest), location))
+
+    def __has_minified_version(self, path: str):
+        stem, extension = os.path.splitext(path)
+        return not stem.endswith('.min') and os.path.exists(stem + '.min' + extension)
+
+
+assets = Assets()
@@ -8,7 +8,7 @@ class Ethics(Request):
 
     def get(self, _):
         """Request get handler"""
-        return self._render_template('page/ethics.html', {
+        return self.render_cacheable_template('page/ethics.html', {
             'ethics_agreement_link': WS.get_behavior_conf(
                 WS.BEHAVIOR_ETHICS_AGREEMENT_LINK, self._app),
             'ethics_agreement_back_button': WS.get_text(
@@ -8,7 +8,7 @@ class Introduction(Request):
 
     def get(self, _):
         """Request get handler"""
-        return self._render_template('page/introduction.html', {
+        return self.render_cacheable_template('page/introduction.html', {
             'user_instruction_link': WS.get_behavior_conf(
                 WS.BEHAVIOR_USER_INSTRUCTION_LINK, self._app),
             'introduction_continue_button': WS.get_text(
@@ -5,6 +5,9 @@ from sqlalchemy.exc import SQLAlchemyError
 from configuration.website import Settings as WS
 from model.schema import WebsiteControl, User, UserGroup, ItemGroup, Item, UserItem
 from model.connection import db
+from model.write_behind import write_behind
+from model.cache import KnownItems, PairQueue
+from model.progress import Progress
 
 
 class ItemsPreference(Request):
@@ -25,29 +28,33 @@ class ItemsPreference(Request):
         if not equal_weight_conf or not render_item_preference:
             return self._redirect('.rank')
 
+        # Items preferences already specified, including the ones waiting in the
+        # write-behind queue. They are read apart from the items, as they can be saved
+        # in the group database (sharding mode).
+        stated = [id for id, in db.session.query(UserItem.item_id).
+                  where(UserItem.user_id == self._session['user_id'])]
+        stated += [ui.item_id for ui in write_behind.pending(
+            UserItem, user_id=self._session['user_id'])]
+
         # Get all items preferences not specified for the user yet.
-        result = db.session.query(User, UserGroup, ItemGroup, Item, UserItem).\
+        result = db.session.query(User, UserGroup, ItemGroup, Item).\
             join(UserGroup, UserGroup.user_id == User.user_id, isouter=True).\
             join(ItemGroup, ItemGroup.group_id == UserGroup.group_id, isouter=True).\
             join(Item, ItemGroup.item_id == Item.item_id, isouter=True).\
-            join(
-                UserItem,
-                (UserItem.user_id == User.user_id) & (UserItem.item_id == Item.item_id),
-                isouter=True).\
             where(
                 User.user_id == self._session['user_id'],
                 UserGroup.group_id.in_(self._session['group_ids']),
                 ItemGroup.group_id.in_(self._session['group_ids']),
-                # WARNING: Don't change the None comparison by "is None". It won't work the same
-                UserItem.user_item_id == None).order_by(func.random()).first() # noqa
+                Item.item_id.notin_(stated)).order_by(func.random()).first()
 
         # After the user had stated all items preferences
         # moves to the comparison itself.
         if not result:
+            KnownItems.refresh(self._session['user_id'])
             return self._redirect('.rank')
 
         # Render the item preference template
-        _, _, _, item, _ = result
+        _, _, _, item = result
         return self._render_template('page/item_preference.html', {
             'item': item,
             'item_selection_question': WS.get_text(WS.ITEM_SELECTION_QUESTION_LABEL, self._app),
@@ -66,13 +73,19 @@ class ItemsPreference(Request):
         # Save the user preference into the database
         ui = UserItem(
             user_id=self._session['user_id'],
-            item_id=response['item_id'],
+            item_id=int(response['item_id']),
             known=known)
 
         try:
-            db.session.add(ui)
-            db.session.commit()
+            if write_behind.enabled():
+                write_behind.add(ui)
+            else:
+                db.session.add(ui)
+                db.session.commit()
         except SQLAlchemyError as e:
             raise RuntimeError(str(e))
 
+        Progress.record_preference(self._session['user_id'], known)
+        KnownItems.discard(self._session['user_id'])
+        PairQueue.discard(self._session['user_id'])
         return self._redirect('.item_selection')
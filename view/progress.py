@@ -0,0 +1,85 @@
+import hmac
+import json
+import time
+from flask import Response, abort, stream_with_context
+# Custom libraries
+from view.request import Request
+from model.progress import Progress
+
+
+class ProgressDashboard(Request):
+    """Administration page showing the study progress live. The progress is streamed
+    to the page as Server-Sent Events every PROGRESS_STREAM_SECONDS. The page is available
+    only when the flask setting ADMIN_TOKEN is defined. The token is sent as a bearer
+    authorization header, or once through the page form, which keeps the administrator
+    signed in the session. The token never travels in the URL, so it isn't written to the
+    access logs.
+
+    The progress counters are kept by every process (see Progress), so with several web
+    workers the page shows the activity served by the worker answering it.
+    """
+
+    def get(self, request):
+        """Request get handler"""
+        self.__verify_enabled()
+        if not self.__authorized(request):
+            return self._render_template('page/progress_login.html')
+        return self._render_template('page/progress.html', {'progress': Progress.snapshot()})
+
+    def post(self, request):
+        """Sign in the administrator with the token sent through the page form. Responds
+        "404 Not Found" when the token is invalid."""
+        self.__verify_enabled()
+        token = request.form.get('token', '')
+        if not hmac.compare_digest(token.encode(), str(self._app.config['ADMIN_TOKEN']).encode()):
+            abort(404)
+        self._session['admin'] = self.__signature()
+        return self._redirect('.progress')
+
+    def stream(self, request):
+        """Stream the study progress as Server-Sent Events"""
+        self.__verify_enabled()
+        if not self.__authorized(request):
+            abort(404)
+        response = Response(stream_with_context(self.__events()),
+                            mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # Don't let the proxies buffer the events
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    def __events(self):
+        """Generate the progress events during PROGRESS_STREAM_MAX_SECONDS. The browser
+        reconnects once the stream ends, so the streams of the closed pages don't hold a
+        worker forever."""
+        interval = self._app.config['PROGRESS_STREAM_SECONDS']
+        deadline = time.monotonic() + self._app.config['PROGRESS_STREAM_MAX_SECONDS']
+        # Reconnection delay of the browser
+        event = 'retry: {}\n'.format(int(interval * 1000))
+        while True:
+            yield event + 'data: {}\n\n'.format(json.dumps(Progress.snapshot()))
+            event = ''
+            if time.monotonic() + interval >= deadline:
+                return
+            time.sleep(interval)
+
+    def __verify_enabled(self):
+        """Respond "404 Not Found" when the dashboard is disabled"""
+        if not self._app.config.get('ADMIN_TOKEN'):
+            abort(404)
+
+    def __authorized(self, request):
+        """Verify if the request carries the administration token or was signed in
+
+        Returns:
+            bool: True for administrators
+        """
+        if self.is_admin(request):
+            return True
+        return hmac.compare_digest(str(self._session.get('admin', '')), self.__signature())
+
+    def __signature(self):
+        """Signature of the administration token kept in the administrator's session. It
+        changes with the token, signing out the administrators."""
+        return hmac.new(str(self._app.secret_key).encode(),
+                        str(self._app.config['ADMIN_TOKEN']).encode(), 'sha256').hexdigest()
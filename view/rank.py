@@ -1,13 +1,21 @@
 from sqlalchemy.sql.expression import func
-from numpy.random import choice
-from sqlalchemy.exc import SQLAlchemyError
+import numpy as np
+from numpy.random import default_rng
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 import datetime
+import secrets
 # Custom import
 from view.request import Request
 from configuration.website import Settings as WS
 from model.connection import db
-from model.schema import (Comparison, Item, WebsiteControl, UserGroup,
-                          CustomItemPair, UserItem, ItemGroup)
+from model.write_behind import write_behind
+from model.cache import (SetupCache, ItemCache, GroupCache, KnownItems, PairQueue,
+                         SubmittedPairs)
+from model.coverage import Coverage, SeenPairs
+from model.weight_matrix import WeightMatrix
+from model.statistics import Statistics
+from model.progress import Progress
+from model.schema import Comparison, WebsiteControl, UserGroup, CustomItemPair
 
 
 class Rank(Request):
@@ -16,6 +24,8 @@ class Rank(Request):
     REJUDGE = 'rejudged'
     CONFIRMED = 'confirmed'
     SKIPPED = 'skipped'
+    # Random draws made for every pair queued, looking for pairs not seen by the user
+    DRAWS_PER_PAIR = 2
 
     def get(self, request):
         """Request get handler"""
@@ -27,22 +37,13 @@ class Rank(Request):
         if 'comparison_id' in args:
             comparison_id = args['comparison_id']
 
-        item_1, item_2 = self.__get_items_to_compare(comparison_id)
+        pair = self._get_pair(comparison_id)
         # Show a "no content error" in case of not enough selected known items.
-        if item_1 is None or item_2 is None:
+        if pair is None:
             return self._render_template('204.html')
 
-        # The user can rejudge comparisons if:
-        # 1. Some comparison has been made.
-        # 2. There is previous comparison to be made.
-        can_rejudge = len(self._session['comparison_ids']) > 0 \
-            and self._session['previous_comparison_id'] is not None
-
-        compared, skipped = self.__get_comparison_stats()
-
         return self._render_template('page/rank.html', {
-            'item_1': item_1,
-            'item_2': item_2,
+            **pair,
             'selected_item_label': WS.get_text(
                 WS.RANK_ITEM_SELECTED_INDICATOR_LABEL, self._app),
             'tied_selection_label': WS.get_text(
@@ -57,15 +58,11 @@ class Rank(Request):
                 WS.RANK_ITEM_INSTRUCTION_LABEL, self._app),
             'comparison_number_label': WS.get_text(
                 WS.RANK_ITEM_COMPARISON_EXECUTED_LABEL, self._app),
-            'comparison_number': compared,
             'skipped_number_label': WS.get_text(
                 WS.RANK_ITEM_SKIPPED_COMPARISON_EXECUTED_LABEL, self._app),
-            'skipped_number': skipped,
             'rejudge_value': self.REJUDGE,
             'confirmed_value': self.CONFIRMED,
-            'skipped_value': self.SKIPPED,
-            'can_rejudge': can_rejudge,
-            'comparison_id': comparison_id
+            'skipped_value': self.SKIPPED
         })
 
     def post(self, request):
@@ -73,55 +70,207 @@ class Rank(Request):
         response = request.form.to_dict(flat=True)
         action = response['state']
         if action != self.REJUDGE:
-            # Set the comparison state based on the user's action
-            state, selected_item_id = self.__get_comparison_state(action, response)
-
-            # Verify if the user want to rejudge an item
-            comparison_id = None
-            if 'comparison_id' in response and response['comparison_id'] != "":
-                comparison_id = response['comparison_id']
-
-            if comparison_id is None:
-                # Save the new user comparison in the database.
-                c = Comparison(
-                    user_id=self._session['user_id'],
-                    item_1_id=response['item_1_id'],
-                    item_2_id=response['item_2_id'],
-                    state=state,
-                    selected_item_id=selected_item_id
-                )
-                try:
+            self._save_judgement(response)
+            return self._redirect('.rank')
+        else:
+            return self._redirect('.rank', comparison_id=self._session['previous_comparison_id'])
+
+    def _get_pair(self, comparison_id=None):
+        """Get the pair of items to compare together with the state of the user's
+        comparison process.
+
+        Args:
+            comparison_id (int, optional): Gets the items related
+            to a particular comparison. This parameter allows
+            the rejudging functionality. Defaults to None.
+
+        Returns:
+            dict: Pair of items to compare and comparison state | None
+        """
+        self.__resolve_provisional_ids()
+        item_1, item_2 = self.__get_items_to_compare(comparison_id)
+        if item_1 is None or item_2 is None:
+            return None
+
+        # Pre-draw the pair that will be shown after this judgement. The browser
+        # prefetches its images while the user is still comparing the current pair.
+        next_item_1, next_item_2 = self.__get_next_items_to_compare()
+
+        # The user can rejudge comparisons if:
+        # 1. Some comparison has been made.
+        # 2. There is previous comparison to be made.
+        can_rejudge = len(self._session['comparison_ids']) > 0 \
+            and self._session['previous_comparison_id'] is not None
+
+        compared, skipped = self.__get_comparison_stats()
+
+        # Every new pair gets its own token. Submitting the same page again doesn't
+        # register the judgement twice.
+        pair_token = secrets.token_urlsafe(16) if comparison_id is None else None
+
+        return {
+            'item_1': item_1,
+            'item_2': item_2,
+            'next_item_1': next_item_1,
+            'next_item_2': next_item_2,
+            'comparison_id': comparison_id,
+            'pair_token': pair_token,
+            'can_rejudge': can_rejudge,
+            'comparison_number': compared,
+            'skipped_number': skipped
+        }
+
+    def _save_judgement(self, response: dict):
+        """Save the user's judgement. A new comparison is registered unless
+        an existing comparison is being rejudged.
+
+        Args:
+            response (dict): POST from response
+
+        Raises:
+            RuntimeError: Invalid comparison id provided
+        """
+        self.__resolve_provisional_ids()
+
+        # Set the comparison state based on the user's action
+        state, selected_item_id = self.__get_comparison_state(response['state'], response)
+
+        # Verify if the user want to rejudge an item
+        comparison_id = None
+        if 'comparison_id' in response and response['comparison_id'] != "":
+            comparison_id = write_behind.resolve(int(response['comparison_id']))
+
+        if write_behind.lost(comparison_id):
+            # Rejudge of a comparison the write-behind queue couldn't save (or whose id
+            # was forgotten), submitted from a page drawn before. Nothing to save.
+            self._app.logger.warning("Rejudge of an unknown comparison ignored: %s"
+                                     % comparison_id)
+            comparison_ids = self._session['comparison_ids']
+            self._session['previous_comparison_id'] = \
+                comparison_ids[-1] if len(comparison_ids) > 0 else None
+            return
+
+        if comparison_id is None:
+            pair_token = response.get('pair_token') or None
+            if pair_token is not None and \
+                    not SubmittedPairs.claim(self._session['user_id'], pair_token):
+                # Repeated submission of the same page (retry, double post). Nothing to save.
+                return
+
+            # Save the new user comparison in the database.
+            c = Comparison(
+                user_id=self._session['user_id'],
+                item_1_id=response['item_1_id'],
+                item_2_id=response['item_2_id'],
+                state=state,
+                selected_item_id=selected_item_id,
+                pair_token=pair_token
+            )
+            try:
+                if write_behind.enabled():
+                    # Queue the comparison. It will be saved in the next batch.
+                    comparison_id = write_behind.add(c, Statistics.record)
+                else:
                     db.session.add(c)
+                    db.session.flush()
+                    Statistics.record(c)
                     db.session.commit()
-                    # Save the comparison for future possible rejudging
-                    self._session['previous_comparison_id'] = c.comparison_id
-                    self._session['comparison_ids'] = \
-                        self._session['comparison_ids'] + [c.comparison_id]
-                except SQLAlchemyError as e:
+                    comparison_id = c.comparison_id
+                Coverage.record_state_change(c.item_1_id, c.item_2_id, None, state)
+                Progress.record_judgement(c.user_id, state)
+                # Save the comparison for future possible rejudging
+                self._session['previous_comparison_id'] = comparison_id
+                self._session['comparison_ids'] = \
+                    self._session['comparison_ids'] + [comparison_id]
+            except IntegrityError as e:
+                db.session.rollback()
+                if pair_token is None:
                     raise RuntimeError(str(e))
-            else:
-                # Rejudge an existence comparison.
-                comparison = db.session.query(Comparison).\
-                    where(
-                        Comparison.comparison_id == comparison_id,
-                        Comparison.user_id == self._session['user_id']).first()
-
-                if comparison is None:
-                    raise RuntimeError("Invalid comparison id provided")
-                try:
-                    comparison.selected_item_id = selected_item_id
-                    comparison.state = state
-                    comparison.updated = datetime.datetime.now(datetime.timezone.utc)
-                    db.session.commit()
-                    # Return the pointer to the last comparison made
-                    self._session['previous_comparison_id'] = \
-                        self._session['comparison_ids'][len(self._session['comparison_ids']) - 1]
-                except SQLAlchemyError as e:
-                    raise RuntimeError(str(e))
-
-            return self._redirect('.rank')
+                # The pair was submitted through another process in the meantime
+                SubmittedPairs.discard(self._session['user_id'])
+            except SQLAlchemyError as e:
+                # The pair wasn't saved. It can be submitted again.
+                SubmittedPairs.discard(self._session['user_id'])
+                raise RuntimeError(str(e))
+        elif comparison_id < 0 and self.__rejudge_queued_comparison(
+                comparison_id, state, selected_item_id):
+            # Return the pointer to the last comparison made
+            self._session['previous_comparison_id'] = \
+                self._session['comparison_ids'][len(self._session['comparison_ids']) - 1]
         else:
-            return self._redirect('.rank', comparison_id=self._session['previous_comparison_id'])
+            # Rejudge an existence comparison.
+            comparison_id = write_behind.resolve(comparison_id)
+            comparison = db.session.query(Comparison).\
+                where(
+                    Comparison.comparison_id == comparison_id,
+                    Comparison.user_id == self._session['user_id']).first()
+
+            if comparison is None:
+                raise RuntimeError("Invalid comparison id provided")
+            try:
+                previous_state = comparison.state
+                previous_selected_item_id = comparison.selected_item_id
+                comparison.selected_item_id = selected_item_id
+                comparison.state = state
+                comparison.updated = datetime.datetime.now(datetime.timezone.utc)
+                db.session.flush()
+                Statistics.record(comparison, previous_state, previous_selected_item_id)
+                db.session.commit()
+                Coverage.record_state_change(
+                    comparison.item_1_id, comparison.item_2_id, previous_state, state)
+                Progress.record_judgement(comparison.user_id, state, previous_state)
+                # Return the pointer to the last comparison made
+                self._session['previous_comparison_id'] = \
+                    self._session['comparison_ids'][len(self._session['comparison_ids']) - 1]
+            except SQLAlchemyError as e:
+                raise RuntimeError(str(e))
+
+    def __rejudge_queued_comparison(self, comparison_id: int, state, selected_item_id):
+        """Rejudge a comparison waiting in the write-behind queue.
+
+        Args:
+            comparison_id (int): Provisional comparison id
+            state (str): Comparison state
+            selected_item_id (int): Selected item | None
+
+        Raises:
+            RuntimeError: Invalid comparison id provided
+
+        Returns:
+            bool: True when the comparison was updated in the queue. False when
+            the comparison was saved in the database in the meantime.
+        """
+        comparison = write_behind.get(comparison_id)
+        if comparison is not None and comparison.user_id != self._session['user_id']:
+            raise RuntimeError("Invalid comparison id provided")
+
+        previous_state = comparison.state if comparison is not None else None
+        updated = write_behind.update(
+            comparison_id,
+            selected_item_id=selected_item_id,
+            state=state,
+            updated=datetime.datetime.now(datetime.timezone.utc))
+        if updated:
+            Coverage.record_state_change(
+                comparison.item_1_id, comparison.item_2_id, previous_state, state)
+            Progress.record_judgement(comparison.user_id, state, previous_state)
+        return updated
+
+    def __resolve_provisional_ids(self):
+        """Replace the provisional ids of the user's comparisons once they were
+        saved by the write-behind queue. The comparisons whose ids can't be resolved
+        (discarded by the queue or forgotten) are dropped, so they can't be rejudged."""
+        comparison_ids = self._session['comparison_ids']
+        if any(id < 0 for id in comparison_ids):
+            self._session['comparison_ids'] = [write_behind.resolve(id) for id in comparison_ids
+                                               if not write_behind.lost(id)]
+            previous_comparison_id = self._session['previous_comparison_id']
+            if write_behind.lost(previous_comparison_id):
+                # Point to the last comparison saved instead
+                previous_comparison_id = self._session['comparison_ids'][-1] \
+                    if len(self._session['comparison_ids']) > 0 else None
+            self._session['previous_comparison_id'] = \
+                write_behind.resolve(previous_comparison_id)
 
     def __get_comparison_state(self, action: str, response: dict):
         """Get the right comparison parameters based on the user's action
@@ -163,6 +312,12 @@ class Rank(Request):
             where(Comparison.user_id == self._session['user_id']).\
             group_by(Comparison.state).all()
 
+        # Include the comparisons waiting in the write-behind queue.
+        queued = {}
+        for c in write_behind.pending(Comparison, user_id=self._session['user_id']):
+            queued[c.state] = queued.get(c.state, 0) + 1
+        res = [(s, n + queued.pop(s, 0)) for s, n in res] + list(queued.items())
+
         if len(res) == 0:
             return compared, skipped
 
@@ -187,27 +342,133 @@ class Rank(Request):
             Item: Model Item | none
             Item: Model Item | none
         """
-        render_item_prefer = WS.should_render(
-            WS.BEHAVIOR_RENDER_USER_ITEM_PREFERENCE_PAGE, self._app)
-
         # Case 1: Returns the items related to a particular comparison.
         if comparison_id is not None:
             return self.__get_comparison_items(comparison_id)
 
-        # Case 2: Get a random pair from list of custom defined weights
+        # Case 2: Returns the pair reserved when the previous page was rendered.
+        # Its images were already prefetched by the user's browser.
+        item_1, item_2 = self.__get_reserved_items()
+        if item_1 is not None and item_2 is not None:
+            return item_1, item_2
+
+        # Case 3: Draw a new pair of items.
+        return self.__draw_items_to_compare()
+
+    def __get_next_items_to_compare(self):
+        """Get the pair of items to be compared after the current one. The pair is
+        drawn once and reserved in the user's session until the next page is rendered.
+
+        Returns:
+            Item: Model Item | none
+            Item: Model Item | none
+        """
+        # The reserved pair is kept while the user is rejudging previous comparisons.
+        item_1, item_2 = self.__get_reserved_items(release=False)
+        if item_1 is None or item_2 is None:
+            item_1, item_2 = self.__draw_items_to_compare()
+
+        self._session['next_item_ids'] = None
+        if item_1 is not None and item_2 is not None:
+            self._session['next_item_ids'] = [item_1.item_id, item_2.item_id]
+
+        return item_1, item_2
+
+    def __get_reserved_items(self, release=True):
+        """Get the pair of items reserved in the user's session.
+
+        Args:
+            release (bool, optional): Remove the reservation from the session.
+            Defaults to True.
+
+        Returns:
+            Item: Model Item | none
+            Item: Model Item | none
+        """
+        item_ids = self._session.get('next_item_ids')
+        if release:
+            self._session['next_item_ids'] = None
+
+        if not item_ids:
+            return None, None
+
+        item_1, item_2 = ItemCache.get_pair(item_ids[0], item_ids[1])
+        if item_1 is None or item_2 is None:
+            return None, None
+
+        return item_1, item_2
+
+    def __draw_items_to_compare(self):
+        """Draw a new pair of items to compare using the website weight configuration.
+        The pairs are drawn in batches and queued for the user, so most of the requests
+        just take the next pair of the queue.
+
+        Returns:
+            Item: Model Item | none
+            Item: Model Item | none
+        """
+        user_id = self._session['user_id']
+        item_1_id, item_2_id = PairQueue.pop(user_id)
+        if item_1_id is None:
+            pairs = self.__draw_pairs()
+            if len(pairs) == 0:
+                return None, None
+            (item_1_id, item_2_id), pairs = pairs[0], pairs[1:]
+            PairQueue.push(user_id, pairs)
+
+        # Don't show the pair again until the user has seen every other pair.
+        SeenPairs.add(user_id, item_1_id, item_2_id)
+
+        return ItemCache.get_pair(item_1_id, item_2_id)
+
+    def __draw_pairs(self):
+        """Draw the next pairs of items to compare using the website weight configuration.
+
+        Returns:
+            list: Pairs of item ids
+        """
+        render_item_prefer = WS.should_render(
+            WS.BEHAVIOR_RENDER_USER_ITEM_PREFERENCE_PAGE, self._app)
+        size = max(self._app.config['PAIR_QUEUE_SIZE'], 1)
+
+        # The generator of every draw is seeded by the user's number of draws.
+        draw = self._session.get('random_draws', 0)
+        self._session['random_draws'] = draw + 1
+        rng = self.generator(self._app, self._session['user_id'], draw)
+
+        # Case 1: Get random pairs from list of custom defined weights
         if self._session['weight_conf'] == WebsiteControl.CUSTOM_WEIGHT:
-            return self.__get_custom_items()
+            return self.__get_custom_pairs(size, rng)
 
-        # Case 3: Get a random item pair when equal weights and item preference was defined
+        # Case 2: Get random item pairs when equal weights and item preference was defined
         if self._session['weight_conf'] == WebsiteControl.EQUAL_WEIGHT and render_item_prefer:
-            return self.__get_preferred_items()
+            return self.__get_preferred_pairs(size, rng)
 
-        # Case 4: Get a random item pair when equal weights and no item preference was defined
+        # Case 3: Get random item pairs when equal weights and no item preference was defined
         if self._session['weight_conf'] == WebsiteControl.EQUAL_WEIGHT and not render_item_prefer:
-            return self.__get_random_items()
+            return self.__get_random_pairs(size, rng)
+
+        return []
 
-        # All no implemented cases
-        return None, None
+    @staticmethod
+    def generator(app, user_id: int, draw: int):
+        """Get the random generator of a user's draw. The generators are seeded from the
+        study seed (flask setting RANDOM_SEED, or the website setup date when it isn't
+        set), the user id and the number of previous draws of the user, so every request
+        uses its own generator and the pairs drawn for a user can be replayed.
+
+        Args:
+            app (Flask): Flask application
+            user_id (int): User id
+            draw (int): Number of previous draws of the user
+
+        Returns:
+            Generator: Numpy random generator
+        """
+        seed = app.config['RANDOM_SEED']
+        if seed is None:
+            seed = 0 if SetupCache.version is None else int(SetupCache.version.timestamp())
+        return default_rng([int(seed), int(user_id), int(draw)])
 
     def __get_comparison_items(self, comparison_id: int):
         """Get the items related to a particular comparison already made.
@@ -223,18 +484,27 @@ class Rank(Request):
             Item: Model Item | none
         """
         # 1. Get the items related to the comparison.
-        comparison = db.session.query(Comparison).\
-            where(
-                Comparison.comparison_id == comparison_id,
-                Comparison.user_id == self._session['user_id']).first()
-
-        if comparison is None:
+        # Comparisons waiting in the write-behind queue are taken from the queue.
+        comparison = None
+        comparison_id = write_behind.resolve(int(comparison_id))
+        if comparison_id < 0:
+            comparison = write_behind.get(comparison_id)
+            # The comparison could have been saved in the meantime.
+            if comparison is None:
+                comparison_id = write_behind.resolve(comparison_id)
+                self.__resolve_provisional_ids()
+
+        if comparison_id >= 0:
+            comparison = db.session.query(Comparison).\
+                where(
+                    Comparison.comparison_id == comparison_id,
+                    Comparison.user_id == self._session['user_id']).first()
+
+        if comparison is None or comparison.user_id != self._session['user_id']:
             raise RuntimeError("Invalid comparison id provided")
 
         # 2. Get the items information
-        items = db.session.query(Item).\
-            where(
-                Item.item_id.in_([comparison.item_1_id, comparison.item_2_id])).all()
+        item_1, item_2 = ItemCache.get_pair(comparison.item_1_id, comparison.item_2_id)
 
         # 3. Update the session parameters
         comparison_id_index = self._session['comparison_ids'].index(int(comparison_id))
@@ -244,105 +514,179 @@ class Rank(Request):
             self._session['previous_comparison_id'] = \
                 self._session['comparison_ids'][comparison_id_index - 1]
 
-        return items[0], items[1]
+        return item_1, item_2
 
-    def __get_custom_items(self):
-        """Get a random pair of items from a predefined list. This
+    def __get_custom_pairs(self, size: int, rng):
+        """Get random pairs of items from a predefined list. This
         list was defined by the user when setting up the site.
 
+        Args:
+            size (int): Number of pairs to draw
+            rng (Generator): Random generator
+
         Returns:
-            Item: Model Item | none
-            Item: Model Item | none
+            list: Pairs of item ids
         """
         # 1. Get the the custom pairs. This query assumes that just one group
-        # can be selected by the user when defining custom weights.
-        result = db.session.query(UserGroup, CustomItemPair).\
-            join(CustomItemPair, CustomItemPair.group_id == UserGroup.group_id, isouter=True).\
+        # can be selected by the user when defining custom weights. The groups configured
+        # with a weight matrix are drawn from their stored weights.
+        for group_id in self._session['group_ids']:
+            weights = WeightMatrix.get(group_id)
+            if weights is not None:
+                return self.__get_matrix_pairs(int(group_id), weights, size, rng)
+
+        result = db.session.query(CustomItemPair.item_1_id, CustomItemPair.item_2_id,
+                                  CustomItemPair.weight).\
+            join(UserGroup, CustomItemPair.group_id == UserGroup.group_id).\
             where(
                 UserGroup.user_id == self._session['user_id'],
-                UserGroup.group_id.in_(self._session['group_ids'])).all()
+                UserGroup.group_id.in_(self._session['group_ids'])).\
+            order_by(CustomItemPair.custom_item_pair_id).all()
 
-        pair_ids = []
-        pair_weights = []
-        pairs = {}
-        for _, p in result:
-            pairs[p.custom_item_pair_id] = p
-            pair_ids.append(p.custom_item_pair_id)
-            pair_weights.append(p.weight)
+        if len(result) == 0:
+            return []
 
-        if len(pair_ids) == 0:
-            return None, None
+        item_1_ids, item_2_ids, weights = (np.array(c) for c in zip(*result))
+        weights = weights.astype(np.float64)
 
-        # 2. Select the item pair to compare but respecting the custom weights
-        pair_id = choice(pair_ids, 1, p=pair_weights, replace=False)
-        item_1_id = pairs[pair_id[0]].item_1_id
-        item_2_id = pairs[pair_id[0]].item_2_id
+        # 2. Leave out the pairs already seen by the user, unless every pair was seen
+        # (CUSTOM_WEIGHTS_UNSEEN_FIRST).
+        unseen = ~SeenPairs.seen_mask(self._session['user_id'], item_1_ids, item_2_ids)
+        selected = self.__draw_weighted(weights, unseen, size, rng)
 
-        # 3. Get the items information
-        items = db.session.query(Item).\
-            where(
-                Item.item_id.in_([item_1_id, item_2_id])).all()
+        # 3. Select the item pairs to compare but respecting the custom weights
+        return list(zip(item_1_ids[selected].tolist(), item_2_ids[selected].tolist()))
 
-        return items[0], items[1]
+    def __get_matrix_pairs(self, group_id: int, weights, size: int, rng):
+        """Get random pairs of items from the weight matrix of a group
 
-    def __get_preferred_items(self):
-        """Get a random pair of items from the preferred user's item selection
+        Args:
+            group_id (int): Group id
+            weights (ndarray): Weights following the group triangular pair index
+            size (int): Number of pairs to draw
+            rng (Generator): Random generator
 
         Returns:
-            Item: Model Item | none
-            Item: Model Item | none
+            list: Pairs of item ids
         """
-        # 1. Get the know user items preferences
-        result = db.session.query(UserItem, Item).\
-            join(Item, Item.item_id == UserItem.item_id, isouter=True).\
-            where(
-                UserItem.user_id == self._session['user_id'],
-                UserItem.known == 1).all()
+        group = Coverage.load().get(group_id)
+        if group is None or len(weights) == 0:
+            return []
+
+        # The pairs seen by the user share the group triangular pair index.
+        seen = SeenPairs.get(self._session['user_id']).get(group_id)
+        unseen = np.ones(len(weights), dtype=bool) if seen is None else \
+            np.unpackbits(seen, count=len(weights), bitorder='little') == 0
+        selected = self.__draw_weighted(weights, unseen, size, rng)
+
+        # Show the items on a random side
+        i, j = group.pair_items(selected)
+        item_1_ids, item_2_ids = group.item_ids[i], group.item_ids[j]
+        swap = rng.random(len(selected)) < 0.5
+        item_1_ids, item_2_ids = np.where(swap, item_2_ids, item_1_ids), \
+            np.where(swap, item_1_ids, item_2_ids)
+        return list(zip(item_1_ids.tolist(), item_2_ids.tolist()))
+
+    def __draw_weighted(self, weights, unseen, size: int, rng):
+        """Draw pairs respecting their custom weights, independently and with replacement.
+        With CUSTOM_WEIGHTS_UNSEEN_FIRST, the pairs not seen by the user are drawn first and
+        without replacement, which flattens the weights until every pair was seen.
+
+        Args:
+            weights (ndarray): Pairs weights
+            unseen (ndarray): True for the pairs not seen by the user
+            size (int): Number of pairs to draw
+            rng (Generator): Random generator
 
-        items_id = []
-        items = {}
-        for _, i in result:
-            # Insert only unique values to guarantee an equal item distribution.
-            if i.item_id not in items_id:
-                items_id.append(i.item_id)
-                items[i.item_id] = i
+        Returns:
+            ndarray: Positions of the selected pairs
+        """
+        candidates = np.flatnonzero(unseen & (weights > 0))
+        if self._app.config['CUSTOM_WEIGHTS_UNSEEN_FIRST'] and len(candidates) > 0:
+            p = weights[candidates] / weights[candidates].sum()
+            return rng.choice(candidates, min(size, len(candidates)), replace=False, p=p)
+        return rng.choice(len(weights), size, p=weights / weights.sum())
 
+    def __get_preferred_pairs(self, size: int, rng):
+        """Get random pairs of items from the preferred user's item selection
+
+        Args:
+            size (int): Number of pairs to draw
+            rng (Generator): Random generator
+
+        Returns:
+            list: Pairs of item ids
+        """
+        # 1. Get the know user items preferences. The item ids are unique to guarantee
+        # an equal item distribution.
+        items_id = KnownItems.get(self._session['user_id'])
         if len(items_id) < 2:
-            return None, None
+            return []
+
+        # 2. Select one of the least judged pairs of the user's item preferences.
+        # These pairs depend on the judgements of every user, so they aren't queued.
+        if self._app.config['COVERAGE_AWARE_SELECTION']:
+            item_1_id, item_2_id = Coverage.draw_pair(
+                self._session['group_ids'], rng, items_id,
+                SeenPairs.get(self._session['user_id']))
+            if item_1_id is not None:
+                return [(item_1_id, item_2_id)]
 
-        # 2. Select randomly two items from the user's item preferences
-        selected_items_id = choice(items_id, 2, replace=False)
+        # 3. Select randomly pairs of items from the user's item preferences
+        return self.__draw_unseen_pairs(items_id, size, rng)
 
-        return items[selected_items_id[0]], items[selected_items_id[1]]
+    def __get_random_pairs(self, size: int, rng):
+        """Get random pairs of items from the website configuration list
 
-    def __get_random_items(self):
-        """Get a random pair of items from the website configuration list
+        Args:
+            size (int): Number of pairs to draw
+            rng (Generator): Random generator
 
         Returns:
-            Item: Model Item | none
-            Item: Model Item | none
+            list: Pairs of item ids
         """
-        # 1. Get the items related to the user's group preferences
-        result = db.session.query(UserGroup, ItemGroup, Item).\
-            join(ItemGroup, ItemGroup.group_id == UserGroup.group_id, isouter=True).\
-            join(Item, ItemGroup.item_id == Item.item_id, isouter=True).\
-            where(
-                UserGroup.user_id == self._session['user_id'],
-                UserGroup.group_id.in_(self._session['group_ids']),
-                ItemGroup.group_id.in_(self._session['group_ids'])).all()
+        # 1. Get the items related to the user's group preferences. The item ids are
+        # unique to guarantee an equal item distribution.
+        items_id = GroupCache.get_item_ids(self._session['group_ids'])
+        if len(items_id) < 2:
+            return []
 
-        items_id = []
-        items = {}
-        for _, _, i in result:
-            # Insert only unique values to guarantee an equal item distribution.
-            if i.item_id not in items_id:
-                items_id.append(i.item_id)
-                items[i.item_id] = i
+        # 2. Select one of the least judged pairs of the least judged user's group.
+        # These pairs depend on the judgements of every user, so they aren't queued.
+        if self._app.config['COVERAGE_AWARE_SELECTION']:
+            item_1_id, item_2_id = Coverage.draw_pair(
+                self._session['group_ids'], rng,
+                seen=SeenPairs.get(self._session['user_id']))
+            if item_1_id is not None:
+                return [(item_1_id, item_2_id)]
 
-        if len(items_id) < 2:
-            return None, None
+        # 3. Select randomly pairs of items using the user's group preferences
+        return self.__draw_unseen_pairs(items_id, size, rng)
 
-        # 2. Select randomly two items using the user's group preferences
-        selected_items_id = choice(items_id, 2, replace=False)
+    def __draw_unseen_pairs(self, items_id, size: int, rng):
+        """Draw random pairs of different items at once, placing first the pairs not seen
+        by the user yet. The pairs aren't repeated.
 
-        return items[selected_items_id[0]], items[selected_items_id[1]]
+        Args:
+            items_id (list | ndarray): Candidate item ids
+            size (int): Number of pairs to draw
+            rng (Generator): Random generator
+
+        Returns:
+            list: Pairs of item ids
+        """
+        items_id = np.asarray(items_id)
+        n = len(items_id)
+        draws = self.DRAWS_PER_PAIR * size
+        i = rng.integers(n, size=draws)
+        j = rng.integers(n - 1, size=draws)
+        j = j + (j >= i)
+
+        # Remove the repeated pairs keeping the drawing order
+        _, first = np.unique(np.minimum(i, j) * n + np.maximum(i, j), return_index=True)
+        first = np.sort(first)
+        item_1_ids, item_2_ids = items_id[i[first]], items_id[j[first]]
+
+        seen = SeenPairs.seen_mask(self._session['user_id'], item_1_ids, item_2_ids)
+        order = np.concatenate([np.flatnonzero(~seen), np.flatnonzero(seen)])[:size]
+        return list(zip(item_1_ids[order].tolist(), item_2_ids[order].tolist()))
@@ -0,0 +1,87 @@
+from flask import url_for
+# Custom import
+from view.rank import Rank
+from view.asset import assets
+
+
+class RankApi(Rank):
+    """JSON version of the rank page. It allows the rank page to request new pairs,
+    submit judgements and rejudge comparisons without reloading the whole page.
+    The rank page form remains as fallback when JavaScript is not available."""
+
+    def get(self, request):
+        """Request get handler. Returns the pair of items to compare."""
+        if not self._valid_session():
+            return self.__invalid_session()
+
+        comparison_id = None
+        args = request.args.to_dict(flat=True)
+        if 'comparison_id' in args:
+            comparison_id = args['comparison_id']
+
+        return self.__pair(comparison_id)
+
+    def post(self, request):
+        """Request post handler. Saves the user's judgement and returns the next
+        pair of items to compare. When rejudging, the items related to the previous
+        comparison are returned instead."""
+        if not self._valid_session():
+            return self.__invalid_session()
+
+        response = request.form.to_dict(flat=True)
+        if response['state'] != self.REJUDGE:
+            self._save_judgement(response)
+            return self.__pair()
+
+        comparison_id = self._session['previous_comparison_id']
+        if comparison_id is None:
+            return self._jsonify({'error': 'There is not comparison to rejudge'}, 400)
+
+        return self.__pair(comparison_id)
+
+    def __pair(self, comparison_id=None):
+        """Serialize the pair of items to compare
+
+        Args:
+            comparison_id (int, optional): Comparison being rejudged. Defaults to None.
+
+        Returns:
+            JSON response. Empty with 204 status when there isn't a pair to compare.
+        """
+        pair = self._get_pair(comparison_id)
+        if pair is None:
+            return '', 204
+
+        return self._jsonify({
+            'item_1': self.__item(pair['item_1']),
+            'item_2': self.__item(pair['item_2']),
+            'next_item_1': self.__item(pair['next_item_1']),
+            'next_item_2': self.__item(pair['next_item_2']),
+            'comparison_id': pair['comparison_id'],
+            'pair_token': pair['pair_token'],
+            'can_rejudge': pair['can_rejudge'],
+            'comparison_number': pair['comparison_number'],
+            'skipped_number': pair['skipped_number']
+        })
+
+    def __item(self, item):
+        """Serialize the item attributes rendered on the rank page
+
+        Args:
+            item (Item): Model Item | None
+
+        Returns:
+            dict: Item attributes | None
+        """
+        if item is None:
+            return None
+
+        return {
+            'item_id': item.item_id,
+            'display_name': item.display_name,
+            'image_url': assets.url('image/' + str(item.image_path))
+        }
+
+    def __invalid_session(self):
+        """Respond to requests made without a registered user"""
+        return self._jsonify({'redirect': url_for('.user_registration')}, 401)
@@ -8,6 +8,7 @@ from view.request import Request
 from configuration.website import Settings as WS
 from model.schema import Group, WebsiteControl, User, UserGroup
 from model.connection import db
+from model.cache import FragmentCache
 
 
 class Register(Request):
@@ -18,17 +19,12 @@ class Register(Request):
         if self._valid_session():
             return self._redirect('.item_selection')
 
-        # Load components
-        user_components = []
-        self.__load_user_component(user_components)
-        self.__load_group_component(user_components)
-        self.__load_ethics_component(user_components)
-
-        # Render components
+        # Render components. They depend only on the setup data, so they are rendered
+        # once per process.
         return self._render_template('page/register.html', {
             'title': WS.get_text(WS.USER_REGISTRATION_FORM_TITLE_LABEL, self._app),
             'button': WS.get_text(WS.USER_REGISTRATION_SUMMIT_BUTTON_LABEL, self._app),
-            'components': user_components
+            'components': FragmentCache.get('register_components', self.__load_components)
         })
 
     def post(self, request):
@@ -72,11 +68,25 @@ class Register(Request):
             self._session['weight_conf'] = WebsiteControl().get_conf().weight_configuration
             self._session['previous_comparison_id'] = None
             self._session['comparison_ids'] = []
+            self._session['next_item_ids'] = None
+            self._session['random_draws'] = 0
         except SQLAlchemyError as e:
             raise RuntimeError(str(e))
 
         return self._redirect('.item_selection')
 
+    def __load_components(self):
+        """Load the components of the user registry view
+
+        Returns:
+            list: Rendered components
+        """
+        user_components = []
+        self.__load_user_component(user_components)
+        self.__load_group_component(user_components)
+        self.__load_ethics_component(user_components)
+        return user_components
+
     def __load_user_component(self, user_components: list):
         """Load user custom fields.
 
@@ -1,6 +1,9 @@
 # Custom imports
+import hmac
 from configuration.website import Settings as WS
-from flask import (render_template, redirect, url_for)
+from flask import (render_template, redirect, url_for, jsonify, make_response)
+from werkzeug.http import generate_etag
+from model.cache import SetupCache, FragmentCache
 
 
 class Request():
@@ -53,6 +56,20 @@ class Request():
             return False
         return True
 
+    def is_admin(self, request):
+        """Verify if the request carries the administration token (flask setting
+        ADMIN_TOKEN) as a bearer authorization header.
+
+        Returns:
+            bool: True for valid tokens. False when ADMIN_TOKEN isn't defined.
+        """
+        expected = self._app.config.get('ADMIN_TOKEN')
+        authorization = request.headers.get('Authorization', '')
+        if not expected or not authorization.startswith('Bearer '):
+            return False
+        return hmac.compare_digest(authorization[len('Bearer '):].encode(),
+                                   str(expected).encode())
+
     def _render_template(self, template: str, args: dict = None):
         """Render a HTML template using flask and Jinga2
 
@@ -64,6 +81,35 @@ class Request():
             return render_template(template, **self.get_layout_text())
         return render_template(template, **{**args, **self.get_layout_text()})
 
+    def render_cacheable_template(self, template: str, args: dict = None, status: int = 200):
+        """Render a HTML template that only depends on the setup data. The page is rendered
+        once per process and setup execution. The browser revalidates the page using its
+        ETag and Last-Modified date (website setup date), receiving a "304 Not Modified"
+        response when it didn't change.
+
+        Args:
+            template (str): View html template location
+            args (dict, optional): args used to render the template
+            status (int, optional): HTTP status code. Defaults to 200.
+        """
+        html, etag = FragmentCache.get(template, lambda: self.__render_with_etag(template, args))
+        response = make_response(html, status)
+        response.set_etag(etag)
+        response.last_modified = SetupCache.version
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+    def __render_with_etag(self, template: str, args: dict = None):
+        """Render a HTML template together with its entity tag
+
+        Returns:
+            str: Rendered template
+            str: Entity tag
+        """
+        html = self._render_template(template, args)
+        return html, generate_etag(html.encode())
+
     def _redirect(self, url: str, **values):
         """Redirect the web pase to a new location
 
@@ -74,3 +120,15 @@ class Request():
             Redirect the user to the provided URL
         """
         return redirect(url_for(url, **values))
+
+    def _jsonify(self, data: dict, status: int = 200):
+        """Serialize a response as JSON
+
+        Args:
+            data (dict): Response content
+            status (int, optional): HTTP status code. Defaults to 200.
+
+        Returns:
+            JSON response
+        """
+        return jsonify(data), status
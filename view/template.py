@@ -0,0 +1,30 @@
+"""Compilation and caching of the website Jinja templates"""
+import os
+from jinja2 import FileSystemBytecodeCache
+
+
+def configure_bytecode_cache(app):
+    """Store the compiled templates on disk (flask setting JINJA_BYTECODE_CACHE_LOCATION),
+    so new worker processes load them instead of compiling the templates again.
+
+    Args:
+        app (Flask): Flask application
+    """
+    location = app.config.get('JINJA_BYTECODE_CACHE_LOCATION')
+    if not location:
+        return
+
+    location = os.path.join(os.path.abspath(os.path.dirname(__file__)), '..', location)
+    os.makedirs(location, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(location)
+
+
+def compile_templates(app):
+    """Compile every website template. The compiled templates are kept in memory by the
+    Jinja environment and on disk by the bytecode cache (when configured).
+
+    Args:
+        app (Flask): Flask application
+    """
+    for template in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(template)
@@ -1,16 +1,26 @@
 """Initialize the website application"""
+import gzip
 import os
-from flask import Flask, render_template, current_app, session
+import time
+import click
+from flask import Flask, current_app, session, request
 from datetime import datetime as dt
 from datetime import timedelta
 from whitenoise import WhiteNoise
 # Custom libraries
 from configuration.flask import Settings as FlaskSettings
 from configuration.website import Settings as WS
-from model.connection import db
+from model.connection import db, shards, configure_engine
+from model.write_behind import write_behind
 from model.schema import WebsiteControl
+from model.cache import SetupCache, ItemCache, GroupCache, UserShard
+from model.coverage import Coverage
 from view.request import Request
+from view.template import configure_bytecode_cache, compile_templates
+from view.asset import assets
 import command
+from instrumentation import instrumentation
+from admission import admission
 import route
 
 
@@ -38,8 +48,14 @@ def create_app(test_config=None):
         os.makedirs(tmp_location)
         app.logger.info('Creating folder to store temporal files.')
 
+    # Share the compiled templates between processes
+    configure_bytecode_cache(app)
+
     # Register the database
     db.init_app(app)
+    configure_engine(app)
+    write_behind.init_app(app)
+    shards.init_app(app)
 
     # Register the custom Flask commands
     app.register_blueprint(command.blueprint)
@@ -47,29 +63,119 @@ def create_app(test_config=None):
     # Register the application views
     app.register_blueprint(route.blueprint)
 
+    # Register the request instrumentation (when enabled). It needs to be registered
+    # before any other request hook to measure the whole request.
+    instrumentation.init_app(app)
+
+    # Register the admission control of the write requests (when enabled). It runs before
+    # the other request hooks, so the rejected requests don't touch the database.
+    admission.init_app(app)
+
     # Register function executed before any request.
     app.before_request(__before_request)
 
+    # Register function executed after any request.
+    app.after_request(__after_request)
+
     # Register page errors
     app.register_error_handler(404, __page_not_found)
     app.register_error_handler(500, __page_unexpected_condition)
 
-    # Add the management for static libraries
-    WHITENOISE_MAX_AGE = 31536000 if not app.config["DEBUG"] else 0
+    # Add the management for static libraries. The hashed copies made by the assets
+    # build are cached forever. The original files are cached for STATIC_MAX_AGE seconds.
+    assets_location = assets.init_app(app)
+    WHITENOISE_MAX_AGE = app.config['STATIC_MAX_AGE'] if not app.config["DEBUG"] else 0
     app.wsgi_app = WhiteNoise(
         app.wsgi_app,
         root=os.path.join(os.path.dirname(__file__), "static"),
-        prefix="assets/",
+        prefix=assets.PREFIX,
         max_age=WHITENOISE_MAX_AGE,
+        immutable_file_test=assets.is_immutable,
     )
+    if os.path.exists(assets_location):
+        app.wsgi_app.add_files(assets_location, prefix=assets.PREFIX)
+
+    # Just the web server processes are warmed up. The commands (e.g. setup) have to run
+    # even when the current setup can't be loaded.
+    if app.config.get('WARMUP', False) and click.get_current_context(silent=True) is None:
+        __warmup(app)
 
     return app
 
 
+def __warmup(app):
+    """Load every immutable structure created by the website setup before the web workers
+    are forked (e.g. gunicorn --preload). The workers share these pages copy-on-write
+    instead of building their own copy on their first request. The warmup is skipped
+    when the setup can't be loaded; the first requests load it instead.
+
+    Args:
+        app (Flask): Flask application
+    """
+    with app.app_context():
+        try:
+            conf = WebsiteControl().get_conf()
+            if conf is None:
+                return
+
+            WS.set_configuration_location(app, conf.configuration_file)
+            WS.get_configuration(app)
+            SetupCache.validate(conf.setup_exec_date)
+            ItemCache.load()
+            GroupCache.load()
+            Coverage.load()
+
+            compile_templates(app)
+        except (Exception, SystemExit) as e:
+            # The configuration errors stop the execution (SystemExit)
+            app.logger.warning("Warmup skipped: %s" % str(e))
+        finally:
+            # The database connections can't be shared by forked processes.
+            db.engine.dispose()
+
+
 def __before_request():
     """Executes a series of procedures before every request."""
     __validate_app_integrity()
     __configure_user_session()
+    # Save the participant's judgements in the database of the participant's group
+    if 'user_id' in session:
+        UserShard.use(session['user_id'])
+
+
+def __after_request(response):
+    """Executes a series of procedures after every request."""
+    response = __compress_response(response)
+    # Answer "304 Not Modified" to the revalidation of cacheable pages
+    if response.status_code == 200 and response.get_etag()[0] is not None:
+        response.make_conditional(request)
+    return response
+
+
+def __compress_response(response):
+    """Compress the HTML and JSON responses with gzip when accepted by the browser.
+    The static files are precompressed by the assets build."""
+    app = current_app
+    if not app.config['COMPRESS_RESPONSES'] \
+            or response.status_code != 200 \
+            or response.direct_passthrough \
+            or response.mimetype not in ['text/html', 'application/json'] \
+            or 'gzip' not in request.headers.get('Accept-Encoding', '') \
+            or 'Content-Encoding' in response.headers:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < app.config['COMPRESS_MIN_SIZE']:
+        return response
+
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    # Each encoding needs its own entity tag
+    etag, weak = response.get_etag()
+    if etag is not None:
+        response.set_etag(etag + '-gzip', weak)
+    return response
 
 
 def __configure_user_session():
@@ -84,8 +190,15 @@ def __validate_app_integrity():
     """Stop the server execution if the configuration file was modified after the
     setup of the application was executed. The configuration file is used on the website
     execution during runtime. Modification on this files can cause unexpected results.
+    The check is made on every request, or every INTEGRITY_CHECK_SECONDS when defined, and
+    always after the setup data was dropped (e.g. a new setup executed by this process).
     """
     app = current_app
+    last_check = app.extensions.get('integrity_check')
+    if last_check is not None and SetupCache.version is not None \
+            and time.monotonic() - last_check < app.config['INTEGRITY_CHECK_SECONDS']:
+        return
+
     modification_date = None
     with app.app_context():
         try:
@@ -95,6 +208,8 @@ def __validate_app_integrity():
 
             WS.set_configuration_location(app, conf.configuration_file)
             setup_exec_date = conf.setup_exec_date
+            # Drop the cached setup data when the website was set up again.
+            SetupCache.validate(setup_exec_date)
 
             # Get the last modification date of the configuration file (UTC)
             modification_date = os.path.getmtime(WS.get_configuration_location(app))
@@ -115,17 +230,21 @@ def __validate_app_integrity():
             raise RuntimeError("Application unhealthy state. "
                                "Please contact the website administrator.")
 
+    app.extensions['integrity_check'] = time.monotonic()
+
 
 def __page_not_found(e):
     """Return 404 page"""
-    return render_template('404.html',
-                           **Request(current_app, session).get_layout_text()), 404
+    return Request(current_app, session).render_cacheable_template('404.html', status=404)
 
 
 def __page_unexpected_condition(e):
-    """Return 500 page"""
-    return render_template('500.html',
-                           **Request(current_app, session).get_layout_text()), 500
+    """Return 500 page. A plain message is returned if the page can't be rendered."""
+    try:
+        return Request(current_app, session).render_cacheable_template('500.html', status=500)
+    except Exception as render_error:
+        current_app.logger.critical(str(render_error))
+        return "Internal Server Error", 500
 
 
 # Make the application global available